@@ -0,0 +1,123 @@
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+from csv_tail import CSVTailReader
+
+
+def alerts_json(timestamps_ns, imsis, alert_types):
+    # Same records as DataFrame.to_json(orient='records'): epoch milliseconds, imsi (null for
+    # alerts recorded before the column existed) and alertType
+    return json.dumps([{'timestamp': int(ts) // 1_000_000, 'imsi': imsi or None, 'alertType': alert_type}
+                       for ts, imsi, alert_type in zip(timestamps_ns, imsis, alert_types)], separators=(',', ':'))
+
+
+class AlertIndex:
+    '''
+    Timestamp-sorted, in-memory index over a traffic_change_alerts_<id>.csv file.
+    Timestamps are kept as an int64 (ns since epoch) array next to arrays of IMSI and alert
+    type codes, all grown geometrically. Every query first ingests the rows appended to the
+    file since the previous one, then answers the range with two binary searches, so its
+    cost follows the size of the result rather than the size of the history.
+    '''
+
+    def __init__(self, path):
+        self._reader = CSVTailReader(path)
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._size = 0
+        self._timestamps = np.empty(1024, dtype=np.int64)
+        self._codes = np.empty(1024, dtype=np.int16)
+        self._imsi_codes = np.empty(1024, dtype=np.int32)
+        self._types = []
+        self._type_codes = {}
+        self._imsis = []
+        self._imsi_index = {}
+
+    def refresh(self):
+        reset, rows = self._reader.read_new(dtype=str, keep_default_na=False)
+        if reset:
+            self._clear()
+        if rows is None or rows.empty:
+            return
+
+        # The engine writes '%Y-%m-%d %H:%M:%S.%f UTC'; without the suffix the ISO8601 parser is vectorized
+        timestamps = pd.to_datetime(rows['timestamp'].str.removesuffix(' UTC'), format='ISO8601', utc=True, errors='coerce')
+        valid = timestamps.notna().to_numpy()
+        timestamps = timestamps[valid].dt.as_unit('ns').astype('int64').to_numpy()
+        # Alert types and IMSIs are stored as integer codes, factorized per chunk; files
+        # written before the imsi column existed get an empty IMSI
+        codes = self._encode(rows['alertType'][valid], self._types, self._type_codes, np.int16)
+        imsis = rows['imsi'][valid] if 'imsi' in rows else pd.Series('', index=rows.index[valid])
+        imsi_codes = self._encode(imsis, self._imsis, self._imsi_index, np.int32)
+        self._append(timestamps, codes, imsi_codes)
+
+    @staticmethod
+    def _encode(values, known, index, dtype):
+        chunk_codes, chunk_values = pd.factorize(values)
+        mapping = np.empty(len(chunk_values), dtype=dtype)
+        for i, value in enumerate(chunk_values):
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(known)
+                known.append(value)
+            mapping[i] = code
+        return mapping[chunk_codes] if len(mapping) else chunk_codes.astype(dtype)
+
+    def _append(self, timestamps, codes, imsi_codes):
+        n = len(timestamps)
+        if n == 0:
+            return
+        if self._size + n > len(self._timestamps):
+            capacity = max(2 * len(self._timestamps), self._size + n)
+            self._timestamps = np.resize(self._timestamps, capacity)
+            self._codes = np.resize(self._codes, capacity)
+            self._imsi_codes = np.resize(self._imsi_codes, capacity)
+
+        # Rows are normally appended in time order; anything else is merged in with a stable sort
+        in_order = (n == 1 or np.all(timestamps[1:] >= timestamps[:-1])) and \
+            (self._size == 0 or timestamps[0] >= self._timestamps[self._size - 1])
+        self._timestamps[self._size:self._size + n] = timestamps
+        self._codes[self._size:self._size + n] = codes
+        self._imsi_codes[self._size:self._size + n] = imsi_codes
+        self._size += n
+        if not in_order:
+            order = np.argsort(self._timestamps[:self._size], kind='stable')
+            self._timestamps[:self._size] = self._timestamps[:self._size][order]
+            self._codes[:self._size] = self._codes[:self._size][order]
+            self._imsi_codes[:self._size] = self._imsi_codes[:self._size][order]
+
+    def query(self, start, stop):
+        # Alerts with start <= timestamp <= stop, both ends as timezone-aware datetimes
+        start_ns = pd.Timestamp(start).as_unit('ns').value
+        stop_ns = pd.Timestamp(stop).as_unit('ns').value
+        with self._lock:
+            self.refresh()
+            timestamps = self._timestamps[:self._size]
+            lo = np.searchsorted(timestamps, start_ns, side='left')
+            hi = np.searchsorted(timestamps, stop_ns, side='right')
+            timestamps = timestamps[lo:hi].copy()
+            codes = self._codes[lo:hi].copy()
+            imsi_codes = self._imsi_codes[lo:hi].copy()
+            types = list(self._types)
+            imsis = list(self._imsis)
+        return timestamps, [imsis[code] for code in imsi_codes], [types[code] for code in codes]
+
+    def query_json(self, start, stop):
+        return alerts_json(*self.query(start, stop))
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_alert_index(path):
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = AlertIndex(path)
+        return index
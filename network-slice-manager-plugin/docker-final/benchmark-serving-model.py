@@ -0,0 +1,63 @@
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import load
+
+from serving_model import DEFAULT_TREES, ServingModel, compile_ensemble
+
+features = ['URLLC_Sent_thrp_Mbps', 'URLLC_BytesSent', 'URLLC_BytesReceived', 'URLLC_Received_thrp_Mbps']
+
+
+def timed(func, repeat):
+    func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return np.percentile(times, 50), np.percentile(times, 95)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare the compiled serving model against the sklearn ensemble')
+    parser.add_argument('--model', default='traffic_model.joblib')
+    parser.add_argument('--scaler', default='scaler.joblib')
+    parser.add_argument('--compiled', default='traffic_model.npz',
+                        help='compiled model to check, exported from --model first if the file does not exist')
+    parser.add_argument('--trees', type=int, default=DEFAULT_TREES, help='trees kept when exporting')
+    parser.add_argument('--datasets', default='../src/datasets/CPE_*.csv', help='CSV files the predictions are compared on')
+    parser.add_argument('--batch', type=int, default=49, help='rows per predict call in the latency runs')
+    parser.add_argument('--repeat', type=int, default=50, help='predict calls per latency run')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    ensemble = load(args.model, mmap_mode='c')
+    scaler = load(args.scaler)
+    print(f"sklearn ensemble loaded in {time.perf_counter() - start:.2f}s")
+
+    if not os.path.exists(args.compiled):
+        compile_ensemble(ensemble, scaler, args.trees).save(args.compiled)
+        print(f"Exported {args.compiled} with {args.trees} trees")
+    start = time.perf_counter()
+    compiled = ServingModel.load(args.compiled)
+    print(f"compiled model ({compiled.n_trees} trees) loaded in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    X = pd.concat([pd.read_csv(path)[features] for path in sorted(glob.glob(args.datasets))], ignore_index=True)
+    expected = ensemble.predict(scaler.transform(X))
+    expected_proba = ensemble.predict_proba(scaler.transform(X))
+    predicted = compiled.predict(X)
+    print(f"Agreement on {len(X)} rows: {(predicted == expected).mean():.5f}, "
+          f"max probability difference: {np.abs(compiled.predict_proba(X) - expected_proba).max():.5f}")
+    for label in compiled.classes_:
+        rows = expected == label
+        print(f"  {label}: {(predicted[rows] == label).mean():.5f} of {rows.sum()} rows")
+
+    batch = X.sample(min(args.batch, len(X)), random_state=0)
+    for name, predict in (('sklearn', lambda: ensemble.predict(scaler.transform(batch))),
+                          ('compiled', lambda: compiled.predict(batch))):
+        p50, p95 = timed(predict, args.repeat)
+        print(f"{name:>8}: {len(batch)} rows per call, p50 {p50:.2f}ms, p95 {p95:.2f}ms")
@@ -0,0 +1,82 @@
+import argparse
+import importlib.util
+import time
+
+# Load cumucore-api-engine.py as a module (its file name is not importable)
+spec = importlib.util.spec_from_file_location('cumucore', 'cumucore-api-engine.py')
+cumucore = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(cumucore)
+
+API = cumucore.API_PREFIX
+KEY = '000102030405060708090A0B0C0D0E0F'
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {elapsed:.2f}s")
+    return result
+
+
+def bulk_load(imsis, group_count, chunk=10000):
+    # The same steps as an import job, one write per chunk of CSV rows
+    for start in range(0, len(imsis), chunk):
+        cumucore._insert_imported([{'imsi': imsi, 'k': KEY, 'opc': KEY, 'groupName': f'group{n % group_count + 1}'}
+                                   for n, imsi in enumerate(imsis[start:start + chunk], start)])
+
+
+def per_request_us(func, repeat=200):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def page_costs(client, total):
+    # by-batch slices and cursor pages near the start and the end of the table
+    batch = f'{API}/cnc-subscriber-management/by-batch'
+    listing = f'{API}/cnc-subscriber-management'
+    near_end = client.get(listing, query_string={'limit': 100, 'order': -1}).get_json()['next_cursor']
+    for label, url, query in (
+            ('by-batch, first 100', batch, {'start': 0, 'end': 100}),
+            ('by-batch, last 100', batch, {'start': total - 100, 'end': total}),
+            ('cursor page of 100, first page', listing, {'limit': 100}),
+            ('cursor page of 100, near the end', listing, {'cursor': near_end, 'limit': 100})):
+        print(f"{label}: {per_request_us(lambda: client.get(url, query_string=query)):.0f}us per request")
+
+
+def bulk_delete(client, imsis, chunk):
+    deleted = 0
+    for start in range(0, len(imsis), chunk):
+        ids = ','.join(imsis[start:start + chunk])
+        deleted += client.delete(f'{API}/cnc-multisubscriber-management/delete', query_string={'ids': ids}).get_json()['deleted']
+    return deleted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Bulk-load, page through and delete subscribers in the CNC mock')
+    parser.add_argument('--subscribers', type=int, default=1_000_000)
+    parser.add_argument('--groups', type=int, default=4)
+    parser.add_argument('--chunk', type=int, default=1000, help='IMSIs per bulk delete request')
+    parser.add_argument('--single-deletes', type=int, default=10000, help='subscribers deleted one request at a time')
+    args = parser.parse_args()
+
+    client = cumucore.app.test_client()
+    imsis = [f'99999{n:010d}' for n in range(2, args.subscribers + 2)]
+
+    timed(f"Loaded {len(imsis)} subscribers", lambda: bulk_load(imsis, args.groups))
+    page_costs(client, len(cumucore.state.snapshot().subscribers))
+
+    singles, rest = imsis[:args.single_deletes], imsis[args.single_deletes:]
+    start = time.perf_counter()
+    for imsi in singles:
+        client.delete(f'{API}/cnc-subscriber-management/{imsi}')
+    print(f"Deleted {len(singles)} subscribers one by one: {(time.perf_counter() - start) / max(len(singles), 1) * 1e6:.0f}us per request")
+
+    deleted = timed(f"Deleted {len(rest)} subscribers in chunks of {args.chunk}", lambda: bulk_delete(client, rest, args.chunk))
+    assert deleted == len(rest), deleted
+    snap = cumucore.state.snapshot()
+    leftover = len(snap.subscribers) + sum(len(members) for members in snap.groups.values())
+    assert list(snap.subscribers) == ['999991000000001'] and leftover == 2, leftover
+    print("Indexes are back to the seed subscriber")
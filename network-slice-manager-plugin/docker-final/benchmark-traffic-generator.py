@@ -0,0 +1,42 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import load
+
+from traffic_generator import TrafficGenerator
+
+features = ['URLLC_Sent_thrp_Mbps', 'URLLC_BytesSent', 'URLLC_BytesReceived', 'URLLC_Received_thrp_Mbps']
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure the traffic generator and check it against the classifier')
+    parser.add_argument('--ues', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--window', type=float, default=5.0, help='report window in seconds')
+    parser.add_argument('--model', default='traffic_model.joblib')
+    parser.add_argument('--scaler', default='scaler.joblib')
+    args = parser.parse_args()
+
+    generator = TrafficGenerator(seed=args.seed)
+    imsis = [str(999991000000000 + i) for i in range(args.ues)]
+    end = time.time()
+
+    started = time.perf_counter()
+    report = generator.window(imsis, end - args.window, end)
+    elapsed = time.perf_counter() - started
+    print(f"{args.ues} UEs, {args.window:g}s window: {elapsed * 1000:.1f}ms ({args.ues / elapsed:,.0f} UEs/s)")
+
+    again = generator.window(imsis, end - args.window, end)
+    halves = [generator.window(imsis, end - args.window, end - args.window / 2),
+              generator.window(imsis, end - args.window / 2, end)]
+    split = halves[0]['URLLC_BytesReceived'] + halves[1]['URLLC_BytesReceived']
+    print(f"Repeatable: {all((again[f] == report[f]).all() for f in features)}, "
+          f"largest split-window byte difference: {np.abs(split - report['URLLC_BytesReceived']).max()}")
+
+    profiles = generator.profiles(imsis)
+    ensemble, scaler = load(args.model), load(args.scaler)
+    predicted = ensemble.predict(scaler.transform(pd.DataFrame({f: report[f] for f in features})))
+    print("Classifier predictions per generated profile:")
+    print(pd.crosstab(pd.Series(profiles, name='profile'), pd.Series(predicted, name='predicted')))
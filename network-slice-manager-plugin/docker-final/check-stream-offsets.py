@@ -0,0 +1,86 @@
+import importlib.util
+import threading
+import time
+
+from monitoring_stream import LocalBroker, samples_message
+
+# Load decision-engine-1.py as a module (its file name is not importable); like the engine,
+# this needs the trained traffic_model.joblib in the working directory
+spec = importlib.util.spec_from_file_location('engine', 'decision-engine-1.py')
+engine = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(engine)
+
+TOPIC = 'check-stream-offsets'
+IMSI = '999991000000001'
+STEPS = 12
+
+failures = []
+
+
+def fail(message):
+    failures.append(message)
+    print(f"FAILED: {message}")
+
+
+def message(n):
+    timestamp = f'2024-01-01T00:{n // 12:02d}:{n % 12 * 5:02d}+00:00'
+    columns = {'imsi': [IMSI], 'timestamp': [timestamp], **{feature: [0.0] for feature in engine.features}}
+    return samples_message(timestamp, engine.MONITORING_STEP, columns)
+
+
+def check(name, failing_attempts):
+    '''
+    Runs the stream engine on a broker that lets the producer run only a few messages ahead
+    of the committed offset, with the actions of step 3 failing failing_attempts times. Every
+    message has to be committed all the same, or the producer stalls.
+    '''
+    broker = LocalBroker(max_lag=4)
+    source = broker.consumer(TOPIC, 'decision-engine')
+    attempts, acted = {}, []
+
+    def decide(testbed, data, y_test_pred):
+        return [[('PUT', data['timestamp'].iloc[0], None)]]
+
+    def run_actions(phases):
+        step = phases[0][0][1]
+        attempts[step] = attempts.get(step, 0) + 1
+        if step == message(3)['timestamp'] and attempts[step] <= failing_attempts:
+            raise ConnectionError('testbed unreachable')
+        acted.append(step)
+
+    engine.classify = lambda data: None
+    engine.decide = decide
+    engine.run_actions = run_actions
+    skipped = engine.scheduler_stats['skipped_steps']
+    threading.Thread(target=engine.run_stream, args=(None, source), daemon=True).start()
+
+    try:
+        for n in range(STEPS):
+            broker.produce(TOPIC, message(n), timeout=5)
+    except Exception as e:
+        return fail(f"{name}: producer stalled after {n} messages: {e}")
+    deadline = time.time() + 5
+    while broker.consumer(TOPIC, 'decision-engine').position < STEPS and time.time() < deadline:
+        time.sleep(0.01)
+
+    committed = broker.consumer(TOPIC, 'decision-engine').position
+    failed = min(failing_attempts, engine.STREAM_STEP_ATTEMPTS) == engine.STREAM_STEP_ATTEMPTS
+    expected = [message(n)['timestamp'] for n in range(STEPS) if not (failed and n == 3)]
+    if committed != STEPS:
+        fail(f"{name}: {committed} of {STEPS} messages committed")
+    if acted != expected:
+        fail(f"{name}: acted on {len(acted)} steps, expected {len(expected)}")
+    if engine.scheduler_stats['skipped_steps'] - skipped != int(failed):
+        fail(f"{name}: {engine.scheduler_stats['skipped_steps'] - skipped} steps skipped")
+    print(f"{name}: {committed} of {STEPS} messages committed, {len(acted)} steps acted upon")
+
+
+if __name__ == "__main__":
+    engine.monitored_imsis = lambda testbed: [IMSI]
+    engine.report_stats = lambda tick: None
+    engine.STREAM_RETRY_DELAY = 0.01
+    check('step failing once', 1)
+    check('step failing every attempt', engine.STREAM_STEP_ATTEMPTS)
+    if failures:
+        raise SystemExit(f"{len(failures)} failures")
+    print("Offsets committed past every failed step")
@@ -0,0 +1,143 @@
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Upper bounds (ms) of the latency histogram buckets, anything slower lands in the last '+Inf' bucket
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Path segments that identify a single resource (IMSIs, numeric ids) are collapsed in endpoint names
+_ID_SEGMENT = re.compile(r'^\d+$')
+
+
+class LatencyHistogram:
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * (len(buckets_ms) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, elapsed_ms, error=False):
+        index = len(self.buckets_ms)
+        for i, bound in enumerate(self.buckets_ms):
+            if elapsed_ms <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if error:
+            self.errors += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th quantile
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets_ms, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return float(bound)
+        return self.max_ms
+
+    def to_dict(self):
+        buckets = {f'le_{bound}ms': count for bound, count in zip(self.buckets_ms, self.counts)}
+        buckets['le_inf'] = self.counts[-1]
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'mean_ms': self.total_ms / self.count if self.count else 0.0,
+            'p50_ms': self.quantile(0.5),
+            'p99_ms': self.quantile(0.99),
+            'max_ms': self.max_ms,
+            'buckets': buckets,
+        }
+
+
+class CNCClient:
+    '''
+    Keep-alive, connection-pooled client for the CNC API shared by every caller in a process.
+    Timeouts can be set per endpoint, where an endpoint is "<METHOD> <path>" with IMSI/id
+    segments replaced by '<id>', e.g. "PUT /api/v1.0/cnc-subscriber-management/<id>".
+    '''
+
+    def __init__(self, base_url='http://127.0.0.1:3000', pool_size=32, retries=3, backoff_factor=0.2,
+                 default_timeout=5, timeouts=None):
+        self.base_url = base_url.rstrip('/')
+        self.default_timeout = default_timeout
+        self.timeouts = dict(timeouts or {})
+
+        # Connection errors are retried for every method, 5xx answers only for idempotent ones
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff_factor, status_forcelist=(502, 503, 504),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json'})
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def endpoint(self, method, url):
+        path = urlsplit(url).path
+        segments = ['<id>' if _ID_SEGMENT.match(segment) else segment for segment in path.split('/')]
+        return f"{method.upper()} {'/'.join(segments)}"
+
+    def request(self, method, url, **kwargs):
+        if not url.startswith(('http://', 'https://')):
+            url = self.base_url + url
+        endpoint = self.endpoint(method, url)
+        kwargs.setdefault('timeout', self.timeouts.get(endpoint, self.default_timeout))
+
+        started = time.perf_counter()
+        error = True
+        try:
+            response = self.session.request(method, url, **kwargs)
+            error = response.status_code >= 500
+            return response
+        finally:
+            self._observe(endpoint, (time.perf_counter() - started) * 1000, error)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def _observe(self, endpoint, elapsed_ms, error):
+        with self._lock:
+            histogram = self._histograms.get(endpoint)
+            if histogram is None:
+                histogram = self._histograms[endpoint] = LatencyHistogram()
+            histogram.observe(elapsed_ms, error)
+
+    def latency_report(self):
+        with self._lock:
+            return {endpoint: histogram.to_dict() for endpoint, histogram in self._histograms.items()}
+
+    def format_latency_report(self):
+        lines = []
+        for endpoint, stats in sorted(self.latency_report().items()):
+            lines.append(f"{endpoint}: n={stats['count']} err={stats['errors']} mean={stats['mean_ms']:.1f}ms "
+                         f"p50<={stats['p50_ms']:.0f}ms p99<={stats['p99_ms']:.0f}ms max={stats['max_ms']:.1f}ms")
+        return '\n'.join(lines)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,169 @@
+import glob
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+# Records appended since the last snapshot after which the next commit takes a new one
+SNAPSHOT_EVERY = 100000
+
+# Every log record and the snapshot body are framed as (length, crc32) + pickle
+_FRAME = struct.Struct('<II')
+SNAPSHOT_MAGIC = b'CNCSNAP1'
+
+
+def _frame(payload):
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_frame(f):
+    # The next payload, or None at the end of the file or at a torn/corrupt frame
+    header = f.read(_FRAME.size)
+    if len(header) < _FRAME.size:
+        return None
+    length, crc = _FRAME.unpack(header)
+    payload = f.read(length)
+    if len(payload) < length or zlib.crc32(payload) != crc:
+        return None
+    return payload
+
+
+def _generation(path):
+    return int(os.path.basename(path).split('-')[1].split('.')[0])
+
+
+class StateLog:
+    '''
+    Append-only write-ahead log with periodic snapshots, kept in directory as
+    snapshot-<gen>.bin (the full state when wal-<gen>.log was started) and
+    wal-<gen>.log (the records appended since). Records are buffered by append and
+    written by commit, which flushes once for a whole request (and fsyncs with
+    fsync=True). After snapshot_every records, commit captures the state with capture()
+    and starts a new log generation under the lock, then writes the snapshot in the
+    background; older files are removed once the new snapshot is in place, so a crash
+    at any point leaves a snapshot plus every log written after it.
+
+    Callers apply a change and append its record while holding lock (the writer lock of
+    the state, when passed), so a snapshot never includes a change missing from the log or
+    the other way round.
+    '''
+
+    def __init__(self, directory, capture, snapshot_every=SNAPSHOT_EVERY, fsync=False, lock=None):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.lock = lock if lock is not None else threading.RLock()
+        self._capture = capture
+        self._buffer = []
+        self._since_snapshot = 0
+        self._generation = 0
+        self._file = None
+        self._snapshot_thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def recover(self):
+        '''
+        Reads the newest snapshot and the records logged after it, and opens the log for
+        appending. Returns (state or None, records). A torn last record, left by a crash
+        in the middle of an append, is dropped and truncated away.
+        '''
+        state, start = None, 0
+        snapshots = sorted(glob.glob(os.path.join(self.directory, 'snapshot-*.bin')), key=_generation)
+        if snapshots:
+            start = _generation(snapshots[-1])
+            state = self._read_snapshot(snapshots[-1])
+
+        records = []
+        logs = [path for path in glob.glob(os.path.join(self.directory, 'wal-*.log')) if _generation(path) >= start]
+        for path in sorted(logs, key=_generation):
+            with open(path, 'rb') as f:
+                valid_end = 0
+                while True:
+                    payload = _read_frame(f)
+                    if payload is None:
+                        break
+                    records.append(pickle.loads(payload))
+                    valid_end = f.tell()
+            if valid_end < os.path.getsize(path):
+                print(f"Truncating {path} after a torn record at byte {valid_end}")
+                os.truncate(path, valid_end)
+            self._generation = max(self._generation, _generation(path))
+
+        self._generation = max(self._generation, start)
+        self._since_snapshot = len(records)
+        self._file = open(self._path('wal', self._generation), 'ab')
+        return state, records
+
+    def append(self, record):
+        self._buffer.append(_frame(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def commit(self):
+        with self.lock:
+            self._write_buffer()
+            due = self._since_snapshot >= self.snapshot_every
+        if due:
+            self.snapshot()
+
+    def snapshot(self, wait=False):
+        # Starts a snapshot unless one is already being written
+        with self.lock:
+            if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+                return
+            self._write_buffer()
+            state = self._capture()
+            self._file.close()
+            self._generation += 1
+            self._file = open(self._path('wal', self._generation), 'ab')
+            self._since_snapshot = 0
+            self._snapshot_thread = threading.Thread(target=self._write_snapshot, args=(state, self._generation),
+                                                     name='cnc-snapshot', daemon=True)
+            self._snapshot_thread.start()
+        if wait:
+            self._snapshot_thread.join()
+
+    def close(self):
+        if self._file is None:
+            return
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+        with self.lock:
+            self._write_buffer()
+            self._file.close()
+            self._file = None
+
+    def _write_buffer(self):
+        if self._buffer:
+            self._file.write(b''.join(self._buffer))
+            self._since_snapshot += len(self._buffer)
+            self._buffer = []
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def _write_snapshot(self, state, generation):
+        started = time.perf_counter()
+        path = self._path('snapshot', generation)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(_frame(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        for old in glob.glob(os.path.join(self.directory, 'snapshot-*.bin')) + \
+                glob.glob(os.path.join(self.directory, 'wal-*.log')):
+            if _generation(old) < generation:
+                os.remove(old)
+        print(f"Wrote state snapshot {os.path.basename(path)} in {time.perf_counter() - started:.2f}s")
+
+    def _read_snapshot(self, path):
+        with open(path, 'rb') as f:
+            payload = _read_frame(f) if f.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC else None
+        if payload is None:
+            raise RuntimeError(f"State snapshot {path} is corrupt")
+        return pickle.loads(payload)
+
+    def _path(self, kind, generation):
+        return os.path.join(self.directory, f'{kind}-{generation:08d}.{"bin" if kind == "snapshot" else "log"}')
@@ -0,0 +1,204 @@
+import threading
+from operator import itemgetter
+
+from cow_map import CowMap, MapWriter
+from ordered_index import OrderedIndex, OrderedView
+
+
+class Snapshot:
+    '''
+    One version of the CNC state. Never changes once published, so a reader can use it for
+    as long as it likes, without locks, and always sees the tables consistent with each
+    other. subscribers is an OrderedView from IMSI to record in insertion order (paged with
+    its page() and slice()), groups maps a group name to a CowMap from member IMSI to the
+    sequence number it joined with.
+    '''
+
+    __slots__ = ('slice_instances', 'subscription_profiles', 'subscribers', 'groups', 'import_offsets')
+
+    def __init__(self, slice_instances, subscription_profiles, subscribers, groups, import_offsets):
+        self.slice_instances = slice_instances
+        self.subscription_profiles = subscription_profiles
+        self.subscribers = subscribers
+        self.groups = groups
+        self.import_offsets = import_offsets
+
+    def members(self, gname):
+        # IMSIs of a group in the order they joined it
+        return [imsi for imsi, _ in sorted(self.groups[gname].items(), key=itemgetter(1))]
+
+
+class Transaction:
+    '''
+    The changes of one CNCState.write(), made through the methods below and read through
+    the same attributes as a Snapshot. Only the thread holding the writer lock uses it.
+    Subscriber changes keep subscribers, groups and the state's subscriber_groups in step
+    with each other.
+    '''
+
+    def __init__(self, state):
+        base = state._current
+        self._state = state
+        self.slice_instances = dict(base.slice_instances)
+        self.subscription_profiles = dict(base.subscription_profiles)
+        self.import_offsets = dict(base.import_offsets)
+        self.subscribers = state.subscribers
+        self.groups = dict(base.groups)
+        # Writers of the groups changed so far, by name
+        self._writers = {}
+
+    def ensure_group(self, gname):
+        if gname not in self.groups:
+            self.groups[gname] = CowMap()
+
+    def replace_groups(self, groups):
+        self.groups = dict(groups)
+        self._writers = {}
+
+    def add_subscribers(self, records):
+        # Stores new subscribers at the end of the insertion order, in the group named by their groupName
+        self.subscribers.extend([record["imsi"] for record in records], records)
+        joining = {}
+        for record in records:
+            if record.get("groupName"):
+                joining.setdefault(record["groupName"], []).append(record["imsi"])
+        for gname, imsis in joining.items():
+            self.add_to_group(imsis, gname)
+
+    def replace_subscriber(self, imsi, record):
+        # The record replaces the stored one; a new groupName adds the subscriber to that group too
+        self.subscribers[imsi] = record
+        if record.get("groupName"):
+            self.add_to_group((imsi,), record["groupName"])
+
+    def add_to_group(self, imsis, gname):
+        # Members join in the order given; those already in the group keep their place
+        state = self._state
+        members = self._writers.get(gname) or self._group_writer(gname)
+        start = state.next_join
+        state.next_join += len(imsis)
+        for i in members.insert_new(imsis, range(start, state.next_join)):
+            state.subscriber_groups[imsis[i]] = state.groups_of(imsis[i]) + (gname,)
+
+    def remove_subscribers(self, imsis):
+        state = self._state
+        for imsi in imsis:
+            for gname in state.groups_of(imsi):
+                (self._writers.get(gname) or self._group_writer(gname)).pop(imsi)
+            state.forget_groups(imsi)
+        self.subscribers.discard_many(imsis)
+
+    def freeze(self):
+        groups = {gname: members.freeze() if isinstance(members, MapWriter) else members
+                  for gname, members in self.groups.items()}
+        return Snapshot(self.slice_instances, self.subscription_profiles, self.subscribers.view(), groups,
+                        self.import_offsets)
+
+    def _group_writer(self, gname):
+        members = self.groups.get(gname)
+        if not isinstance(members, MapWriter):
+            members = self.groups[gname] = (members if members is not None else CowMap()).writer()
+        self._writers[gname] = members
+        return members
+
+
+class CNCState:
+    '''
+    The tables of the CNC mock. Writers run one at a time under lock, inside write(), and
+    every write publishes a new immutable Snapshot when it ends; snapshot() returns the
+    latest one without taking any lock, so readers never wait for writers and writers never
+    wait for readers. The big tables are copy-on-write (OrderedIndex views, CowMap), so
+    publishing costs a fraction of their size, shared by all the changes of the write.
+    subscriber_groups (IMSI to the tuple of its groups) is only read by writers, through
+    groups_of(): after a restore it only holds the IMSIs whose groups changed since, the
+    others are still in the groups they were restored in.
+    '''
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.subscribers = OrderedIndex()
+        self.subscriber_groups = {}
+        self.restored_groups = {}
+        self.next_join = 0
+        self._tx = None
+        self._depth = 0
+        self._current = Snapshot({}, {}, self.subscribers.view(), {}, {})
+
+    def snapshot(self):
+        return self._current
+
+    def groups_of(self, imsi):
+        gnames = self.subscriber_groups.get(imsi)
+        if gnames is None:
+            gnames = tuple(gname for gname, members in self.restored_groups.items() if imsi in members)
+        return gnames
+
+    def forget_groups(self, imsi):
+        # After the IMSI left all its groups; an empty entry hides the groups it was restored in
+        if any(imsi in members for members in self.restored_groups.values()):
+            self.subscriber_groups[imsi] = ()
+        else:
+            self.subscriber_groups.pop(imsi, None)
+
+    def write(self):
+        # Used as `with state.write() as tx:`. Nested writes of the same thread join the outer
+        # one, which publishes all their changes
+        return self
+
+    def __enter__(self):
+        self.lock.acquire()
+        if self._tx is None:
+            self._tx = Transaction(self)
+        self._depth += 1
+        return self._tx
+
+    def __exit__(self, *exc_info):
+        try:
+            self._depth -= 1
+            if self._depth == 0:
+                tx, self._tx = self._tx, None
+                self._current = tx.freeze()
+        finally:
+            self.lock.release()
+
+    def capture(self):
+        '''
+        The latest snapshot's tables, for a state snapshot on disk. Called under lock
+        outside of any write, so no change is missing; the tables are immutable, so they
+        can be pickled later without holding the lock.
+        '''
+        snap = self._current
+        return {
+            "slice_instances": snap.slice_instances,
+            "subscription_profiles": snap.subscription_profiles,
+            "subscribers": snap.subscribers,
+            "next_seq": self.subscribers._next_seq,
+            "groups": snap.groups,
+            "next_join": self.next_join,
+            "import_offsets": snap.import_offsets,
+        }
+
+    def restore(self, state):
+        # Replaces the tables with those of capture(), or of the plain dicts and lists older versions stored
+        with self.write() as tx:
+            tx.slice_instances = dict(state["slice_instances"])
+            tx.subscription_profiles = dict(state["subscription_profiles"])
+            tx.import_offsets = dict(state["import_offsets"])
+            subscribers = state["subscribers"]
+            if isinstance(subscribers, OrderedView):
+                self.subscribers.load_view(subscribers, state["next_seq"])
+            else:
+                keys, seqs, next_seq = state["insertion_order"]
+                self.subscribers.load_state(keys, seqs, next_seq, [subscribers[imsi] for imsi in keys])
+
+            self.next_join = state.get("next_join", 0)
+            groups = {}
+            for gname, members in state["groups"].items():
+                if not isinstance(members, CowMap):
+                    members = CowMap(zip(members, range(self.next_join, self.next_join + len(members))))
+                    self.next_join += len(members)
+                groups[gname] = members
+            # Looked up by groups_of() rather than inverted into subscriber_groups up front
+            self.subscriber_groups = {}
+            self.restored_groups = groups
+            tx.replace_groups(groups)
@@ -0,0 +1,252 @@
+from itertools import chain, repeat
+from operator import contains, itemgetter
+
+import numpy as np
+
+# Column-wise forms of the CNC tables, as stored in state snapshots. They load as a handful of
+# arrays instead of a Python object (or dict entry) per subscriber, and are read in place: a
+# lookup is a binary search, a record is built when it is read.
+
+_MISSING = object()
+
+# Values of a column sampled to tell whether it repeats enough to be stored as codes
+DISTINCT_SAMPLE = 1024
+
+
+def _all_text(strings):
+    return set(map(type, strings)) <= {str}
+
+
+def text_array(strings):
+    # Byte strings when all are ASCII (a quarter of the size of unicode), None for strings a
+    # fixed-width array would not give back as stored (it drops trailing NULs)
+    if not _all_text(strings):
+        return None
+    text = ''.join(strings)
+    if '\x00' in text:
+        return None
+    if not text.isascii():
+        return np.array(strings, dtype='U')
+    widths = set(map(len, strings))
+    if len(widths) == 1 and 0 not in widths:
+        # Equal lengths (IMSIs, keys): the joined text already is the array's buffer
+        return np.frombuffer(text.encode('ascii'), dtype=f'S{widths.pop()}')
+    return np.array(strings, dtype='S') if strings else np.array([], dtype='S1')
+
+
+def python_values(values):
+    # A column's values as a list of plain Python objects
+    if isinstance(values, np.ndarray):
+        return (values.astype('U') if values.dtype.kind == 'S' else values).tolist()
+    return list(values)
+
+
+def text_list(strings):
+    # The strings as one newline-separated text, which splits back into a list much faster
+    # than a pickled list of strings loads; None when a string holds a newline
+    if not _all_text(strings):
+        return None
+    text = '\n'.join(strings)
+    return text if text.count('\n') == max(len(strings) - 1, 0) else None
+
+
+def split_text_list(text, length):
+    return text.split('\n') if length else []
+
+
+class ArrayMap:
+    '''
+    Read-only mapping from strings to integers over a sorted array of keys and the array of
+    their values. A lookup is a binary search of a few microseconds; the base of a CowMap
+    restored from a snapshot, which copies it into a dict only once its changes outgrow it.
+    '''
+
+    __slots__ = ('_keys', '_values')
+
+    def __init__(self, keys, values):
+        self._keys = keys
+        self._values = values
+
+    @classmethod
+    def from_items(cls, keys, values):
+        # From distinct keys and their values; None unless all keys are strings and all values integers
+        if not set(map(type, values)) <= {int}:
+            return None
+        keys = text_array(keys)
+        if keys is None:
+            return None
+        try:
+            values = np.array(values, dtype=np.int64)
+        except OverflowError:
+            return None
+        order = np.argsort(keys, kind='stable')
+        return cls(keys[order], values[order])
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key, default=None):
+        if type(key) is not str:
+            return default
+        if self._keys.dtype.kind == 'S':
+            try:
+                key = key.encode('ascii')
+            except UnicodeEncodeError:
+                return default
+        i = int(self._keys.searchsorted(key))
+        if i < len(self._keys) and self._keys[i] == key:
+            return int(self._values[i])
+        return default
+
+    def items(self):
+        return zip(python_values(self._keys), self._values.tolist())
+
+    def copy(self):
+        return dict(self.items())
+
+
+class RecordColumns:
+    '''
+    Read-only sequence of dict records stored column-wise: text fields as string arrays (or,
+    when few values repeat across the records, as codes into an array of those values),
+    others as tuples of their values, with a mask where a field is missing from some records.
+    A record is built when it is read; slicing gives a tuple of records.
+    '''
+
+    __slots__ = ('_columns', '_start', '_stop')
+
+    def __init__(self, columns, start=0, stop=None):
+        # columns: (field, values or codes, distinct values or None, present mask or None), in
+        # the order fields first appear
+        self._columns = columns
+        self._start = start
+        self._stop = stop if stop is not None else (len(columns[0][1]) if columns else 0)
+
+    @classmethod
+    def from_records(cls, records):
+        # None unless every value is a dict
+        if set(map(type, records)) - {dict}:
+            return None
+        fields = dict.fromkeys(chain.from_iterable(records))
+        # Every record has every field when all have as many as there are
+        uniform = set(map(len, records)) <= {len(fields)}
+        columns = []
+        for field in fields:
+            present = None
+            if uniform:
+                values = list(map(itemgetter(field), records))
+            else:
+                values = list(map(dict.get, records, repeat(field), repeat('')))
+                present = np.fromiter(map(contains, records, repeat(field)), dtype=bool, count=len(records))
+            columns.append(_encode(field, values, present))
+        return cls(tuple(columns), 0, len(records))
+
+    @classmethod
+    def concat(cls, parts):
+        '''
+        One RecordColumns of the records of parts, in order: RecordColumns, whose columns are
+        copied as arrays, or sequences of dict records. None unless all records are dicts.
+        '''
+        runs, plain = [], []
+        for part in parts:
+            if isinstance(part, RecordColumns):
+                if plain:
+                    runs.append(cls.from_records(plain))
+                    plain = []
+                runs.append(part)
+            else:
+                plain.extend(part)
+        if plain or not runs:
+            runs.append(cls.from_records(plain))
+        if any(run is None for run in runs):
+            return None
+        if len(runs) == 1 and runs[0]._start == 0 and runs[0]._stop == len(RecordColumns(runs[0]._columns)):
+            return runs[0]
+        fields = dict.fromkeys(field for run in runs for field, _, _, _ in run._columns)
+        columns = []
+        for field in fields:
+            pieces = [run._column(field) for run in runs]
+            if all(isinstance(values, np.ndarray) for values, _ in pieces):
+                arrays = [values for values, _ in pieces]
+                if any(values.dtype.kind == 'U' for values in arrays):
+                    arrays = [values.astype('U') for values in arrays]
+                values = np.concatenate(arrays)
+            else:
+                values = [value for values, _ in pieces for value in python_values(values)]
+            present = None
+            if any(mask is not None for _, mask in pieces):
+                present = np.concatenate([mask if mask is not None else np.ones(len(run), dtype=bool)
+                                          for run, (_, mask) in zip(runs, pieces)])
+            columns.append(_encode(field, values, present))
+        return cls(tuple(columns), 0, sum(len(run) for run in runs))
+
+    def _column(self, field):
+        # (values, present mask or None) of a field over this window, '' where it is missing
+        start, stop = self._start, self._stop
+        for name, values, distinct, present in self._columns:
+            if name == field:
+                values = values[start:stop]
+                return (distinct[values] if distinct is not None else values), \
+                    (present[start:stop] if present is not None else None)
+        return np.zeros(stop - start, dtype='S1'), np.zeros(stop - start, dtype=bool)
+
+    def window(self, start, stop):
+        return RecordColumns(self._columns, self._start + start, self._start + stop)
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(self[j] for j in range(*i.indices(len(self))))
+        i = range(self._start, self._stop)[i]
+        record = {}
+        for field, values, distinct, present in self._columns:
+            if present is None or present[i]:
+                value = values[i] if distinct is None else distinct[values[i]]
+                if isinstance(value, np.bytes_):
+                    value = value.decode('ascii')
+                elif isinstance(value, np.str_):
+                    value = str(value)
+                record[field] = value
+        return record
+
+    def __iter__(self):
+        # Column by column, much faster than record by record
+        start, stop = self._start, self._stop
+        fields, columns, masks = [], [], []
+        for field, values, distinct, present in self._columns:
+            values = values[start:stop]
+            fields.append(field)
+            columns.append(python_values(distinct[values] if distinct is not None else values))
+            masks.append(present[start:stop] if present is not None else None)
+        records = [dict(zip(fields, row)) for row in zip(*columns)] if fields else [{} for _ in range(stop - start)]
+        for field, mask in zip(fields, masks):
+            if mask is not None:
+                for i in np.flatnonzero(~mask).tolist():
+                    del records[i][field]
+        return iter(records)
+
+    def __add__(self, other):
+        return tuple(self) + tuple(other)
+
+    def __radd__(self, other):
+        return tuple(other) + tuple(self)
+
+
+def _encode(field, values, present):
+    # A column of RecordColumns from its values (a list, or an array of texts)
+    texts = values if isinstance(values, np.ndarray) else text_array(values)
+    if texts is None:
+        return field, tuple(values), None, present
+    distinct = np.unique(texts[:DISTINCT_SAMPLE])
+    if len(distinct) > DISTINCT_SAMPLE // 4:
+        return field, texts, None, present
+    # Most columns that repeat in the sample (group names) have no other values
+    codes = distinct.searchsorted(texts).clip(0, len(distinct) - 1) if len(distinct) else None
+    if codes is None or not (distinct[codes] == texts).all():
+        distinct, codes = np.unique(texts, return_inverse=True)
+    return field, codes.astype(np.min_scalar_type(len(distinct))), distinct, present
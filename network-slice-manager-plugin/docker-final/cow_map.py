@@ -0,0 +1,172 @@
+from itertools import chain, count
+
+from columnar import ArrayMap
+
+# A CowMap is three dicts: a base, the changes folded in since ("mid") and the latest changes
+# ("delta"), where removed keys map to _DELETED. None changes once published: a writer copies
+# the delta before its first change, folds it into a copy of mid once it outgrows the square
+# root of the map (and MIN_DELTA), and mid into a copy of the base once it holds more than
+# 1 / MID_RATIO of it. A small change copies O(sqrt(n)) entries, a bulk one a share of mid,
+# and the base is copied once per n / MID_RATIO changes. A map loaded from a snapshot has an
+# ArrayMap for base until that first copy
+MIN_DELTA = 256
+MID_RATIO = 8
+
+# Removed keys in a delta or mid. Dicts of plain keys and values (strings, numbers) stay
+# untracked by the garbage collector, so even big maps cost the collector nothing
+_DELETED = object()
+_MISSING = object()
+_EMPTY = {}
+
+
+class _DeltaReads:
+    # Read access shared by CowMap and MapWriter
+
+    __slots__ = ()
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._delta.get(key, _MISSING)
+        if value is _MISSING:
+            value = self._mid.get(key, _MISSING)
+            if value is _MISSING:
+                return self._base.get(key, default)
+        return default if value is _DELETED else value
+
+    def __iter__(self):
+        return (key for key, _ in self.items())
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        return (value for _, value in self.items())
+
+    def items(self):
+        mid, delta = self._mid, self._delta
+        if not mid and not delta:
+            return iter(self._base.items())
+        return chain((item for item in self._base.items() if item[0] not in mid and item[0] not in delta),
+                     (item for item in mid.items() if item[0] not in delta and item[1] is not _DELETED),
+                     (item for item in delta.items() if item[1] is not _DELETED))
+
+
+class CowMap(_DeltaReads):
+    '''
+    Immutable mapping. writer() returns a MapWriter, which copies what it changes and
+    freezes into a new CowMap sharing the rest; a CowMap itself is never changed, so it stays
+    valid for as long as a reader holds it. Iteration order is unspecified.
+    '''
+
+    __slots__ = ('_base', '_mid', '_delta', '_len')
+
+    def __init__(self, items=()):
+        self._base = dict(items)
+        self._mid = self._delta = _EMPTY
+        self._len = len(self._base)
+
+    @classmethod
+    def over(cls, base):
+        # A CowMap reading base (e.g. an ArrayMap) in place, not copied into a dict
+        cow = cls.__new__(cls)
+        cow._base, cow._mid, cow._delta, cow._len = base, _EMPTY, _EMPTY, len(base)
+        return cow
+
+    def __reduce__(self):
+        # String keys with integer values (sequence numbers) are pickled as arrays
+        if isinstance(self._base, ArrayMap) and not self._mid and not self._delta:
+            return CowMap.over, (self._base,)
+        items = dict(self.items())
+        packed = ArrayMap.from_items(list(items), list(items.values()))
+        return (CowMap.over, (packed,)) if packed is not None else (CowMap, (items,))
+
+    def writer(self):
+        return MapWriter(self)
+
+
+class MapWriter(_DeltaReads):
+    # Changes on top of a CowMap, read through the same interface; freeze() publishes them
+
+    __slots__ = ('_base', '_mid', '_delta', '_len', '_shared')
+
+    def __init__(self, base):
+        self._base = base._base
+        self._mid = base._mid
+        self._delta = base._delta
+        self._len = base._len
+        self._shared = True
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._len += 1
+        self._own()[key] = value
+
+    def insert_new(self, keys, values):
+        # Stores the keys not present yet with their values; returns the indexes of those keys
+        base, mid, delta = self._base, self._mid, self._own()
+        stored = []
+        for i, key, value in zip(count(), keys, values):
+            current = delta.get(key, _MISSING)
+            if current is _MISSING:
+                current = mid.get(key, _MISSING)
+                if current is _MISSING and key in base:
+                    continue
+            if current is _MISSING or current is _DELETED:
+                delta[key] = value
+                stored.append(i)
+        self._len += len(stored)
+        return stored
+
+    def pop(self, key, default=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            return default
+        delta = self._own()
+        if key in self._base or key in self._mid:
+            delta[key] = _DELETED
+        else:
+            del delta[key]
+        self._len -= 1
+        return value
+
+    def freeze(self):
+        delta = self._delta
+        if len(delta) > MIN_DELTA and len(delta) * len(delta) > self._len:
+            # Removed keys stay removed in mid only if the base has them
+            mid = self._mid.copy()
+            mid.update(delta)
+            if _DELETED in delta.values():
+                for key, value in delta.items():
+                    if value is _DELETED and key not in self._base:
+                        del mid[key]
+            self._mid, self._delta = mid, _EMPTY
+            if len(mid) > MIN_DELTA and len(mid) * MID_RATIO > len(self._base):
+                base = self._base.copy()
+                base.update(mid)
+                if _DELETED in mid.values():
+                    for key, value in mid.items():
+                        if value is _DELETED:
+                            del base[key]
+                self._base, self._mid = base, _EMPTY
+        frozen = CowMap.__new__(CowMap)
+        frozen._base, frozen._mid, frozen._delta, frozen._len = self._base, self._mid, self._delta, self._len
+        self._shared = True
+        return frozen
+
+    def _own(self):
+        # The delta, copied on the first change since it was last published
+        if self._shared:
+            self._delta = self._delta.copy()
+            self._shared = False
+        return self._delta
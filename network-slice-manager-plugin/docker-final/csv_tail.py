@@ -0,0 +1,84 @@
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# Seconds without modification after which an unterminated last line is taken as complete
+QUIESCENT_SECONDS = 1.0
+
+
+class CSVTailReader:
+    '''
+    Follows an append-only CSV file and returns only the rows added since the last call.
+    A trailing line without its newline is left for the next call, unless the file has not
+    changed for QUIESCENT_SECONDS (hand-edited files often lack the final newline). If the
+    file is replaced (new inode) or truncated, reading starts over from the header and
+    `reset` is reported so callers can drop what they built from the old content. The
+    returned rows are indexed by the byte offset of their line, which read_range accepts
+    to re-read part of the file.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = None
+        self._inode = None
+        self._offset = 0
+
+    @property
+    def offset(self):
+        # End of the last complete line returned so far
+        return self._offset
+
+    def read_new(self, **read_csv_kwargs):
+        # Returns (reset, DataFrame of the new rows or None); raises FileNotFoundError
+        reset = False
+        with open(self.path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if st.st_ino != self._inode or st.st_size < self._offset:
+                reset = self._inode is not None
+                self._inode = st.st_ino
+                self._offset = 0
+                self.columns = None
+            if st.st_size == self._offset:
+                return reset, None
+            f.seek(self._offset)
+            chunk = f.read(st.st_size - self._offset)
+
+        end = chunk.rfind(b'\n') + 1
+        if end < len(chunk) and time.time() - st.st_mtime > QUIESCENT_SECONDS:
+            # A last line without newline in a file nobody is writing to is a complete row
+            end = len(chunk)
+        if end == 0:
+            return reset, None
+        chunk = chunk[:end]
+        chunk_offset = self._offset
+        self._offset += end
+        if not chunk.endswith(b'\n'):
+            chunk += b'\n'
+
+        if self.columns is None:
+            header_end = chunk.index(b'\n') + 1
+            self.columns = chunk[:header_end].decode().strip().split(',')
+            chunk = chunk[header_end:]
+            chunk_offset += header_end
+        return reset, self._parse(chunk, chunk_offset, read_csv_kwargs)
+
+    def read_range(self, start, end, **read_csv_kwargs):
+        # Rows whose lines lie between two offsets previously returned by read_new
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            chunk = f.read(end - start)
+        return self._parse(chunk, start, read_csv_kwargs)
+
+    def _parse(self, chunk, chunk_offset, read_csv_kwargs):
+        if not chunk.strip():
+            return None
+        line_ends = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord('\n')) + 1
+        offsets = chunk_offset + np.concatenate(([0], line_ends[:-1]))
+        # Blank lines are kept as empty rows so that rows and line offsets stay aligned (the files
+        # written here never quote newlines, so every row is exactly one line)
+        rows = pd.read_csv(io.BytesIO(chunk), header=None, names=self.columns, skip_blank_lines=False, **read_csv_kwargs)
+        rows.index = offsets[:len(rows)]
+        return rows
@@ -0,0 +1,106 @@
+import atexit
+import csv
+import os
+import threading
+
+
+class BufferedCSVWriter:
+    '''
+    Appends rows to a CSV file from a background thread. Rows are buffered in memory and
+    written in one batch once max_rows are pending or flush_interval seconds have passed,
+    so callers on the hot path never touch the file. The header is only written when the
+    file is new or empty; a file with other columns (written before one was added) is first
+    rewritten with the current header. With fsync=True every batch is forced to disk before
+    returning.
+    '''
+
+    def __init__(self, path, columns, max_rows=1000, flush_interval=1.0, fsync=False):
+        self.path = path
+        self.columns = list(columns)
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        self._rows = []
+        self._file = None
+        self._closed = False
+        self._cond = threading.Condition()
+        # Keeps batches in order between the background thread and explicit flush() calls
+        self._io_lock = threading.Lock()
+        self._upgrade_header()
+        self._thread = threading.Thread(target=self._run, name=f'csv-writer-{os.path.basename(path)}', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write_row(self, row):
+        self.write_rows([row])
+
+    def write_rows(self, rows):
+        with self._cond:
+            if self._closed:
+                raise ValueError(f'writer for {self.path} is closed')
+            self._rows.extend(rows)
+            if len(self._rows) >= self.max_rows:
+                self._cond.notify()
+
+    def flush(self):
+        with self._io_lock:
+            with self._cond:
+                rows, self._rows = self._rows, []
+            self._write(rows)
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        with self._io_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._rows) < self.max_rows:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def _upgrade_header(self):
+        # Rows are appended in self.columns order, so an older file gets that header once,
+        # with the columns it lacks left empty
+        try:
+            with open(self.path, newline='') as f:
+                header = next(csv.reader(f), None)
+        except FileNotFoundError:
+            return
+        if header is None or header == self.columns:
+            return
+        unknown = [column for column in header if column not in self.columns]
+        if unknown:
+            raise ValueError(f'{self.path} has columns {unknown} that are not in {self.columns}')
+        print(f"Rewriting {self.path} with the columns {self.columns}")
+        tmp_path = self.path + '.tmp'
+        with open(self.path, newline='') as src, open(tmp_path, 'w', newline='') as dst:
+            writer = csv.DictWriter(dst, self.columns, restval='', extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(csv.DictReader(src))
+        os.replace(tmp_path, self.path)
+
+    def _write(self, rows):
+        # Called with _io_lock held
+        if not rows:
+            return
+        if self._file is None:
+            self._file = open(self.path, 'a', newline='')
+            if self._file.tell() == 0:
+                csv.writer(self._file).writerow(self.columns)
+        csv.writer(self._file).writerows(rows)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
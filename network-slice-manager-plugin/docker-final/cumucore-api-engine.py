@@ -1,15 +1,63 @@
 
-from flask import Flask, request, jsonify, abort
-from datetime import datetime
-from typing import Dict, Any, List, Optional
-import csv
+from flask import Flask, Response, request, jsonify, abort
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Set
+import numpy as np
+import pandas as pd
+import atexit
+import base64
+import functools
+import gc
 import os
-import random
+import threading
+import time
+import uuid
+
+from cnc_persistence import StateLog
+from cnc_state import CNCState
+from monitoring_stream import KafkaPublisher, samples_message
+from serving import add_health_routes
+from subscriber_import import ImportJob
+from traffic_generator import TrafficGenerator
 
 app = Flask(__name__)
+add_health_routes(app)
 
 API_PREFIX = "/api/v1.0"
 
+# Page size of cursor-paginated listings: the default, and the largest a client may ask for
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Largest JSON array accepted by the bulk subscriber endpoints
+MAX_BULK_ITEMS = 10000
+
+# Largest number of (UE, step) rows in one batched monitoring report, and CSV rows per streamed chunk
+MAX_REPORT_ROWS = 1_000_000
+REPORT_CSV_CHUNK_ROWS = 10000
+
+# IMSIs listed in the X-Missing-IMSIs header of a CSV report, which stays well under the 8 KB
+# header limit of proxies and gunicorn; X-Missing-Count holds how many there are in all
+MAX_MISSING_HEADER_IMSIS = 100
+MONITORING_COLUMNS = ["URLLC_Sent_thrp_Mbps", "URLLC_BytesSent", "URLLC_BytesReceived", "URLLC_Received_thrp_Mbps"]
+
+# Pushed monitoring samples: a step is published STREAM_DELAY_SECONDS after it ends, streams
+# resuming from a Last-Event-ID replay at most STREAM_REPLAY_SECONDS, and the Kafka publisher
+# (enabled by CNC_KAFKA_BOOTSTRAP) sends all subscribers in messages of STREAM_CHUNK_UES UEs
+STREAM_STEP_SECONDS = 5
+STREAM_DELAY_SECONDS = 3
+STREAM_REPLAY_SECONDS = 3600
+STREAM_CHUNK_UES = 5000
+
+# Every open stream holds a request thread for as long as the client stays connected, and the
+# mock runs as one worker of SERVE_THREADS (8 by default) threads. At most CNC_MAX_STREAMS
+# streams are served at a time, further ones get a 503, so the other routes (/readyz included)
+# keep threads to run on; keep it below the worker's thread count
+CNC_MAX_STREAMS = int(os.environ.get("CNC_MAX_STREAMS", "4"))
+stream_slots = threading.BoundedSemaphore(CNC_MAX_STREAMS)
+CNC_KAFKA_BOOTSTRAP = os.environ.get("CNC_KAFKA_BOOTSTRAP", "")
+CNC_KAFKA_TOPIC = os.environ.get("CNC_KAFKA_TOPIC", "cnc-monitoring")
+
 # -------------------------
 # In-memory "database"
 # -------------------------
@@ -21,38 +69,94 @@ MOCK_RAN_CAPABILITIES = {
     "dnns": {"internet"},
 }
 
-slice_instances: Dict[str, Dict[str, Any]] = {}
-subscription_profiles: Dict[str, Dict[str, Any]] = {}
-subscribers: Dict[str, Dict[str, Any]] = {}
-groups: Dict[str, List[str]] = {"group1": [], "group2": []}
-insertion_order: List[str] = []
-
-# Seed demo data
-subscription_profiles["profile"] = {
-    "_id": "profile",
-    "dnn": "internet",
-    "5gQosProfile": {"5qi": 9, "arp": {"priorityLevel": 15, "preemptCap": "NOT_PREEMPT", "preemptVuln": "PREEMPTABLE"}, "priorityLevel": 11},
-    "sessionAmbr": {"uplink": "200 Mbps", "downlink": "200 Mbps"},
-    "pduSessionTypes": {"defaultSessionType": "IPV4", "allowedSessionTypes": ["IPV4"]},
-    "upSecurity": {"upIntegr": "NOT_NEEDED", "upConfid": "NOT_NEEDED"},
-}
-subscribers["999991000000001"] = {
-    "imsi": "999991000000001",
-    "msisdn": "999991000000001",
-    "k": "000102030405060708090A0B0C0D0E0F",
-    "opc": "000102030405060708090A0B0C0D0E0F",
-    "sqn": "000000000000",
-    "rName": "UE-1",
-    "groupName": "group1",
-    "ue_static_ipv4_addr": "10.201.0.4/16",
-}
-groups["group1"].append("999991000000001")
-insertion_order.append("999991000000001")
+# Slice instances, subscription profiles, subscribers with their group and insertion-order
+# indexes, and per imported file the (inode, offset) the next import resumes from. Handlers read
+# state.snapshot(), an immutable version of all of them, and change them inside state.write():
+# writes are serialized, and each publishes a new snapshot, so reads never wait for writes.
+state = CNCState()
+
+# Bulk import jobs by id
+import_jobs: Dict[str, ImportJob] = {}
+import_lock = threading.Lock()
+# Uploads are saved to IMPORT_DIR and removed once an import consumed them entirely (or failed);
+# an upload a limit stopped early stays, to be resumed with {"path": "imports/<name>.csv"}
+IMPORT_DIR = "imports"
+
+# Snapshot and write-ahead log of the state above are kept in CNC_STATE_DIR; when it is unset
+# the state lives in memory only. CNC_STATE_FSYNC=1 also fsyncs the log after every request.
+CNC_STATE_DIR = os.environ.get("CNC_STATE_DIR", "")
+state_log: Optional[StateLog] = None
+_journaled_ops: Dict[str, Any] = {}
+
+# Seeded per-IMSI traffic model behind the monitoring reports; the same CNC_TRAFFIC_SEED
+# reproduces the same traffic for every UE and window
+traffic = TrafficGenerator(seed=int(os.environ.get("CNC_TRAFFIC_SEED", "0")))
 
 # -------------------------
-# Helpers
+# State changes
 # -------------------------
 
+def _journaled(func):
+    '''
+    Every change to the state goes through a function decorated with this. It runs
+    func(tx, *args) in a state write (joining the caller's, if there is one) and, with a
+    state log open, appends the (name, args) record in the same write; the state log shares
+    the state's writer lock. On startup the records are replayed by calling the same
+    functions. Stored records must be replaced, not changed in place: snapshots share them.
+    '''
+    name = func.__name__
+    _journaled_ops[name] = func
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        with state.write() as tx:
+            result = func(tx, *args)
+            if state_log is not None:
+                state_log.append((name, args))
+        return result
+    return wrapper
+
+@_journaled
+def _put_slice_instance(tx, name: str, payload: Dict[str, Any]):
+    tx.slice_instances[name] = payload
+
+@_journaled
+def _delete_slice_instance(tx, name: str):
+    del tx.slice_instances[name]
+
+@_journaled
+def _put_subscription_profile(tx, pid: str, payload: Dict[str, Any]):
+    tx.subscription_profiles[pid] = payload
+
+@_journaled
+def _delete_subscription_profile(tx, pid: str):
+    del tx.subscription_profiles[pid]
+
+@_journaled
+def _set_sqn(tx, imsi: str, sqn: str):
+    tx.subscribers[imsi] = {**tx.subscribers[imsi], "sqn": sqn}
+
+@_journaled
+def _set_import_offset(tx, path: str, inode: int, offset: int):
+    tx.import_offsets[path] = (inode, offset)
+
+@_journaled
+def _forget_import_offset(tx, path: str):
+    tx.import_offsets.pop(path, None)
+
+# Seed demo data
+with state.write() as tx:
+    tx.subscription_profiles["profile"] = {"_id": "profile", "dnn": "internet", "5gQosProfile": {"5qi": 9}}
+    tx.ensure_group("group1")
+    tx.add_subscribers([{
+        "imsi": "999991000000001",
+        "msisdn": "999991000000001",
+        "k": "000102030405060708090A0B0C0D0E0F",
+        "opc": "000102030405060708090A0B0C0D0E0F",
+        "sqn": "000000000000",
+        "groupName": "group1"
+    }])
+
 def http_404(msg: str):
     resp = jsonify({"detail": msg})
     resp.status_code = 404
@@ -93,7 +197,7 @@ def _validate_slice_against_mock_ran(payload: Dict[str, Any]) -> Optional[str]:
     return None
 
 def _ensure_subscriber_exists(imsi: str) -> Dict[str, Any]:
-    ue = subscribers.get(imsi)
+    ue = state.snapshot().subscribers.get(imsi)
     if not ue:
         abort(http_404("Subscriber not found"))
     return ue
@@ -103,6 +207,36 @@ def _order_list(lst: List[Dict[str, Any]], order: int) -> List[Dict[str, Any]]:
         return list(reversed(lst))
     return lst
 
+def _encode_cursor(seq: int, order: int) -> str:
+    return base64.urlsafe_b64encode(f"{seq}:{order}".encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    # Returns (sequence number, order); raises ValueError for anything not made by _encode_cursor
+    try:
+        seq, order = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":")
+        seq, order = int(seq), int(order)
+    except Exception:
+        raise ValueError("invalid cursor")
+    if seq < 0 or order not in (1, -1):
+        raise ValueError("invalid cursor")
+    return seq, order
+
+def _stream_subscribers(order: int):
+    # Streams the full listing as one JSON array, page by page through the index cursor so the
+    # table is never copied; the whole listing comes from one snapshot, unaffected by later writes
+    snap = state.snapshot()
+    yield "["
+    after, first = None, True
+    while True:
+        keys, after = snap.subscribers.page(after, MAX_PAGE_SIZE, reverse=order == -1)
+        chunk = ",".join(app.json.dumps(snap.subscribers[imsi], separators=(",", ":")) for imsi in keys)
+        if chunk:
+            yield chunk if first else "," + chunk
+            first = False
+        if after is None:
+            break
+    yield "]"
+
 def _is_hex32(s: str) -> bool:
     try:
         return isinstance(s, str) and len(s) == 32 and int(s, 16) is not None
@@ -115,7 +249,7 @@ def _is_hex32(s: str) -> bool:
 
 @app.get(f"{API_PREFIX}/network-slice/slice-instance")
 def get_slice_instances():
-    return jsonify(list(slice_instances.values()))
+    return jsonify(list(state.snapshot().slice_instances.values()))
 
 @app.post(f"{API_PREFIX}/network-slice/slice-instance")
 def add_slice_instance():
@@ -127,26 +261,28 @@ def add_slice_instance():
     name = payload.get("sliceName")
     if not name:
         return http_400("sliceName is required")
-    slice_instances[name] = payload
+    _put_slice_instance(name, payload)
     return jsonify({"status": "OK", "sliceName": name})
 
 @app.put(f"{API_PREFIX}/network-slice/slice-instance/<slice_name>")
 def update_slice_instance(slice_name: str):
-    if slice_name not in slice_instances:
-        return http_404("Slice not found")
     payload = request.get_json(force=True, silent=True) or {}
     if (payload.get("activate_slice") or 0) == 1:
         reason = _validate_slice_against_mock_ran(payload)
         if reason:
             return http_404(reason)
-    slice_instances[slice_name] = payload
+    with state.write() as tx:
+        if slice_name not in tx.slice_instances:
+            return http_404("Slice not found")
+        _put_slice_instance(slice_name, payload)
     return jsonify({"status": "OK", "sliceName": slice_name})
 
 @app.delete(f"{API_PREFIX}/network-slice/slice-instance/<slice_name>")
 def delete_slice_instance(slice_name: str):
-    if slice_name not in slice_instances:
-        return http_404("Slice not found")
-    del slice_instances[slice_name]
+    with state.write() as tx:
+        if slice_name not in tx.slice_instances:
+            return http_404("Slice not found")
+        _delete_slice_instance(slice_name)
     return jsonify({"status": "OK", "deleted": slice_name})
 
 # -------------------------
@@ -159,36 +295,39 @@ def create_subscription_profile():
     pid = payload.get("_id")
     if not pid:
         return http_400("_id is required")
-    if pid in subscription_profiles:
-        return http_404("Profile already exists")
     dnn = payload.get("dnn")
     fiveg = (payload.get("5gQosProfile") or {}).get("5qi")
-    if dnn not in MOCK_RAN_CAPABILITIES["dnns"] or fiveg not in {5, 9}:
-        return http_404("Unsupported dnn or 5qi")
-    subscription_profiles[pid] = payload
+    with state.write() as tx:
+        if pid in tx.subscription_profiles:
+            return http_404("Profile already exists")
+        if dnn not in MOCK_RAN_CAPABILITIES["dnns"] or fiveg not in {5, 9}:
+            return http_404("Unsupported dnn or 5qi")
+        _put_subscription_profile(pid, payload)
     return jsonify({"status": "OK", "_id": pid})
 
 @app.get(f"{API_PREFIX}/cnc-configuration/cnc-subscription-profile")
 def list_subscription_profiles():
-    return jsonify(list(subscription_profiles.values()))
+    return jsonify(list(state.snapshot().subscription_profiles.values()))
 
 @app.put(f"{API_PREFIX}/cnc-configuration/cnc-subscription-profile/<profile_id>")
 def update_subscription_profile(profile_id: str):
-    if profile_id not in subscription_profiles:
-        return http_404("Profile not found")
     payload = request.get_json(force=True, silent=True) or {}
     dnn = payload.get("dnn")
     fiveg = (payload.get("5gQosProfile") or {}).get("5qi")
-    if dnn not in MOCK_RAN_CAPABILITIES["dnns"] or fiveg not in {5, 9}:
-        return http_404("Unsupported dnn or 5qi")
-    subscription_profiles[profile_id] = payload
+    with state.write() as tx:
+        if profile_id not in tx.subscription_profiles:
+            return http_404("Profile not found")
+        if dnn not in MOCK_RAN_CAPABILITIES["dnns"] or fiveg not in {5, 9}:
+            return http_404("Unsupported dnn or 5qi")
+        _put_subscription_profile(profile_id, payload)
     return jsonify({"status": "OK", "_id": profile_id})
 
 @app.delete(f"{API_PREFIX}/cnc-configuration/cnc-subscription-profile/<profile_id>")
 def delete_subscription_profile(profile_id: str):
-    if profile_id not in subscription_profiles:
-        return http_404("Profile not found")
-    del subscription_profiles[profile_id]
+    with state.write() as tx:
+        if profile_id not in tx.subscription_profiles:
+            return http_404("Profile not found")
+        _delete_subscription_profile(profile_id)
     return jsonify({"status": "OK", "deleted": profile_id})
 
 # -------------------------
@@ -197,62 +336,208 @@ def delete_subscription_profile(profile_id: str):
 
 @app.get(f"{API_PREFIX}/cnc-subscriber-management")
 def get_subscribers():
+    '''
+    Without limit/cursor, streams every subscriber as a JSON array. With ?limit=N (at most
+    MAX_PAGE_SIZE) returns one page, {"subscribers": [...], "next_cursor": ...}; pass
+    next_cursor back as ?cursor= for the following page, until it is null.
+    '''
     try:
         order = int(request.args.get("order", "1"))
     except Exception:
         order = 1
-    lst = [subscribers[imsi] for imsi in insertion_order if imsi in subscribers]
-    lst = _order_list(lst, order)
-    return jsonify(lst)
+    if "limit" not in request.args and "cursor" not in request.args:
+        return Response(_stream_subscribers(order), mimetype="application/json")
 
-@app.post(f"{API_PREFIX}/cnc-subscriber-management")
-def add_subscriber():
-    payload = request.get_json(force=True, silent=True) or {}
-    imsi = payload.get("imsi")
+    try:
+        limit = int(request.args.get("limit", DEFAULT_PAGE_SIZE))
+    except Exception:
+        return http_400("limit must be an integer")
+    if limit < 1:
+        return http_400("limit must be >= 1")
+    limit = min(limit, MAX_PAGE_SIZE)
+    after = None
+    if request.args.get("cursor"):
+        try:
+            after, order = _decode_cursor(request.args["cursor"])
+        except ValueError as e:
+            return http_400(str(e))
+    snap = state.snapshot()
+    keys, next_seq = snap.subscribers.page(after, limit, reverse=order == -1)
+    return jsonify({
+        "subscribers": [snap.subscribers[imsi] for imsi in keys],
+        "next_cursor": _encode_cursor(next_seq, order) if next_seq is not None else None,
+    })
+
+# Checks return None when the change can be applied, else the (status, detail) of the error.
+# They are shared by the single-IMSI endpoints and the bulk ones, and run in the same state
+# write as the change, against its transaction tx, so nothing changes in between.
+
+def _check_new_subscriber(tx, payload: Dict[str, Any], batch: Set[str] = frozenset()):
+    imsi = payload.get("imsi") if isinstance(payload, dict) else None
     if not imsi:
-        return http_400("imsi is required")
-    if imsi in subscribers:
-        return http_404("Subscriber already exists")
+        return 400, "imsi is required"
+    if imsi in tx.subscribers or imsi in batch:
+        return 404, "Subscriber already exists"
+    gname = payload.get("groupName") or ""
+    if gname and gname not in tx.groups:
+        return 404, "Unknown group"
+    if not _is_hex32(payload.get("k", "")) or not _is_hex32(payload.get("opc", "")):
+        return 404, "Invalid K/OPC"
+    return None
 
+@_journaled
+def _store_subscriber(tx, payload: Dict[str, Any]):
+    tx.ensure_group(payload.get("groupName") or "default")
+    tx.add_subscribers([payload])
+
+@_journaled
+def _store_subscribers(tx, payloads: List[Dict[str, Any]]):
+    for payload in payloads:
+        tx.ensure_group(payload.get("groupName") or "default")
+    tx.add_subscribers(payloads)
+
+def _check_update(tx, imsi: str, payload: Dict[str, Any]):
+    if imsi not in tx.subscribers:
+        return 404, "Subscriber not found"
+    if not isinstance(payload, dict):
+        return 400, "subscriber must be a JSON object"
     gname = payload.get("groupName") or ""
-    if gname and gname not in groups:
-        return http_404("Unknown group")
+    if gname and gname not in tx.groups:
+        return 404, "Unknown group"
+    return None
 
-    if not _is_hex32(payload.get("k", "")) or not _is_hex32(payload.get("opc", "")):
-        return http_404("Invalid K/OPC")
+@_journaled
+def _apply_update(tx, imsi: str, payload: Dict[str, Any]):
+    tx.replace_subscriber(imsi, payload)
 
-    subscribers[imsi] = payload
-    groups.setdefault(gname or "default", [])
-    if gname:
-        groups[gname].append(imsi)
-    insertion_order.append(imsi)
-    return jsonify({"status": "OK", "imsi": imsi})
+@_journaled
+def _apply_updates(tx, updates: List[tuple]):
+    for imsi, payload in updates:
+        tx.replace_subscriber(imsi, payload)
+
+@_journaled
+def _remove_subscriber(tx, imsi: str):
+    tx.remove_subscribers([imsi])
+
+@_journaled
+def _remove_subscribers(tx, imsis: List[str]):
+    tx.remove_subscribers(imsis)
+
+def _error(error):
+    resp = jsonify({"detail": error[1]})
+    resp.status_code = error[0]
+    return resp
+
+@app.post(f"{API_PREFIX}/cnc-subscriber-management")
+def add_subscriber():
+    payload = request.get_json(force=True, silent=True) or {}
+    with state.write() as tx:
+        error = _check_new_subscriber(tx, payload)
+        if error:
+            return _error(error)
+        _store_subscriber(payload)
+    return jsonify({"status": "OK", "imsi": payload["imsi"]})
 
 @app.put(f"{API_PREFIX}/cnc-subscriber-management/<imsi>")
 def update_subscriber(imsi: str):
-    if imsi not in subscribers:
-        return http_404("Subscriber not found")
     payload = request.get_json(force=True, silent=True) or {}
-    gname = payload.get("groupName") or ""
-    if gname and gname not in groups:
-        return http_404("Unknown group")
-    subscribers[imsi] = payload
-    if gname and imsi not in groups[gname]:
-        groups[gname].append(imsi)
+    with state.write() as tx:
+        error = _check_update(tx, imsi, payload)
+        if error:
+            return _error(error)
+        _apply_update(imsi, payload)
     return jsonify({"status": "OK", "imsi": imsi})
 
 @app.delete(f"{API_PREFIX}/cnc-subscriber-management/<imsi>")
 def delete_subscriber(imsi: str):
-    if imsi not in subscribers:
-        return http_404("Subscriber not found")
-    del subscribers[imsi]
-    for g, imsies in groups.items():
-        if imsi in imsies:
-            imsies.remove(imsi)
-    if imsi in insertion_order:
-        insertion_order.remove(imsi)
+    with state.write() as tx:
+        if imsi not in tx.subscribers:
+            return http_404("Subscriber not found")
+        _remove_subscriber(imsi)
     return jsonify({"status": "OK", "deleted": imsi})
 
+# -------------------------
+# Bulk subscriber changes
+# -------------------------
+
+def _bulk_items():
+    # The JSON array of a bulk request, or an error response
+    items = request.get_json(force=True, silent=True)
+    if not isinstance(items, list) or not items:
+        return None, http_400("a non-empty JSON array is required")
+    if len(items) > MAX_BULK_ITEMS:
+        return None, http_400(f"at most {MAX_BULK_ITEMS} items per request")
+    return items, None
+
+def _apply_bulk(imsis: List[Optional[str]], errors: List[Optional[tuple]], apply):
+    '''
+    Calls apply(indexes) once with the indexes of the items that passed validation and
+    reports a status per item. With ?atomic=1 nothing is applied unless every item is
+    valid; the response is then a 400 in which the valid items carry status 424. Called in
+    the state write that ran the checks, so the changes are published all at once.
+    '''
+    atomic = request.args.get("atomic", "0").lower() in ("1", "true")
+    failed = sum(error is not None for error in errors)
+    if atomic and failed:
+        results = [{"imsi": imsi, "status": error[0], "detail": error[1]} if error else
+                   {"imsi": imsi, "status": 424, "detail": "Not applied, another item failed"}
+                   for imsi, error in zip(imsis, errors)]
+        return jsonify({"status": "failed", "applied": 0, "failed": failed, "results": results}), 400
+
+    valid = [i for i, error in enumerate(errors) if error is None]
+    if valid:
+        apply(valid)
+    results = [{"imsi": imsi, "status": error[0], "detail": error[1]} if error else
+               {"imsi": imsi, "status": 200, "detail": "OK"}
+               for imsi, error in zip(imsis, errors)]
+    return jsonify({"status": "OK" if not failed else "partial", "applied": len(imsis) - failed,
+                    "failed": failed, "results": results})
+
+@app.post(f"{API_PREFIX}/cnc-subscriber-management/bulk")
+def bulk_add_subscribers():
+    # Body: JSON array of subscribers, each validated like POST /cnc-subscriber-management
+    items, error = _bulk_items()
+    if error:
+        return error
+    imsis = [item.get("imsi") if isinstance(item, dict) else None for item in items]
+    with state.write() as tx:
+        batch, errors = set(), []
+        for item in items:
+            errors.append(_check_new_subscriber(tx, item, batch))
+            if errors[-1] is None:
+                batch.add(item["imsi"])
+        return _apply_bulk(imsis, errors, lambda valid: _store_subscribers([items[i] for i in valid]))
+
+@app.put(f"{API_PREFIX}/cnc-subscriber-management/bulk")
+def bulk_update_subscribers():
+    # Body: JSON array of subscribers, each replacing the stored record of its "imsi"
+    items, error = _bulk_items()
+    if error:
+        return error
+    imsis = [item.get("imsi") if isinstance(item, dict) else None for item in items]
+    with state.write() as tx:
+        errors = [_check_update(tx, imsi, item) if imsi else (400, "imsi is required") for imsi, item in zip(imsis, items)]
+        return _apply_bulk(imsis, errors, lambda valid: _apply_updates([(imsis[i], items[i]) for i in valid]))
+
+@app.delete(f"{API_PREFIX}/cnc-subscriber-management/bulk")
+def bulk_delete_subscribers():
+    # Body: JSON array of IMSIs (or of objects with an "imsi")
+    items, error = _bulk_items()
+    if error:
+        return error
+    imsis = [item.get("imsi") if isinstance(item, dict) else item for item in items]
+    with state.write() as tx:
+        deleted, errors = set(), []
+        for imsi in imsis:
+            if not imsi or not isinstance(imsi, str):
+                errors.append((400, "imsi is required"))
+            elif imsi not in tx.subscribers or imsi in deleted:
+                errors.append((404, "Subscriber not found"))
+            else:
+                errors.append(None)
+                deleted.add(imsi)
+        return _apply_bulk(imsis, errors, lambda valid: _remove_subscribers([imsis[i] for i in valid]))
+
 @app.get(f"{API_PREFIX}/cnc-subscriber-management/<imsi>")
 def get_single_subscriber(imsi: str):
     return jsonify(_ensure_subscriber_exists(imsi))
@@ -262,14 +547,14 @@ def get_subscribers_by_group():
     gname = request.args.get("gname")
     if not gname:
         return http_400("gname is required")
-    if gname not in groups:
+    snap = state.snapshot()
+    if gname not in snap.groups:
         return http_404("Group not found")
     try:
         order = int(request.args.get("order", "1"))
     except Exception:
         order = 1
-    imsies = groups[gname]
-    lst = [subscribers[i] for i in imsies if i in subscribers]
+    lst = [snap.subscribers[i] for i in snap.members(gname)]
     lst = _order_list(lst, order)
     return jsonify(lst)
 
@@ -283,31 +568,76 @@ def get_subscribers_by_batch():
         order = int(request.args.get("order", "1"))
     except Exception:
         return http_400("start, end and order must be integers")
-    ordered = [imsi for imsi in insertion_order if imsi in subscribers]
-    if start < 0 or end < 0 or start >= len(ordered) or end > len(ordered):
+    snap = state.snapshot()
+    if start < 0 or end < 0 or start >= len(snap.subscribers) or end > len(snap.subscribers):
         return http_404("Range out of bounds")
-    selected = ordered[start:end]
-    lst = [subscribers[i] for i in selected]
+    lst = [snap.subscribers[i] for i in snap.subscribers.slice(start, end)]
     lst = _order_list(lst, order)
     return jsonify(lst)
 
 @app.get(f"{API_PREFIX}/cnc-subscriber-management/total-count")
 def total_count():
-    return jsonify({"count": len(subscribers)})
+    return jsonify({"count": len(state.snapshot().subscribers)})
 
 @app.put(f"{API_PREFIX}/cnc-subscriber-management/sqn/<imsi>")
 def update_sqn(imsi: str):
-    if imsi not in subscribers:
-        return http_404("Subscriber not found")
     payload = request.get_json(force=True, silent=True) or {}
     new_sqn = payload.get("sqn")
-    if not new_sqn:
-        return http_400("sqn missing")
-    subscribers[imsi]["sqn"] = new_sqn
+    with state.write() as tx:
+        if imsi not in tx.subscribers:
+            return http_404("Subscriber not found")
+        if not new_sqn:
+            return http_400("sqn missing")
+        _set_sqn(imsi, new_sqn)
     return jsonify({"status": "ok", "imsi": imsi, "sqn": new_sqn})
 
+@_journaled
+def _insert_imported(tx, records: List[Dict[str, Any]]):
+    # The import checked for duplicates before the write; rows added meanwhile by a request are kept
+    tx.add_subscribers([row for row in records if row["imsi"] not in tx.subscribers])
+
+def _create_import_job(path: str, limit: Optional[int] = None) -> ImportJob:
+    '''
+    Creates a job importing path from where the previous import of the same file stopped
+    (from the top if the file was replaced or truncated since). Raises RuntimeError while
+    another import of that file is still running.
+    '''
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    with import_lock:
+        if any(job.path == path and job.status in ("queued", "running") for job in import_jobs.values()):
+            raise RuntimeError("An import of this file is already running")
+        inode, offset = state.snapshot().import_offsets.get(path, (st.st_ino, 0))
+        if inode != st.st_ino or offset > st.st_size:
+            offset = 0
+
+        def on_progress(new_offset: int):
+            # Runs after every inserted chunk; the import thread commits its own log records
+            _set_import_offset(path, st.st_ino, new_offset)
+            if state_log is not None:
+                state_log.commit()
+
+        job = ImportJob(uuid.uuid4().hex, path, lambda imsi: imsi in state.snapshot().subscribers, _insert_imported,
+                        start_offset=offset, limit=limit, on_progress=on_progress, on_finish=_remove_used_upload)
+        import_jobs[job.job_id] = job
+    return job
+
+def _remove_used_upload(job: ImportJob):
+    # Uploads are only read by import jobs: once one is no longer needed, it goes with its resume offset
+    if os.path.dirname(job.path) != os.path.abspath(IMPORT_DIR):
+        return
+    if job.status == "failed" or (job.size is not None and job.offset >= job.size):
+        try:
+            os.remove(job.path)
+        except FileNotFoundError:
+            pass
+        _forget_import_offset(job.path)
+        if state_log is not None:
+            state_log.commit()
+
 @app.post(f"{API_PREFIX}/cnc-multisubscriber-management")
 def add_multi_subscribers():
+    # Imports the next `size` subscribers of esims.csv, resuming after the rows earlier calls consumed
     if "size" not in request.args:
         return http_400("size is required")
     try:
@@ -319,27 +649,59 @@ def add_multi_subscribers():
     filename = "esims.csv"
     if not os.path.exists(filename):
         return http_404(f"{filename} not found in working directory")
-    added = 0
-    with open(filename, newline="") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if added >= size:
-                break
-            imsi = row.get("imsi")
-            if not imsi or imsi in subscribers:
-                continue
-            k = row.get("k", "")
-            opc = row.get("opc", "")
-            if len(k) != 32 or len(opc) != 32:
-                continue
-            subscribers[imsi] = row
-            insertion_order.append(imsi)
-            g = row.get("groupName", "")
-            if g:
-                groups.setdefault(g, [])
-                groups[g].append(imsi)
-            added += 1
-    return jsonify({"status": "OK", "added": added})
+    try:
+        job = _create_import_job(filename, limit=size).run()
+    except RuntimeError as e:
+        return jsonify({"detail": str(e)}), 409
+    if job.status == "failed":
+        return http_400(job.error)
+    return jsonify({"status": "OK", "added": job.added})
+
+@app.post(f"{API_PREFIX}/cnc-multisubscriber-management/import-jobs")
+def start_import_job():
+    '''
+    Starts a background import. Either upload the CSV as multipart field "file", or send
+    {"path": "<file in the working directory>"}; optional "limit" caps the subscribers added.
+    Poll the returned status_url for progress. An upload is deleted once it is imported to the
+    end; one a limit stopped early stays as imports/<name>.csv until an import by path finishes it.
+    '''
+    upload = request.files.get("file")
+    payload = request.get_json(silent=True) or {}
+    limit = payload.get("limit", request.form.get("limit"))
+    try:
+        limit = int(limit) if limit not in (None, "") else None
+    except Exception:
+        return http_400("limit must be integer")
+    if upload is not None:
+        os.makedirs(IMPORT_DIR, exist_ok=True)
+        path = os.path.join(IMPORT_DIR, f"{uuid.uuid4().hex}.csv")
+        upload.save(path)
+    else:
+        path = payload.get("path") or "esims.csv"
+        if os.path.isabs(path) or ".." in path.replace("\\", "/").split("/"):
+            return http_400("path must be relative to the working directory")
+        if not os.path.exists(path):
+            return http_404(f"{path} not found in working directory")
+    try:
+        job = _create_import_job(path, limit=limit)
+    except RuntimeError as e:
+        if upload is not None:
+            os.remove(path)
+        return jsonify({"detail": str(e)}), 409
+    job.start()
+    return jsonify({"status": "OK", "job_id": job.job_id,
+                    "status_url": f"{API_PREFIX}/cnc-multisubscriber-management/import-jobs/{job.job_id}"}), 202
+
+@app.get(f"{API_PREFIX}/cnc-multisubscriber-management/import-jobs")
+def list_import_jobs():
+    return jsonify([job.to_dict() for job in list(import_jobs.values())])
+
+@app.get(f"{API_PREFIX}/cnc-multisubscriber-management/import-jobs/<job_id>")
+def get_import_job(job_id: str):
+    job = import_jobs.get(job_id)
+    if job is None:
+        return http_404("Import job not found")
+    return jsonify(job.to_dict())
 
 @app.delete(f"{API_PREFIX}/cnc-multisubscriber-management/delete")
 def delete_multi_subscribers():
@@ -347,75 +709,18 @@ def delete_multi_subscribers():
     if not ids:
         return http_400("ids is required")
     imsis = [i.strip() for i in ids.split(",") if i.strip()]
-    deleted = 0
-    for imsi in imsis:
-        if imsi in subscribers:
-            del subscribers[imsi]
-            if imsi in insertion_order:
-                insertion_order.remove(imsi)
-            for g in groups.values():
-                if imsi in g:
-                    g.remove(imsi)
-            deleted += 1
-    return jsonify({"status": "ok", "deleted": deleted})
-
-
-# -------------------------
-# In-memory mock data
-# -------------------------
-
-MOCK_RAN_CAPABILITIES = {
-    "plmns": {("999", "99")},
-    "snssai": {("1", "000002"), ("1", "")},
-    "qos_profiles": {9},
-    "dnns": {"internet"},
-}
-
-slice_instances: Dict[str, Dict[str, Any]] = {}
-subscription_profiles: Dict[str, Dict[str, Any]] = {}
-subscribers: Dict[str, Dict[str, Any]] = {}
-groups: Dict[str, List[str]] = {"group1": []}
-insertion_order: List[str] = []
-
-# Seed demo entries
-subscription_profiles["profile"] = {"_id": "profile", "dnn": "internet", "5gQosProfile": {"5qi": 9}}
-subscribers["999991000000001"] = {
-    "imsi": "999991000000001",
-    "msisdn": "999991000000001",
-    "k": "000102030405060708090A0B0C0D0E0F",
-    "opc": "000102030405060708090A0B0C0D0E0F",
-    "sqn": "000000000000",
-    "groupName": "group1"
-}
-groups["group1"].append("999991000000001")
-insertion_order.append("999991000000001")
-
-# -------------------------
-# Helpers
-# -------------------------
+    with state.write() as tx:
+        present = [imsi for imsi in dict.fromkeys(imsis) if imsi in tx.subscribers]
+        if present:
+            _remove_subscribers(present)
+    return jsonify({"status": "ok", "deleted": len(present)})
 
-def http_404(msg: str):
-    resp = jsonify({"detail": msg})
-    resp.status_code = 404
-    return resp
-
-def http_400(msg: str):
-    resp = jsonify({"detail": msg})
-    resp.status_code = 400
-    return resp
 
 # -------------------------
 # Usage report generator (CNC-15)
 # -------------------------
 
-def _generate_usage_report(report_type: str, tgt_ue: str, start: str, end: str):
-    if report_type != "ue-usage":
-        raise ValueError("Unsupported report-type")
-    if not tgt_ue.startswith("imsi-"):
-        raise ValueError("tgt_ue must start with 'imsi-'")
-    imsi = tgt_ue[5:]
-    if imsi not in subscribers:
-        raise LookupError("Subscriber not found")
+def _parse_window(start: str, end: str):
     try:
         start_dt = datetime.fromisoformat(start.replace("Z", "+00:00"))
         end_dt = datetime.fromisoformat(end.replace("Z", "+00:00"))
@@ -423,8 +728,20 @@ def _generate_usage_report(report_type: str, tgt_ue: str, start: str, end: str):
         raise RuntimeError("Invalid ISO time")
     if end_dt <= start_dt:
         raise RuntimeError("'end' must be after 'start'")
-    total_ul = len(imsi) * 12345
-    total_dl = len(imsi) * 23456
+    return start_dt, end_dt
+
+def _generate_usage_report(report_type: str, tgt_ue: str, start: str, end: str):
+    if report_type != "ue-usage":
+        raise ValueError("Unsupported report-type")
+    if not tgt_ue.startswith("imsi-"):
+        raise ValueError("tgt_ue must start with 'imsi-'")
+    imsi = tgt_ue[5:]
+    if imsi not in state.snapshot().subscribers:
+        raise LookupError("Subscriber not found")
+    start_dt, end_dt = _parse_window(start, end)
+    usage = traffic.window([imsi], start_dt.timestamp(), end_dt.timestamp())
+    total_ul = int(usage["URLLC_BytesSent"][0])
+    total_dl = int(usage["URLLC_BytesReceived"][0])
     return {
         "time_window": {"start": start_dt.isoformat(), "end": end_dt.isoformat()},
         "summary": {"total_uplink_bytes": total_ul, "total_downlink_bytes": total_dl},
@@ -464,11 +781,11 @@ def monitoring_report_transform():
     end_dt = datetime.fromisoformat(rep["time_window"]["end"])
     dur = (end_dt - start_dt).total_seconds()
 
-    bytes_sent = rep["summary"]["total_uplink_bytes"] * random.randint(1000, 10000)
-    bytes_recv = rep["summary"]["total_downlink_bytes"] * random.randint(1000, 10000)
+    bytes_sent = rep["summary"]["total_uplink_bytes"]
+    bytes_recv = rep["summary"]["total_downlink_bytes"]
 
-    sent_mbps = (bytes_sent * 8) / dur / 1_000_000 * random.randint(1000, 10000) * 100
-    recv_mbps = (bytes_recv * 8) / dur / 1_000_000 * random.randint(1000, 10000) * 20
+    sent_mbps = (bytes_sent * 8) / dur / 1_000_000
+    recv_mbps = (bytes_recv * 8) / dur / 1_000_000
 
     data = {
         "URLLC_Sent_thrp_Mbps": round(sent_mbps, 6),
@@ -484,6 +801,206 @@ def monitoring_report_transform():
         return Response(header + row, mimetype="text/csv")
     return jsonify(data)
 
+@app.route(f"{API_PREFIX}/cnc/monitoring-report/batch", methods=["GET", "POST"])
+def monitoring_report_batch():
+    '''
+    Monitoring metrics of many UEs as a time series, in one response. Parameters come as a
+    JSON object body or in the query string: "imsis" (a list, or comma-separated) or "group",
+    "start" and "end" (ISO time), "step" in seconds (at most and by default end - start,
+    i.e. one row per UE) and "format" (json or csv). Rows are UE-major, one per UE and step, timestamped
+    with the end of their step. JSON is columnar, {"columns": {"imsi": [...],
+    "timestamp": [...], <metric>: [...]}, "missing": [...]}, where missing lists the IMSIs
+    that are not subscribers; csv streams the same columns, with the first
+    MAX_MISSING_HEADER_IMSIS missing IMSIs in X-Missing-IMSIs and their count in X-Missing-Count.
+    '''
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict):
+        return http_400("the JSON body must be an object")
+    params = {**request.args.to_dict(), **body}
+    imsis = params.get("imsis") or []
+    if isinstance(imsis, str):
+        imsis = [imsi.strip() for imsi in imsis.split(",") if imsi.strip()]
+    if not isinstance(imsis, list):
+        return http_400("imsis must be a list or a comma-separated string")
+    gname = params.get("group")
+    snap = state.snapshot()
+    if gname:
+        if gname not in snap.groups:
+            return http_404("Unknown group")
+        imsis = list(imsis) + snap.members(gname)
+    if not imsis:
+        return http_400("imsis or group is required")
+    try:
+        start_dt, end_dt = _parse_window(params["start"], params["end"])
+    except KeyError:
+        return http_400("start and end are required")
+    except RuntimeError as e:
+        return http_400(str(e))
+    window = (end_dt - start_dt).total_seconds()
+    try:
+        step = float(params.get("step") or window)
+    except (TypeError, ValueError):
+        return http_400("step must be a number of seconds")
+    if step <= 0:
+        return http_400("step must be > 0")
+    if step > window:
+        return http_400("step must not exceed the window (end - start)")
+
+    imsis = list(dict.fromkeys(str(imsi) for imsi in imsis))
+    known = [imsi for imsi in imsis if imsi in snap.subscribers]
+    missing = [imsi for imsi in imsis if imsi not in snap.subscribers]
+    steps = int(window // step)
+    if len(known) * steps > MAX_REPORT_ROWS:
+        return http_400(f"at most {MAX_REPORT_ROWS} rows (UEs x steps) per report")
+
+    columns = _report_columns(known, start_dt.timestamp(), end_dt.timestamp(), step, start_dt.tzinfo)
+    if params.get("format", "json").lower() == "csv":
+        return Response(_stream_report_csv(pd.DataFrame(columns)), mimetype="text/csv",
+                        headers={"X-Missing-IMSIs": ",".join(missing[:MAX_MISSING_HEADER_IMSIS]),
+                                 "X-Missing-Count": str(len(missing))})
+    return jsonify({"columns": _to_lists(columns), "missing": missing})
+
+def _stream_report_csv(frame: pd.DataFrame):
+    yield ",".join(frame.columns) + "\n"
+    for i in range(0, len(frame), REPORT_CSV_CHUNK_ROWS):
+        yield frame.iloc[i:i + REPORT_CSV_CHUNK_ROWS].to_csv(header=False, index=False)
+
+def _report_columns(imsis: List[str], start_ts: float, end_ts: float, step: float, tz=None) -> Dict[str, Any]:
+    # Columnar samples of the UEs over consecutive steps, UE-major, as numpy arrays
+    usage, ends = traffic.series(imsis, start_ts, end_ts, step)
+    timestamps = [datetime.fromtimestamp(t, tz).isoformat() for t in ends]
+    columns = {"imsi": np.repeat(np.array(imsis, dtype=object), len(ends)),
+               "timestamp": np.tile(np.array(timestamps, dtype=object), len(imsis))}
+    for name in MONITORING_COLUMNS:
+        values = usage[name].ravel()
+        columns[name] = values.round(6) if values.dtype.kind == "f" else values
+    return columns
+
+def _to_lists(columns: Dict[str, Any]) -> Dict[str, list]:
+    return {name: values.tolist() for name, values in columns.items()}
+
+def _step_message(imsis: List[str], index: int, step: float) -> Dict[str, Any]:
+    # Samples of step number index, the step ending at index * step seconds
+    end_ts = index * step
+    columns = _report_columns(imsis, end_ts - step, end_ts, step, timezone.utc)
+    return samples_message(datetime.fromtimestamp(end_ts, timezone.utc).isoformat(), step, _to_lists(columns))
+
+def _live_step(step: float) -> int:
+    # Number of the latest step that is due for publishing
+    return int((time.time() - STREAM_DELAY_SECONDS) // step)
+
+@app.get(f"{API_PREFIX}/cnc/monitoring-stream")
+def monitoring_stream():
+    '''
+    Server-sent events with the monitoring samples of the given UEs ("imsis", comma-separated,
+    and/or "group", whose members are re-read every step), one event per step of "step"
+    seconds (default STREAM_STEP_SECONDS) as soon as it is due. The event id is the step
+    number: reconnecting with a Last-Event-ID header (or ?last_event_id=) resumes right
+    after that step, replaying up to STREAM_REPLAY_SECONDS. Events are produced only as fast
+    as the client reads them.
+    '''
+    imsis = [imsi.strip() for imsi in request.args.get("imsis", "").split(",") if imsi.strip()]
+    gname = request.args.get("group")
+    if gname and gname not in state.snapshot().groups:
+        return http_404("Unknown group")
+    if not imsis and not gname:
+        return http_400("imsis or group is required")
+    try:
+        step = float(request.args.get("step", STREAM_STEP_SECONDS))
+        last_id = request.headers.get("Last-Event-ID", request.args.get("last_event_id"))
+        last_id = int(last_id) if last_id not in (None, "") else None
+    except ValueError:
+        return http_400("step and Last-Event-ID must be numbers")
+    if step <= 0:
+        return http_400("step must be > 0")
+
+    if not stream_slots.acquire(blocking=False):
+        resp = jsonify({"detail": f"At most {CNC_MAX_STREAMS} monitoring streams at a time, retry later"})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(STREAM_STEP_SECONDS)
+        return resp
+    live = _live_step(step)
+    oldest = live - int(STREAM_REPLAY_SECONDS // step)
+    first = live if last_id is None else min(max(last_id + 1, oldest), live + 1)
+    resp = Response(_monitoring_events(imsis, gname, step, first), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # The slot is freed when the server closes the response, after the client went away
+    resp.call_on_close(stream_slots.release)
+    return resp
+
+def _monitoring_events(imsis: List[str], gname: Optional[str], step: float, index: int):
+    while True:
+        wait = index * step + STREAM_DELAY_SECONDS - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        snap = state.snapshot()
+        members = list(dict.fromkeys(imsis + (snap.members(gname) if gname in snap.groups else [])))
+        known = [imsi for imsi in members if imsi in snap.subscribers]
+        data = app.json.dumps(_step_message(known, index, step), separators=(",", ":"))
+        yield f"id: {index}\nevent: samples\ndata: {data}\n\n"
+        index += 1
+
+def _publish_monitoring(publisher: KafkaPublisher, step: float):
+    # Publishes every subscriber's samples to Kafka once per step; the step number is the key
+    index = _live_step(step)
+    while True:
+        wait = index * step + STREAM_DELAY_SECONDS - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        imsis = list(state.snapshot().subscribers)
+        for i in range(0, len(imsis), STREAM_CHUNK_UES):
+            publisher.produce(_step_message(imsis[i:i + STREAM_CHUNK_UES], index, step), key=str(index))
+        # A publisher that fell behind skips to the live step instead of replaying the backlog
+        index = max(index + 1, _live_step(step))
+
+def start_monitoring_publisher(bootstrap_servers: str, topic: str, step: float = STREAM_STEP_SECONDS):
+    publisher = KafkaPublisher(bootstrap_servers, topic)
+    threading.Thread(target=_publish_monitoring, args=(publisher, step), name="kafka-monitoring",
+                     daemon=True).start()
+    print(f"Publishing monitoring samples to Kafka topic {topic} at {bootstrap_servers}")
+    return publisher
+
+# -------------------------
+# Persistence
+# -------------------------
+
+def _open_state_log(directory: str) -> StateLog:
+    # Restores the latest snapshot, replays the log written after it, then keeps logging. The
+    # snapshot captures the (immutable) tables of state.snapshot(), and pickles them unlocked.
+    started = time.perf_counter()
+    log = StateLog(directory, state.capture, fsync=os.environ.get("CNC_STATE_FSYNC") == "1", lock=state.lock)
+    # Restoring an older snapshot or a long log allocates millions of objects that all stay alive:
+    # collecting meanwhile would only rescan them, and freezing them afterwards keeps later
+    # collections from doing so
+    gc.disable()
+    try:
+        saved, records = log.recover()
+        with state.write() as tx:
+            if saved is not None:
+                state.restore(saved)
+            for name, args in records:
+                _journaled_ops[name](tx, *args)
+    finally:
+        gc.freeze()
+        gc.enable()
+    print(f"Restored CNC state from {directory} in {time.perf_counter() - started:.2f}s: "
+          f"{len(state.snapshot().subscribers)} subscribers, {len(records)} log records replayed")
+    atexit.register(log.close)
+    return log
+
+@app.after_request
+def _commit_state(response):
+    # One log write (and fsync) per request, however many records it appended
+    if state_log is not None:
+        state_log.commit()
+    return response
+
+if CNC_STATE_DIR:
+    state_log = _open_state_log(CNC_STATE_DIR)
+
+if CNC_KAFKA_BOOTSTRAP:
+    start_monitoring_publisher(CNC_KAFKA_BOOTSTRAP, CNC_KAFKA_TOPIC)
+
 # -------------------------
 # Entrypoint
 # -------------------------
@@ -1,25 +1,68 @@
+import argparse
+import asyncio
 import json
 import pandas as pd
 import numpy as np
-from joblib import load
-import requests
 import time
 from confluent_kafka import Consumer, KafkaError, KafkaException
-from influxdb_client import InfluxDBClient, Point, WritePrecision
-from influxdb_client.client.write_api import SYNCHRONOUS
 import os
-from datetime import datetime, timezone
-
-# Load the trained model and scaler
-clf_ensemble = load('traffic_model.joblib')
-scaler = load('scaler.joblib')
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from cnc_client import CNCClient
+from model_registry import ModelRegistry
+from csv_writer import BufferedCSVWriter
+from partition_store import PartitionedWriter, partition_root
+from influx_sink import FileLineSink, InfluxDBSink
+from itertools import groupby
+from monitoring_stream import MONITORING_TOPIC, KafkaSource, LocalBroker, SSESource, message_frame, samples_message
+from traffic_generator import TrafficGenerator
 
 # Define the features
 features = ['URLLC_Sent_thrp_Mbps', 'URLLC_BytesSent', 'URLLC_BytesReceived', 'URLLC_Received_thrp_Mbps']
 
+# Load the trained model and scaler, or the compiled model exported from them by serving_model.py;
+# a retrained model copied over the files is swapped in without a restart once the registry's
+# watcher is started (see --model-check-interval)
+model_registry = ModelRegistry('traffic_model.joblib', 'scaler.joblib', features, compiled_path='traffic_model.npz')
+
 # CSV file to store predictions
 alerts_csv_path = 'traffic_change_alerts_1.csv'
 monitoring_csv_path = 'monitoring-1.csv'
+# Both histories have a row per UE, told apart by imsi as in the InfluxDB sink's tags
+monitoring_columns = ['timestamp', 'imsi', 'URLLC_BytesReceived', 'URLLC_BytesSent',
+                      'URLLC_Received_thrp_Mbps', 'URLLC_Sent_thrp_Mbps']
+alerts_columns = ['timestamp', 'imsi', 'alertType']
+
+# Column types of the columnar history files, the timestamp is always stored as UTC timestamp
+monitoring_dtypes = {column: 'float64' for column in monitoring_columns if column not in ('timestamp', 'imsi')}
+monitoring_dtypes['imsi'] = 'string'
+alerts_dtypes = {'imsi': 'string', 'alertType': 'string'}
+
+# Rows are buffered and appended by background writers, flushed every CSV_FLUSH_ROWS rows
+# or CSV_FLUSH_INTERVAL seconds, and on exit
+CSV_FLUSH_ROWS = 1000
+CSV_FLUSH_INTERVAL = 1.0
+
+def configure_writers(max_rows=CSV_FLUSH_ROWS, flush_interval=CSV_FLUSH_INTERVAL, fsync=False, storage='csv'):
+    # storage 'csv' appends to the CSV files, 'parquet'/'feather' writes hourly columnar partitions
+    # into a directory named after each CSV file (monitoring-1/, traffic_change_alerts_1/)
+    global monitoring_writer, alerts_writer
+    for writer in (globals().get('monitoring_writer'), globals().get('alerts_writer')):
+        if writer is not None:
+            writer.close()
+    if storage == 'csv':
+        monitoring_writer = BufferedCSVWriter(monitoring_csv_path, monitoring_columns, max_rows, flush_interval, fsync)
+        alerts_writer = BufferedCSVWriter(alerts_csv_path, alerts_columns, max_rows, flush_interval, fsync)
+    else:
+        monitoring_writer = PartitionedWriter(partition_root(monitoring_csv_path), monitoring_columns, monitoring_dtypes,
+                                              max_rows, flush_interval, fsync, storage)
+        alerts_writer = PartitionedWriter(partition_root(alerts_csv_path), alerts_columns, alerts_dtypes,
+                                          max_rows, flush_interval, fsync, storage)
+
+configure_writers()
 
 # InfluxDB configuration
 influxdb_url = 'http://localhost:8086'
@@ -27,9 +70,20 @@ token = 'your_influxdb_token'
 org = 'your_org'
 bucket = 'your_bucket'
 
-# Connect to InfluxDB
-client = InfluxDBClient(url=influxdb_url, token=token, org=org)
-write_api = client.write_api(write_options=SYNCHRONOUS)
+# Optional time-series sink for monitoring samples and alert predictions, see configure_influx_sink
+influx_sink = None
+
+def configure_influx_sink(kind, testbed_id, path='influx-points.lp', batch_size=5000, flush_interval=1.0):
+    global influx_sink
+    tags = {'testbed-id': str(testbed_id)}
+    if kind == 'influxdb':
+        influx_sink = InfluxDBSink(influxdb_url, token, org, bucket, tags=tags,
+                                   batch_size=batch_size, flush_interval=flush_interval)
+    elif kind == 'file':
+        influx_sink = FileLineSink(path, tags=tags, batch_size=batch_size, flush_interval=flush_interval)
+    else:
+        influx_sink = None
+    return influx_sink
 
 # Define the flag
 traffic_flag = 0
@@ -37,9 +91,70 @@ action_flag = 0
 scenario_flag = 1
 counter = 0
 
+# UE polled when the testbed JSON does not list any 'monitored-users'
+DEFAULT_IMSI = "999991000000001"
+
+# Upper bound on concurrent monitoring-report requests per tick
+MAX_FETCH_WORKERS = 32
+fetch_executor = ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS, thread_name_prefix='fetch')
+
+# Per-call timeouts (seconds) for monitoring fetches and actuation calls
+FETCH_TIMEOUT = 10
+ACTION_TIMEOUT = 5
+
+# UEs moved between slices per bulk subscriber update call
+BULK_CHUNK = 1000
+BULK_ENDPOINT = '/api/v1.0/cnc-subscriber-management/bulk'
+
+# Shared keep-alive client for every CNC API call, see configure_cnc_client
+CNC_BASE_URL = "http://127.0.0.1:3000"
+MONITORING_ENDPOINT = "GET /api/v1.0/cnc/monitoring-report"
+
+# Batched monitoring report: one call per MONITORING_BATCH_UES UEs returns the last
+# MONITORING_STEP seconds of each, the sampling interval of the datasets the model was
+# trained on. '--fetch per-ue' goes back to one monitoring-report call per UE.
+MONITORING_BATCH_URL = "/api/v1.0/cnc/monitoring-report/batch"
+MONITORING_BATCH_UES = 5000
+MONITORING_STEP = 5
+FETCH_MODE = 'batch'
+
+# Push pipeline (--mode stream): samples of each step arrive from the CNC monitoring stream
+# (server-sent events), a Kafka topic, or an in-process broker fed from the traffic model;
+# at most STREAM_MAX_MESSAGES messages are taken per poll
+MONITORING_STREAM_URL = "/api/v1.0/cnc/monitoring-stream"
+STREAM_MAX_MESSAGES = 10
+
+# Attempts at a stream step before it is skipped, and seconds before the first retry (doubled
+# after every further failure)
+STREAM_STEP_ATTEMPTS = 3
+STREAM_RETRY_DELAY = 1.0
+
+# Print the per-endpoint CNC latency histograms every this many ticks
+STATS_EVERY_TICKS = 12
+
+def configure_cnc_client(pool_size=MAX_FETCH_WORKERS, retries=3, backoff_factor=0.2):
+    global cnc
+    cnc = CNCClient(base_url=CNC_BASE_URL, pool_size=pool_size, retries=retries, backoff_factor=backoff_factor,
+                    default_timeout=ACTION_TIMEOUT,
+                    timeouts={MONITORING_ENDPOINT: FETCH_TIMEOUT, f"POST {MONITORING_BATCH_URL}": FETCH_TIMEOUT})
+    return cnc
+
+cnc = configure_cnc_client()
+
+# Counters reported by the async fixed-rate scheduler
+scheduler_stats = {'ticks': 0, 'missed_deadlines': 0, 'last_tick_seconds': 0.0, 'skipped_steps': 0}
+
+# UEs currently provisioned to the capped slice
+capped_imsis = []
+
+def monitored_imsis(testbed):
+    # IMSIs to classify every tick, de-duplicated while keeping the configured order
+    imsis = testbed.get('monitored-users') or [DEFAULT_IMSI]
+    return list(dict.fromkeys(str(imsi) for imsi in imsis))
+
 def fetch_data_from_api(
-    imsi: str = "999991000000001",
-    base_url: str = "http://127.0.0.1:3000",
+    imsi: str = DEFAULT_IMSI,
+    base_url: str = CNC_BASE_URL,
     window_seconds: int = 25 * 60
 ):
     try:
@@ -58,175 +173,425 @@ def fetch_data_from_api(
         params["start"] = start_dt.astimezone(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
 
         url = f"{base_url}/api/v1.0/cnc/monitoring-report"
-        response = requests.get(url, params=params, timeout=10)
+        response = cnc.get(url, params=params)
 
         if response.status_code == 200:
             row = response.json()
+            row['imsi'] = imsi
             return pd.DataFrame([row])
         else:
-            print(f"Failed to fetch data from API. Status code: {response.status_code} | body: {response.text}")
+            print(f"Failed to fetch data from API for IMSI {imsi}. Status code: {response.status_code} | body: {response.text}")
             return None
     except Exception as e:
-        print(f"Error fetching data from API: {e}")
+        print(f"Error fetching data from API for IMSI {imsi}: {e}")
         return None
 
+def fetch_monitoring_batch(imsis, step=MONITORING_STEP):
+    # One batched report call: a row with the last step seconds of each UE
+    end_dt = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(seconds=3)
+    params = {
+        "imsis": imsis,
+        "start": (end_dt - timedelta(seconds=step)).isoformat().replace("+00:00", "Z"),
+        "end": end_dt.isoformat().replace("+00:00", "Z"),
+        "step": step,
+    }
+    try:
+        response = cnc.post(MONITORING_BATCH_URL, json=params)
+        if response.status_code != 200:
+            print(f"Failed to fetch the batched report for {len(imsis)} UE(s). Status code: {response.status_code} | body: {response.text}")
+            return None
+        report = response.json()
+    except Exception as e:
+        print(f"Error fetching the batched report for {len(imsis)} UE(s): {e}")
+        return None
+    if report["missing"]:
+        print(f"No monitoring data for unknown IMSI(s): {', '.join(report['missing'])}")
+    data = pd.DataFrame(report["columns"])
+    return data if len(data) else None
+
+def monitoring_calls(imsis):
+    # (function, argument) of every fetch needed for the given UEs
+    if FETCH_MODE == 'per-ue':
+        return [(fetch_data_from_api, imsi) for imsi in imsis]
+    return [(fetch_monitoring_batch, imsis[i:i + MONITORING_BATCH_UES])
+            for i in range(0, len(imsis), MONITORING_BATCH_UES)]
+
+def fetch_batch_from_api(imsis):
+    # Fetch the monitoring rows of all UEs concurrently and stack them into one DataFrame
+    frames = [frame for frame in fetch_executor.map(lambda call: call[0](call[1]), monitoring_calls(imsis))
+              if frame is not None]
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True)
+
 def save_monitoring_data_to_csv(data):
-    # Append the monitoring data to the CSV file, ensuring it is not overwritten between runs
-    file_exists = os.path.isfile(monitoring_csv_path)
+    # Queue the monitoring rows for the background CSV writer, which appends them in batches
+    monitoring_writer.write_rows(data[monitoring_columns].itertuples(index=False, name=None))
 
-    # Prepare the data for saving
-    data_to_save = data[['timestamp', 'URLLC_BytesReceived', 'URLLC_BytesSent',
-                         'URLLC_Received_thrp_Mbps',
-                         'URLLC_Sent_thrp_Mbps']]
+# Function to save predictions to CSV
+def save_prediction_to_csv(timestamp, imsi, alert_type):
+    alerts_writer.write_row((timestamp, imsi, alert_type))
+
+def save_predictions_to_csv(timestamp, imsis, alert_types):
+    alerts_writer.write_rows((timestamp, imsi, alert_type) for imsi, alert_type in zip(imsis, alert_types))
+
+def cap_ues(testbed, imsis, create_slice):
+    # Plan the CNC calls capping the given UEs. The calls are returned as phases that
+    # run one after the other; the calls inside a phase are independent of each other.
+    phases = []
+
+    # scenario 0 - update unprioritized UE profile with diminished throughput cap
+    if scenario_flag == 0:
+        if not create_slice:
+            return phases
+
+        json_data = {
+            "_id": "profile",
+            "dnn": "internet",             # must match an allowed DNN in the engine
+            "5gQosProfile": {"5qi": 9},    # accepted 5qi in the mock
+            "sessionAmbr": {
+                "downlink": f"{testbed['downlink-ambr-value']} {testbed['downlink-ambr-unit']}",
+                "uplink":   f"{testbed['uplink-ambr-value']} {testbed['uplink-ambr-unit']}",
+            }
+        }
 
-    # Save the data to the CSV file
-    data_to_save.to_csv(monitoring_csv_path, mode='a', header=not file_exists, index=False)
+        phases.append([('PUT', '/api/v1.0/cnc-configuration/cnc-subscription-profile/profile', json_data)])
+
+    # scenario 1 - create new capped slice and provision the unprioritized UEs to it
+    elif scenario_flag == 1:
+        if create_slice:
+            json_data1 = {
+                "sliceName": "slice-nemo",
+                "activate_slice": 1,  # run validation against mock RAN
+                "SliceDescription": "Lab slice with throughput caps",
+                "ServiceProfile": {
+                    "PLMNIdList": [{"mcc": "999", "mnc": "99"}],
+                    "SNSSAIList": [{"sst": 1, "sd": "000002"}],
+                    "dnn": "internet",
+
+                    # Throughput caps (both per-slice and per-UE for convenience)
+                    "DLThptPerSlice": {"value": testbed["downlink-ambr-value"],
+                                       "unit": testbed["downlink-ambr-unit"]},
+                    "ULThptPerSlice": {"value": testbed["uplink-ambr-value"],
+                                       "unit": testbed["uplink-ambr-unit"]},
+                    "DLThptPerUE": {"value": testbed["downlink-ambr-value"],
+                                    "unit": testbed["downlink-ambr-unit"]},
+                    "ULThptPerUE": {"value": testbed["uplink-ambr-value"],
+                                    "unit": testbed["uplink-ambr-unit"]},
+                },
+                "NetworkSliceSubnet": {
+                    "EpTransport": {
+                        "qosProfile": 9,
+                        "epApplication": ["internet"]
+                    }
+                }
+            }
 
-# Function to save predictions to CSV
-def save_prediction_to_csv(timestamp, alert_type):
-    # Create a DataFrame with the new prediction
-    new_data = pd.DataFrame([[timestamp, alert_type]], columns=['timestamp', 'alertType'])
+            phases.append([('POST', '/api/v1.0/network-slice/slice-instance', json_data1)])
 
-    # Append the new prediction to the CSV file, ensuring it is not overwritten between runs
-    file_exists = os.path.isfile(alerts_csv_path)
-    new_data.to_csv(alerts_csv_path, mode='a', header=not file_exists, index=False)
+        phases.append(move_ues(imsis, "slice-nemo"))
 
-def process_and_predict(testbed):
-    global traffic_flag
-    global action_flag
-    global scenario_flag
-    global counter
-    # Fetch the data
-    data = fetch_data_from_api()
-    if data is not None:
-        # Save monitoring data to CSV
-        save_monitoring_data_to_csv(data)
-
-        # Extract the features and scale them
-        X_test = data[features]
-        X_test_scaled = scaler.transform(X_test)
-
-        # Make predictions
-        y_test_pred = clf_ensemble.predict(X_test_scaled)
-
-        # Get the current timestamp
-        current_timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f UTC')
-
-        # Save each prediction to the CSV
-        for prediction in y_test_pred:
-            save_prediction_to_csv(current_timestamp, prediction)
-
-        imsi = "999991000000001"
-        if action_flag == 0:
-            print("Decision engine running. Fetching traffic data.")
-
-        # Check if the traffic is estimated as high
-        if 'high' in y_test_pred and counter != 9:
-            traffic_flag = 1
-            counter = counter + 1
-            print("Traffic is high, setting flag to 1.")
-            if action_flag == 0:
-                action_flag = 1
-                # scenario 0 - update unprioritized UE profile with diminished throughput cap
-                if scenario_flag == 0:
-                    headers = {
-                        'Content-Type': 'application/json',
-                    }
+    return phases
 
-                    json_data = {
-                        "_id": "profile",
-                        "dnn": "internet",             # must match an allowed DNN in the engine
-                        "5gQosProfile": {"5qi": 9},    # accepted 5qi in the mock
-                        "sessionAmbr": {
-                            "downlink": f"{testbed['downlink-ambr-value']} {testbed['downlink-ambr-unit']}",
-                            "uplink":   f"{testbed['uplink-ambr-value']} {testbed['uplink-ambr-unit']}",
-                        }
-                    }
+def release_ues(imsis):
+    # Plan the CNC calls reverting the given UEs, phased like cap_ues
+    phases = []
+
+    # scenario 0 - revert unprioritized UE profile to default throughput cap
+    if scenario_flag == 0:
+        json_data = {
+            "_id": "profile",
+            "dnn": "internet",  # must match an allowed DNN in the engine
+            "5gQosProfile": {"5qi": 9},  # accepted 5qi in the mock
+            "sessionAmbr": {
+                "downlink": 100,
+                "uplink": 100,
+            }
+        }
 
-                    response = requests.put('http://127.0.0.1:3000/api/v1.0/cnc-configuration/cnc-subscription-profile/profile', headers=headers, json=json_data)
+        phases.append([('PUT', '/api/v1.0/cnc-configuration/cnc-subscription-profile/profile', json_data)])
 
-                # scenario 1 - create new capped slice and provision the unprioritized UE to it
-                elif scenario_flag == 1:
-                    headers = {
-                        'Content-Type': 'application/json',
-                    }
+    # scenario 1 - re-provision the unprioritized UEs to the default slice and delete capped slice
+    elif scenario_flag == 1:
+        phases.append(move_ues(imsis, "slice-default"))
+        phases.append([('DELETE', '/api/v1.0/network-slice/slice-instance/slice-nemo', None)])
 
-                    json_data1 = {
-                        "sliceName": "slice-nemo",
-                        "activate_slice": 1,  # run validation against mock RAN
-                        "SliceDescription": "Lab slice with throughput caps",
-                        "ServiceProfile": {
-                            "PLMNIdList": [{"mcc": "999", "mnc": "99"}],
-                            "SNSSAIList": [{"sst": 1, "sd": "000002"}],
-                            "dnn": "internet",
-
-                            # Throughput caps (both per-slice and per-UE for convenience)
-                            "DLThptPerSlice": {"value": testbed["downlink-ambr-value"],
-                                               "unit": testbed["downlink-ambr-unit"]},
-                            "ULThptPerSlice": {"value": testbed["uplink-ambr-value"],
-                                               "unit": testbed["uplink-ambr-unit"]},
-                            "DLThptPerUE": {"value": testbed["downlink-ambr-value"],
-                                            "unit": testbed["downlink-ambr-unit"]},
-                            "ULThptPerUE": {"value": testbed["uplink-ambr-value"],
-                                            "unit": testbed["uplink-ambr-unit"]},
-                        },
-                        "NetworkSliceSubnet": {
-                            "EpTransport": {
-                                "qosProfile": 9,
-                                "epApplication": ["internet"]
-                            }
-                        }
-                    }
+    return phases
 
-                    json_data2 = {
-                        "imsi": imsi,
-                        "profile": "profile",
-                        "slice": "slice-nemo"
-                    }
+def move_ues(imsis, slice_name):
+    # Bulk PUT calls provisioning the UEs to slice_name, BULK_CHUNK UEs per call
+    subscribers = [{"imsi": imsi, "profile": "profile", "slice": slice_name} for imsi in imsis]
+    return [('PUT', BULK_ENDPOINT, subscribers[i:i + BULK_CHUNK])
+            for i in range(0, len(subscribers), BULK_CHUNK)]
 
-                    response1 = requests.post('http://127.0.0.1:3000/api/v1.0/network-slice/slice-instance', headers=headers, json=json_data1)
-                    response2 = requests.put('http://127.0.0.1:3000/api/v1.0/cnc-subscriber-management/999991000000001', headers=headers, json=json_data2)
-
-        elif counter == 9:
-            traffic_flag = 0
-            print("Traffic is normal, setting flag to 0.")
-            if action_flag == 1:
-                action_flag = 0
-                # scenario 0 - revert unprioritized UE profile to default throughput cap
-                if scenario_flag == 0:
-                    headers = {
-                        'Content-Type': 'application/json',
-                    }
+def send_action(method, url, json_data):
+    try:
+        response = cnc.request(method, url, json=json_data)
+    except Exception as e:
+        print(f"Error calling {method} {url}: {e}")
+        return None
+    if url == BULK_ENDPOINT:
+        report_bulk_failures(method, response)
+    return response
 
-                    json_data = {
-                        "_id": "profile",
-                        "dnn": "internet",  # must match an allowed DNN in the engine
-                        "5gQosProfile": {"5qi": 9},  # accepted 5qi in the mock
-                        "sessionAmbr": {
-                            "downlink": 100,
-                            "uplink": 100,
-                        }
-                    }
+def report_bulk_failures(method, response):
+    # A bulk call applies the valid items even when others fail; log the ones that did
+    try:
+        results = response.json().get("results", [])
+    except Exception:
+        print(f"Bulk {method} returned {response.status_code} without per-item results")
+        return
+    for item in results:
+        if item.get("status") != 200:
+            print(f"Bulk {method} failed for IMSI {item.get('imsi')}: {item.get('status')} {item.get('detail')}")
 
-                    response = requests.put('http://127.0.0.1:3000/api/v1.0/cnc-configuration/cnc-subscription-profile/profile', headers=headers, json=json_data)
+def run_actions(phases):
+    for phase in phases:
+        for method, url, json_data in phase:
+            send_action(method, url, json_data)
 
-                # scenario 1 - re-provision the unprioritized UE to the default slice and delete capped slice
-                elif scenario_flag == 1:
-                    headers = {
-                        'Content-Type': 'application/json',
-                    }
+def classify(data):
+    # Save monitoring data to CSV
+    save_monitoring_data_to_csv(data)
 
-                    json_data2 = {
-                        "imsi": imsi,
-                        "profile": "profile",
-                        "slice": "slice-default"
-                    }
+    # Extract the features and scale them, one vectorized call for all UEs
+    model = model_registry.current()
+    X_test = data[features]
+    X_test_scaled = model.scaler.transform(X_test) if model.scaler is not None else X_test
+
+    # Make predictions
+    y_test_pred = model.model.predict(X_test_scaled)
+
+    # Get the current timestamp
+    current_timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f UTC')
 
-                    response2 = requests.put('http://127.0.0.1:3000/api/v1.0/cnc-subscriber-management/999991000000001', headers=headers, json=json_data2)
-                    response1 = requests.delete('http://127.0.0.1:3000/api/v1.0/network-slice/slice-instance/slice-nemo',headers=headers)
+    # Save each prediction to the CSV
+    save_predictions_to_csv(current_timestamp, data['imsi'], y_test_pred)
+
+    # Queue the same samples and predictions as time-series points
+    if influx_sink is not None:
+        influx_sink.write_monitoring(data)
+        influx_sink.write_alerts(data['imsi'], y_test_pred)
+
+    return y_test_pred
+
+def decide(testbed, data, y_test_pred):
+    global traffic_flag
+    global action_flag
+    global scenario_flag
+    global counter
+    global capped_imsis
+
+    if action_flag == 0:
+        print(f"Decision engine running. Fetching traffic data for {len(data)} UE(s).")
+
+    # UEs whose traffic is estimated as high
+    high_imsis = data.loc[y_test_pred == 'high', 'imsi'].tolist()
+
+    # Check if the traffic is estimated as high
+    if high_imsis and counter != 9:
+        traffic_flag = 1
+        counter = counter + 1
+        print(f"Traffic is high for {len(high_imsis)} UE(s), setting flag to 1.")
+        new_imsis = [imsi for imsi in high_imsis if imsi not in capped_imsis]
+        if action_flag == 0 or new_imsis:
+            phases = cap_ues(testbed, new_imsis, create_slice=action_flag == 0)
+            action_flag = 1
+            capped_imsis = capped_imsis + new_imsis
+            return phases
+
+    elif counter == 9:
+        traffic_flag = 0
+        print("Traffic is normal, setting flag to 0.")
+        if action_flag == 1:
+            action_flag = 0
+            phases = release_ues(capped_imsis)
+            capped_imsis = []
+            return phases
+
+    return []
+
+def process_and_predict(testbed):
+    # Fetch the data of every monitored UE
+    data = fetch_batch_from_api(monitored_imsis(testbed))
+    if data is not None:
+        y_test_pred = classify(data)
+        run_actions(decide(testbed, data, y_test_pred))
+
+def report_stats(tick):
+    if tick % STATS_EVERY_TICKS == 0:
+        print(f"CNC API latency after {tick} ticks:\n{cnc.format_latency_report()}")
+        print(f"Model: {model_registry.metrics()}")
+
+async def call_with_timeout(semaphore, timeout, func, *args):
+    # Run a blocking call on the I/O pool, bounded by the semaphore and a per-call timeout
+    loop = asyncio.get_running_loop()
+    async with semaphore:
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(fetch_executor, func, *args), timeout)
+        except asyncio.TimeoutError:
+            print(f"Call {func.__name__}{args[:2]} timed out after {timeout} s")
+            return None
+
+async def process_and_predict_async(testbed, semaphore):
+    loop = asyncio.get_running_loop()
+
+    # Fetch the data of every monitored UE concurrently
+    frames = await asyncio.gather(*(call_with_timeout(semaphore, FETCH_TIMEOUT, func, arg)
+                                    for func, arg in monitoring_calls(monitored_imsis(testbed))))
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        return
+    data = pd.concat(frames, ignore_index=True)
+
+    # Inference and CSV writes stay off the event loop
+    y_test_pred = await loop.run_in_executor(None, classify, data)
+
+    # Calls inside a phase go out concurrently, phases keep their order
+    for phase in decide(testbed, data, y_test_pred):
+        await asyncio.gather(*(call_with_timeout(semaphore, ACTION_TIMEOUT, send_action, *action)
+                               for action in phase))
+
+async def run_async(testbed, period, max_concurrency):
+    # Fixed-rate scheduler: ticks are due at start + k * period regardless of how long
+    # the work takes, and due ticks that already passed are skipped and counted as missed
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    next_tick = loop.time()
+
+    while True:
+        started = loop.time()
+        try:
+            await process_and_predict_async(testbed, semaphore)
+        except Exception as e:
+            print(f"Error in decision engine tick: {e}")
+        scheduler_stats['ticks'] += 1
+        scheduler_stats['last_tick_seconds'] = loop.time() - started
+        report_stats(scheduler_stats['ticks'])
+
+        next_tick += period
+        now = loop.time()
+        if now > next_tick:
+            missed = int((now - next_tick) // period) + 1
+            next_tick += missed * period
+            scheduler_stats['missed_deadlines'] += missed
+            print(f"Tick took {scheduler_stats['last_tick_seconds']:.3f} s, missed {missed} deadline(s) "
+                  f"({scheduler_stats['missed_deadlines']} in total over {scheduler_stats['ticks']} ticks)")
+        await asyncio.sleep(next_tick - loop.time())
+
+def start_local_feed(broker, imsis, step=MONITORING_STEP, topic=MONITORING_TOPIC, seed=0):
+    # Publishes traffic-model samples of the UEs to an in-process broker once per step
+    generator = TrafficGenerator(seed)
+
+    def feed():
+        while True:
+            end = time.time() // step * step
+            timestamp = datetime.fromtimestamp(end, timezone.utc).isoformat()
+            usage = generator.window(imsis, end - step, end)
+            columns = {'imsi': imsis, 'timestamp': [timestamp] * len(imsis),
+                       **{feature: usage[feature].tolist() for feature in features}}
+            broker.produce(topic, samples_message(timestamp, step, columns))
+            time.sleep(max(end + step - time.time(), 0))
+
+    threading.Thread(target=feed, name='local-feed', daemon=True).start()
+
+def open_monitoring_source(kind, testbed, kafka_bootstrap=None, topic=MONITORING_TOPIC):
+    imsis = monitored_imsis(testbed)
+    if kind == 'sse':
+        return SSESource(CNC_BASE_URL + MONITORING_STREAM_URL, params={'imsis': ','.join(imsis), 'step': MONITORING_STEP})
+    if kind == 'kafka':
+        return KafkaSource(kafka_bootstrap, topic)
+    broker = LocalBroker()
+    consumer = broker.consumer(topic, 'decision-engine')
+    start_local_feed(broker, imsis, topic=topic)
+    return consumer
+
+def act_on_step(testbed, data, timestamp):
+    # Classifies one step and runs its actions, retrying up to STREAM_STEP_ATTEMPTS times.
+    # decide() moves the engine's flags on, so a retry runs the phases it already decided
+    phases = None
+    for attempt in range(1, STREAM_STEP_ATTEMPTS + 1):
+        try:
+            if phases is None:
+                phases = decide(testbed, data, classify(data))
+            run_actions(phases)
+            return True
+        except Exception as e:
+            print(f"Error in decision engine step {timestamp} (attempt {attempt} of {STREAM_STEP_ATTEMPTS}): {e}")
+            if attempt < STREAM_STEP_ATTEMPTS:
+                time.sleep(STREAM_RETRY_DELAY * 2 ** (attempt - 1))
+    return False
+
+def run_stream(testbed, source, max_messages=STREAM_MAX_MESSAGES):
+    # Classify and act on every step as soon as its samples arrive. Offsets are committed
+    # after a poll's steps were acted upon, so a restarted engine resumes from the first
+    # unprocessed step; a slow engine leaves messages in the source, holding back the producer.
+    # A step that still fails after its retries is logged and skipped, so one bad step
+    # neither stalls the source nor gets acted upon again, late, after a restart
+    monitored = set(monitored_imsis(testbed))
+    tick = 0
+    while True:
+        messages = source.poll(max_messages, timeout=1.0)
+        # Messages of the same step (the Kafka publisher splits large steps) are decided together
+        for _, step_messages in groupby(messages, key=lambda message: message[1]['timestamp']):
+            step_messages = list(step_messages)
+            timestamp = step_messages[0][1]['timestamp']
+            data = message_frame(step_messages)
+            data = data[data['imsi'].isin(monitored)].reset_index(drop=True)
+            if len(data) and not act_on_step(testbed, data, timestamp):
+                scheduler_stats['skipped_steps'] += 1
+                print(f"Skipping decision engine step {timestamp} "
+                      f"({scheduler_stats['skipped_steps']} step(s) skipped in total)")
+            tick += 1
+            report_stats(tick)
+        if messages:
+            source.commit(messages[-1][0] + 1)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Slice manager decision engine')
+    parser.add_argument('--mode', choices=['sync', 'async', 'stream'], default='sync',
+                        help="'sync' runs the original poll-then-sleep loop, 'async' a fixed-rate asyncio loop, "
+                             "'stream' consumes pushed samples (see --stream-source)")
+    parser.add_argument('--stream-source', choices=['sse', 'kafka', 'local'], default='sse',
+                        help="'sse' reads the CNC monitoring stream, 'kafka' the --kafka-topic topic, "
+                             "'local' an in-process broker fed from the traffic model")
+    parser.add_argument('--kafka-bootstrap', default='localhost:9092', help='Kafka servers for --stream-source kafka')
+    parser.add_argument('--kafka-topic', default=MONITORING_TOPIC, help='topic the CNC publishes samples to')
+    parser.add_argument('--period', type=float, default=5, help='polling period in seconds')
+    parser.add_argument('--fetch', choices=['batch', 'per-ue'], default='batch',
+                        help="'batch' polls all UEs through the batched monitoring report, 'per-ue' one call per UE")
+    parser.add_argument('--max-concurrency', type=int, default=MAX_FETCH_WORKERS,
+                        help='maximum in-flight CNC API calls in async mode')
+    parser.add_argument('--pool-size', type=int, default=MAX_FETCH_WORKERS,
+                        help='keep-alive connections kept open to the CNC API')
+    parser.add_argument('--retries', type=int, default=3, help='retries per CNC API call')
+    parser.add_argument('--backoff', type=float, default=0.2, help='retry backoff factor in seconds')
+    parser.add_argument('--model-check-interval', type=float, default=5,
+                        help='seconds between checks for a retrained model on disk, 0 disables reloading')
+    parser.add_argument('--storage', choices=['csv', 'parquet', 'feather'], default='csv',
+                        help='format of the monitoring and alert history, columnar formats are partitioned by hour')
+    parser.add_argument('--csv-flush-rows', type=int, default=CSV_FLUSH_ROWS,
+                        help='flush the history files once this many rows are buffered')
+    parser.add_argument('--csv-flush-interval', type=float, default=CSV_FLUSH_INTERVAL,
+                        help='flush the history files at least every this many seconds')
+    parser.add_argument('--csv-fsync', action='store_true', help='fsync the history files after every flush')
+    parser.add_argument('--influx', choices=['off', 'influxdb', 'file'], default='off',
+                        help="also write points to InfluxDB, or to a local line-protocol file with 'file'")
+    parser.add_argument('--influx-file', default='influx-points.lp', help="line-protocol file used by '--influx file'")
+    parser.add_argument('--influx-batch-size', type=int, default=5000, help='points per InfluxDB write')
+    parser.add_argument('--influx-flush-interval', type=float, default=1.0,
+                        help='write queued points at least every this many seconds')
+    args = parser.parse_args()
+    configure_cnc_client(args.pool_size, args.retries, args.backoff)
+    FETCH_MODE = args.fetch
+    if args.model_check_interval > 0:
+        model_registry.watch(args.model_check_interval)
+    configure_writers(args.csv_flush_rows, args.csv_flush_interval, args.csv_fsync, args.storage)
+
+    # Exit through SystemExit on SIGTERM so the history writers flush their buffers
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     testbed_id = 1
     filename = f'testbed-{testbed_id}.json'
 
@@ -239,6 +604,16 @@ if __name__ == "__main__":
     except json.JSONDecodeError:
         print("Error: Failed to decode JSON.")
 
-    while True:
-        process_and_predict(testbed)
-        time.sleep(5)  # Wait for 5 seconds before polling the API again
\ No newline at end of file
+    configure_influx_sink(args.influx, testbed_id, args.influx_file, args.influx_batch_size, args.influx_flush_interval)
+
+    if args.mode == 'async':
+        asyncio.run(run_async(testbed, args.period, args.max_concurrency))
+    elif args.mode == 'stream':
+        run_stream(testbed, open_monitoring_source(args.stream_source, testbed, args.kafka_bootstrap, args.kafka_topic))
+    else:
+        tick = 0
+        while True:
+            process_and_predict(testbed)
+            tick += 1
+            report_stats(tick)
+            time.sleep(args.period)  # Wait before polling the API again
@@ -0,0 +1,215 @@
+import atexit
+import math
+import os
+import threading
+import time
+
+import pandas as pd
+from influxdb_client import InfluxDBClient, WritePrecision
+from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client.rest import ApiException
+
+# Monitoring columns written as fields of the 'performance' measurement
+PERFORMANCE_FIELDS = ['URLLC_BytesReceived', 'URLLC_BytesSent', 'URLLC_Received_thrp_Mbps', 'URLLC_Sent_thrp_Mbps']
+
+
+def _escape_key(value):
+    # Measurement names, tag keys/values and field keys escape commas, spaces and equal signs
+    return str(value).replace('\\', '\\\\').replace(',', '\\,').replace(' ', '\\ ').replace('=', '\\=')
+
+
+def _format_field(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return f'{value}i'
+    if isinstance(value, float):
+        return repr(value)
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _valid_field(value):
+    # Line protocol has no null, NaN or infinity: such fields are left out of the point
+    return value is not None and not (isinstance(value, float) and not math.isfinite(value))
+
+
+def to_line_protocol(measurement, tags, fields, timestamp_ns):
+    # None when no field is left, a point needs at least one
+    tag_set = ''.join(f',{_escape_key(k)}={_escape_key(v)}' for k, v in sorted(tags.items()) if v not in (None, ''))
+    field_set = ','.join(f'{_escape_key(k)}={_format_field(v)}' for k, v in fields.items() if _valid_field(v))
+    if not field_set:
+        return None
+    return f'{_escape_key(measurement)}{tag_set} {field_set} {int(timestamp_ns)}'
+
+
+class BatchingLineSink:
+    '''
+    Non-blocking sink for line-protocol points. Points are queued by the caller and shipped
+    by a background thread in batches of batch_size, or every flush_interval seconds.
+    A batch that fails to send goes to a retry queue and is retried with exponential
+    backoff; once more than max_retry_points are waiting the oldest points are dropped.
+    A batch the backend rejects as invalid (see _rejected()) would fail again, so it is
+    dropped and counted instead of retried. Subclasses implement _send(lines).
+    '''
+
+    def __init__(self, tags=None, batch_size=5000, flush_interval=1.0, retry_interval=1.0,
+                 max_retry_interval=60.0, max_retry_points=100000):
+        self.tags = dict(tags or {})
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.max_retry_points = max_retry_points
+        self.stats = {'written': 0, 'failed_batches': 0, 'dropped': 0, 'rejected': 0}
+
+        self._pending = []
+        self._retry = []
+        self._retry_pending = False
+        self._next_retry = 0.0
+        self._retry_delay = retry_interval
+        self._closed = False
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write_lines(self, lines):
+        with self._cond:
+            if self._closed:
+                raise ValueError('sink is closed')
+            self._pending.extend(lines)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def write_monitoring(self, data):
+        # One 'performance' point per monitoring row, timestamped with the row's window end
+        timestamps = pd.to_datetime(data['timestamp'], utc=True, format='ISO8601').dt.as_unit('ns').astype('int64')
+        imsis = data['imsi'] if 'imsi' in data else [None] * len(data)
+        lines = []
+        for imsi, ts, values in zip(imsis, timestamps, data[PERFORMANCE_FIELDS].itertuples(index=False, name=None)):
+            fields = {name: float(value) for name, value in zip(PERFORMANCE_FIELDS, values)}
+            line = to_line_protocol('performance', {**self.tags, 'imsi': imsi}, fields, ts)
+            if line is not None:
+                lines.append(line)
+        self.write_lines(lines)
+
+    def write_alerts(self, imsis, alert_types, timestamp_ns=None):
+        timestamp_ns = timestamp_ns or time.time_ns()
+        self.write_lines([to_line_protocol('alerts', {**self.tags, 'imsi': imsi}, {'alertType': str(alert_type)}, timestamp_ns)
+                          for imsi, alert_type in zip(imsis, alert_types)])
+
+    def flush(self):
+        self._drain(force=True)
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self._drain(force=closed)
+            if closed:
+                return
+
+    def _drain(self, force=False):
+        with self._io_lock:
+            with self._cond:
+                # Retried points go first so the backend sees points in the order they were queued
+                lines = self._retry + self._pending
+                self._retry, self._pending = [], []
+                if not lines:
+                    return
+                # While a failed batch waits out its backoff, fresh points queue up behind it
+                if self._retry_pending and not force and time.monotonic() < self._next_retry:
+                    self._requeue(lines)
+                    return
+
+            for start in range(0, len(lines), self.batch_size):
+                batch = lines[start:start + self.batch_size]
+                try:
+                    self._send(batch)
+                except Exception as e:
+                    if self._rejected(e):
+                        print(f"{type(self).__name__} rejected {len(batch)} point(s), dropping them: {e}")
+                        self.stats['rejected'] += len(batch)
+                        continue
+                    print(f"Failed to write {len(batch)} point(s) to {type(self).__name__}: {e}")
+                    self.stats['failed_batches'] += 1
+                    with self._cond:
+                        self._requeue(lines[start:])
+                    self._retry_pending = True
+                    self._next_retry = time.monotonic() + self._retry_delay
+                    self._retry_delay = min(self._retry_delay * 2, self.max_retry_interval)
+                    return
+                self.stats['written'] += len(batch)
+
+            self._retry_pending = False
+            self._retry_delay = self.retry_interval
+
+    def _requeue(self, lines):
+        # Called with _cond held; drops the oldest points once the retry queue is full
+        self._retry = lines + self._retry
+        overflow = len(self._retry) - self.max_retry_points
+        if overflow > 0:
+            del self._retry[:overflow]
+            self.stats['dropped'] += overflow
+
+    def _send(self, lines):
+        raise NotImplementedError
+
+    def _rejected(self, error):
+        # Whether a _send() error means the batch itself is invalid, so sending it again fails too
+        return False
+
+    def _close(self):
+        pass
+
+
+class InfluxDBSink(BatchingLineSink):
+    def __init__(self, url, token, org, bucket, **kwargs):
+        self.bucket = bucket
+        self.org = org
+        self._precision = WritePrecision.NS
+        self._client = InfluxDBClient(url=url, token=token, org=org)
+        # Batching and retries are done by the sink thread, each batch is one blocking write there
+        self._write_api = self._client.write_api(write_options=SYNCHRONOUS)
+        super().__init__(**kwargs)
+
+    def _send(self, lines):
+        self._write_api.write(bucket=self.bucket, org=self.org, record='\n'.join(lines), write_precision=self._precision)
+
+    def _rejected(self, error):
+        # Client errors other than throttling (429) come back the same however often the batch is sent
+        return isinstance(error, ApiException) and error.status is not None and 400 <= error.status < 500 \
+            and error.status != 429
+
+    def _close(self):
+        self._client.close()
+
+
+class FileLineSink(BatchingLineSink):
+    # Local stand-in for InfluxDB that appends the line-protocol batches to a file
+    def __init__(self, path, fsync=False, **kwargs):
+        self.path = path
+        self.fsync = fsync
+        self._file = open(path, 'a')
+        super().__init__(**kwargs)
+
+    def _send(self, lines):
+        self._file.write('\n'.join(lines) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _close(self):
+        self._file.close()
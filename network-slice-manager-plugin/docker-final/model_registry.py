@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from joblib import load
+
+from serving_model import ServingModel
+
+# Seconds a changed artifact must stay untouched before it is loaded, so a model that is
+# still being copied into place is not picked up half-written
+SETTLE_SECONDS = 1.0
+
+# One loaded model/scaler pair; callers take a version once per tick and use both from it.
+# A compiled model takes the raw features and comes without scaler.
+ModelVersion = namedtuple('ModelVersion', ['number', 'source', 'model', 'scaler', 'loaded_at', 'load_seconds',
+                                           'model_bytes', 'scaler_bytes', 'tree_nodes'])
+
+
+def _signature(path):
+    st = os.stat(path)
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _tree_nodes(model):
+    # Total decision tree nodes in the model, walking ensembles such as VotingClassifier
+    if isinstance(model, ServingModel):
+        return len(model.arrays['tree_feature'])
+    if hasattr(model, 'tree_'):
+        return int(model.tree_.node_count)
+    return sum(_tree_nodes(estimator) for estimator in getattr(model, 'estimators_', []))
+
+
+class ModelRegistry:
+    '''
+    Loads the traffic model and its scaler, and swaps in a new pair when either joblib file
+    changes on disk. Artifacts are loaded with mmap_mode so the large tree arrays are mapped
+    from the page cache rather than copied into the process (copy-on-write by default, as
+    libsvm refuses read-only buffers although it never writes to them). A new pair is
+    validated (the expected features, and a probe prediction) before it replaces the
+    current one; a pair that fails keeps the previous version serving until the files
+    change again. The swap is a single reference assignment, so a tick in progress
+    finishes on the version it took.
+
+    When compiled_path names a ServingModel exported by serving_model.py it is served
+    instead of the joblib pair, unless the joblib model is newer (retrained, not exported).
+    '''
+
+    def __init__(self, model_path, scaler_path, features, mmap_mode='c', compiled_path=None):
+        self.model_path = model_path
+        self.scaler_path = scaler_path
+        self.compiled_path = compiled_path
+        self.features = list(features)
+        self.mmap_mode = mmap_mode
+        self.stats = {'loads': 0, 'failed_loads': 0}
+        self._lock = threading.Lock()
+        self._signatures = None
+        self._rejected = None
+        self._current = None
+        self._watcher = None
+        self._stop = threading.Event()
+        self.reload(force=True)
+
+    def current(self):
+        return self._current
+
+    def _use_compiled(self):
+        if not self.compiled_path or not os.path.exists(self.compiled_path):
+            return False
+        if os.path.exists(self.model_path) and \
+                os.stat(self.model_path).st_mtime_ns > os.stat(self.compiled_path).st_mtime_ns:
+            return False
+        return True
+
+    def reload(self, force=False):
+        # Loads the artifacts if they changed since the last attempt; returns True on a swap
+        with self._lock:
+            compiled = self._use_compiled()
+            paths = (self.compiled_path,) if compiled else (self.model_path, self.scaler_path)
+            signatures = tuple(_signature(path) for path in paths)
+            if not force and signatures in (self._signatures, self._rejected):
+                return False
+            newest = max(signature[1] for signature in signatures) / 1e9
+            if not force and time.time() - newest < SETTLE_SECONDS:
+                return False
+
+            start = time.perf_counter()
+            try:
+                if compiled:
+                    model, scaler = ServingModel.load(self.compiled_path), None
+                else:
+                    model = load(self.model_path, mmap_mode=self.mmap_mode)
+                    scaler = load(self.scaler_path, mmap_mode=self.mmap_mode)
+                self._validate(model, scaler)
+            except Exception as e:
+                self.stats['failed_loads'] += 1
+                self._rejected = signatures
+                if self._current is None:
+                    raise
+                print(f"Keeping model version {self._current.number}, new artifacts were rejected: {e}")
+                return False
+
+            number = self._current.number + 1 if self._current else 1
+            source = 'compiled' if compiled else 'joblib'
+            self._current = ModelVersion(number, source, model, scaler, time.time(), time.perf_counter() - start,
+                                         signatures[0][2], signatures[1][2] if scaler is not None else 0,
+                                         _tree_nodes(model))
+            self._signatures = signatures
+            self.stats['loads'] += 1
+            print(f"Loaded {source} model version {number} in {self._current.load_seconds:.2f}s "
+                  f"({self._current.model_bytes} bytes, {self._current.tree_nodes} tree nodes)")
+            return True
+
+    def _validate(self, model, scaler):
+        checks = [('model', model, 'predict')] + ([('scaler', scaler, 'transform')] if scaler is not None else [])
+        for name, artifact, method in checks:
+            if not hasattr(artifact, method):
+                raise ValueError(f'{name} has no {method}()')
+            n_features = getattr(artifact, 'n_features_in_', len(self.features))
+            if n_features != len(self.features):
+                raise ValueError(f'{name} expects {n_features} features, not {len(self.features)}')
+        probe = pd.DataFrame(np.zeros((1, len(self.features))), columns=self.features)
+        prediction = model.predict(scaler.transform(probe) if scaler is not None else probe)
+        if len(prediction) != 1 or prediction[0] not in getattr(model, 'classes_', prediction):
+            raise ValueError(f'probe prediction {prediction!r} is not one of the model classes')
+
+    def watch(self, interval=5.0):
+        # Checks the artifacts every interval seconds from a background thread
+        if self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name='model-registry', daemon=True)
+        self._watcher.start()
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.reload()
+            except FileNotFoundError:
+                pass  # the artifacts are being replaced, try again on the next check
+
+    def stop(self):
+        self._stop.set()
+
+    def metrics(self):
+        version = self._current
+        return {'version': version.number, 'source': version.source, 'loaded_at': version.loaded_at, 'load_seconds': version.load_seconds,
+                'model_bytes': version.model_bytes, 'scaler_bytes': version.scaler_bytes,
+                'tree_nodes': version.tree_nodes, **self.stats}
@@ -0,0 +1,185 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from csv_tail import CSVTailReader
+
+# Columns summed per bucket: downlink/uplink throughput, RTT and the two byte counters
+ROLLUP_COLUMNS = ['URLLC_Received_thrp_Mbps', 'URLLC_Sent_thrp_Mbps', 'RTT', 'URLLC_BytesReceived', 'URLLC_BytesSent']
+
+MINUTE_NS = 60 * 10**9
+MINUTES_PER_HOUR = 60
+
+
+def _parse_timestamps(raw):
+    return pd.to_datetime(raw, format='ISO8601', utc=True, errors='coerce')
+
+
+def _values(rows):
+    # Missing columns (files written without RTT) count as NaN
+    return np.column_stack([pd.to_numeric(rows[column], errors='coerce').to_numpy(dtype=float)
+                            if column in rows else np.full(len(rows), np.nan)
+                            for column in ROLLUP_COLUMNS])
+
+
+def aggregate(rows):
+    # Row 0 holds the sums of ROLLUP_COLUMNS, row 1 how many values were not NaN (what pandas' mean() divides by)
+    values = _values(rows)
+    present = ~np.isnan(values)
+    return np.stack([np.where(present, values, 0.0).sum(axis=0), present.sum(axis=0)])
+
+
+class MonitoringRollup:
+    '''
+    Per-minute and per-hour rollups over a monitoring-<id>.csv file, each bucket holding the
+    sum and the non-NaN count of ROLLUP_COLUMNS. Buckets are updated from the rows appended
+    since the previous query. A [start, stop] window is answered from the hour buckets it
+    fully covers, the minute buckets around them and, for the partial minutes at either end,
+    the raw rows of just those minutes re-read from the file via their recorded byte range.
+    '''
+
+    def __init__(self, path):
+        self._reader = CSVTailReader(path)
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._minutes = {}
+        self._hours = {}
+        # Byte range [start, end) of the file covering every row of a minute
+        self._minute_ranges = {}
+        self.bad_rows = 0
+        self.bad_examples = []
+
+    def refresh(self):
+        reset, rows = self._reader.read_new(dtype={'timestamp': str})
+        if reset:
+            self._clear()
+        if rows is None:
+            return
+
+        starts = rows.index.to_numpy()
+        ends = np.append(starts[1:], self._reader.offset)
+        keep = ~rows.isna().all(axis=1).to_numpy()
+        rows, starts, ends = rows[keep], starts[keep], ends[keep]
+
+        timestamps = _parse_timestamps(rows['timestamp'])
+        bad = timestamps.isna().to_numpy()
+        if bad.any():
+            self.bad_rows += int(bad.sum())
+            self.bad_examples.extend(rows.loc[bad, 'timestamp'].head(3 - len(self.bad_examples)).tolist())
+        good = ~bad
+        if not good.any():
+            return
+
+        minutes = timestamps[good].dt.as_unit('ns').astype('int64').to_numpy() // MINUTE_NS
+        values = _values(rows[good])
+        starts, ends = starts[good], ends[good]
+
+        # Group the chunk by minute, then fold each minute into its minute and hour buckets
+        order = np.argsort(minutes, kind='stable')
+        minutes, values, starts, ends = minutes[order], values[order], starts[order], ends[order]
+        keys, first = np.unique(minutes, return_index=True)
+        present = ~np.isnan(values)
+        sums = np.add.reduceat(np.where(present, values, 0.0), first)
+        counts = np.add.reduceat(present, first)
+        range_starts = np.minimum.reduceat(starts, first)
+        range_ends = np.maximum.reduceat(ends, first)
+
+        for key, bucket_sum, bucket_count, range_start, range_end in zip(
+                keys.tolist(), sums, counts, range_starts.tolist(), range_ends.tolist()):
+            bucket = np.stack([bucket_sum, bucket_count])
+            self._add(self._minutes, key, bucket)
+            self._add(self._hours, key // MINUTES_PER_HOUR, bucket)
+            byte_range = self._minute_ranges.get(key)
+            if byte_range is None:
+                self._minute_ranges[key] = [range_start, range_end]
+            else:
+                byte_range[0] = min(byte_range[0], range_start)
+                byte_range[1] = max(byte_range[1], range_end)
+
+    @staticmethod
+    def _add(buckets, key, bucket):
+        current = buckets.get(key)
+        if current is None:
+            buckets[key] = bucket.copy()
+        else:
+            current += bucket
+
+    @staticmethod
+    def _sum_buckets(buckets, first, last):
+        # Sum of the buckets with first <= key <= last, walking whichever of the range or the dict is shorter
+        total = np.zeros((2, len(ROLLUP_COLUMNS)))
+        if last < first:
+            return total
+        if last - first + 1 <= len(buckets):
+            for key in range(first, last + 1):
+                bucket = buckets.get(key)
+                if bucket is not None:
+                    total += bucket
+        else:
+            for key, bucket in buckets.items():
+                if first <= key <= last:
+                    total += bucket
+        return total
+
+    def _partial_minute(self, minute, start_ns, stop_ns):
+        total = np.zeros((2, len(ROLLUP_COLUMNS)))
+        byte_range = self._minute_ranges.get(minute)
+        if byte_range is None:
+            return total
+        rows = self._reader.read_range(*byte_range, dtype={'timestamp': str})
+        if rows is None:
+            return total
+        timestamps = _parse_timestamps(rows['timestamp'])
+        ns = timestamps.dt.as_unit('ns').astype('int64').to_numpy()
+        # The byte range may also hold rows of other minutes when the file is not in time order
+        inside = timestamps.notna().to_numpy() & (ns // MINUTE_NS == minute) & (ns >= start_ns) & (ns <= stop_ns)
+        if inside.any():
+            total += aggregate(rows[inside])
+        return total
+
+    def window(self, start, stop):
+        # Sums and non-NaN counts of ROLLUP_COLUMNS over start <= timestamp <= stop
+        start_ns = pd.Timestamp(start).as_unit('ns').value
+        stop_ns = pd.Timestamp(stop).as_unit('ns').value
+        with self._lock:
+            self.refresh()
+            if stop_ns < start_ns:
+                return np.zeros((2, len(ROLLUP_COLUMNS)))
+
+            # Minutes lying entirely inside the window
+            first_minute = -(-start_ns // MINUTE_NS)
+            last_minute = (stop_ns + 1) // MINUTE_NS - 1
+            if first_minute > last_minute:
+                edges = {start_ns // MINUTE_NS, stop_ns // MINUTE_NS}
+                return sum(self._partial_minute(minute, start_ns, stop_ns) for minute in edges)
+
+            total = np.zeros((2, len(ROLLUP_COLUMNS)))
+            if start_ns < first_minute * MINUTE_NS:
+                total += self._partial_minute(start_ns // MINUTE_NS, start_ns, stop_ns)
+            if stop_ns >= (last_minute + 1) * MINUTE_NS:
+                total += self._partial_minute(stop_ns // MINUTE_NS, start_ns, stop_ns)
+
+            # Hours lying entirely inside the full minutes, and the minutes around them
+            first_hour = -(-first_minute // MINUTES_PER_HOUR)
+            last_hour = (last_minute + 1) // MINUTES_PER_HOUR - 1
+            if first_hour > last_hour:
+                return total + self._sum_buckets(self._minutes, first_minute, last_minute)
+            total += self._sum_buckets(self._hours, first_hour, last_hour)
+            total += self._sum_buckets(self._minutes, first_minute, first_hour * MINUTES_PER_HOUR - 1)
+            total += self._sum_buckets(self._minutes, (last_hour + 1) * MINUTES_PER_HOUR, last_minute)
+            return total
+
+
+_rollups = {}
+_rollups_lock = threading.Lock()
+
+
+def get_monitoring_rollup(path):
+    with _rollups_lock:
+        rollup = _rollups.get(path)
+        if rollup is None:
+            rollup = _rollups[path] = MonitoringRollup(path)
+        return rollup
@@ -0,0 +1,258 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+import requests
+from confluent_kafka import Consumer, KafkaError, KafkaException, Producer, TopicPartition
+
+# Topic the CNC publishes monitoring samples to
+MONITORING_TOPIC = 'cnc-monitoring'
+
+# Messages a producer may run ahead of the slowest consumer group before it blocks
+MAX_LAG = 1000
+
+# Decoded SSE events buffered between the reader thread and the consumer
+SSE_QUEUE_SIZE = 64
+
+
+def samples_message(end_ts, step, columns):
+    # A message carries the samples of one step for many UEs, columnar like the batched report
+    return {'timestamp': end_ts, 'step': step, 'columns': columns}
+
+
+def message_frame(messages):
+    # One DataFrame with the samples of every (offset, message) pair
+    frames = [pd.DataFrame(message['columns']) for _, message in messages]
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+class LocalBroker:
+    '''
+    In-process stand-in for a Kafka topic, for tests and for running the engine without a
+    broker. Every topic is an append-only list of messages numbered by offset; consumers
+    in a group share a committed offset. produce() blocks while the slowest group is
+    max_lag messages behind (or fails with queue.Full after timeout), so a stalled
+    consumer slows the producer down instead of growing the backlog.
+    '''
+
+    def __init__(self, max_lag=MAX_LAG):
+        self.max_lag = max_lag
+        self._topics = {}
+        self._committed = {}
+        self._cond = threading.Condition()
+
+    def produce(self, topic, value, timeout=None):
+        with self._cond:
+            log = self._topics.setdefault(topic, [])
+            if not self._cond.wait_for(lambda: len(log) - self._slowest(topic) < self.max_lag, timeout):
+                raise queue.Full(f'{topic} is {self.max_lag} messages ahead of its slowest consumer')
+            log.append(value)
+            self._cond.notify_all()
+            return len(log) - 1
+
+    def consumer(self, topic, group):
+        with self._cond:
+            self._topics.setdefault(topic, [])
+            self._committed.setdefault((topic, group), 0)
+        return LocalConsumer(self, topic, group)
+
+    def end_offset(self, topic):
+        with self._cond:
+            return len(self._topics.get(topic, ()))
+
+    def _slowest(self, topic):
+        offsets = [offset for (name, _), offset in self._committed.items() if name == topic]
+        return min(offsets) if offsets else len(self._topics[topic])
+
+    def _fetch(self, topic, position, max_messages, timeout):
+        with self._cond:
+            log = self._topics[topic]
+            self._cond.wait_for(lambda: len(log) > position, timeout)
+            end = min(len(log), position + max_messages)
+            return [(offset, log[offset]) for offset in range(position, end)]
+
+    def _commit(self, topic, group, offset):
+        with self._cond:
+            self._committed[(topic, group)] = max(self._committed[(topic, group)], offset)
+            self._cond.notify_all()
+
+
+class LocalConsumer:
+    # Consumer of a LocalBroker topic; poll() resumes from the group's committed offset
+
+    def __init__(self, broker, topic, group):
+        self.broker = broker
+        self.topic = topic
+        self.group = group
+        self.position = broker._committed[(topic, group)]
+
+    def poll(self, max_messages=100, timeout=1.0):
+        messages = self.broker._fetch(self.topic, self.position, max_messages, timeout)
+        if messages:
+            self.position = messages[-1][0] + 1
+        return messages
+
+    def commit(self, offset):
+        # Marks every message before offset as processed
+        self.broker._commit(self.topic, self.group, offset)
+
+    def lag(self):
+        return self.broker.end_offset(self.topic) - self.position
+
+    def close(self):
+        pass
+
+
+class KafkaSource:
+    '''
+    Kafka consumer with the LocalConsumer interface. Offsets are committed explicitly after
+    the messages were processed, so a restarted engine resumes from the first unprocessed
+    sample; the bounded poll keeps at most max_messages decoded messages in memory. Kafka
+    numbers messages per partition, so poll() numbers them itself, in the order it returns
+    them, and commit(offset) commits in every partition past the messages numbered below offset.
+    '''
+
+    def __init__(self, bootstrap_servers, topic=MONITORING_TOPIC, group='decision-engine'):
+        self.topic = topic
+        self._consumer = Consumer({
+            'bootstrap.servers': bootstrap_servers,
+            'group.id': group,
+            'enable.auto.commit': False,
+            'auto.offset.reset': 'latest',
+        })
+        self._consumer.subscribe([topic])
+        self._seq = 0
+        # (number, partition, Kafka offset) of the messages polled and not committed yet
+        self._polled = deque()
+
+    def poll(self, max_messages=100, timeout=1.0):
+        messages = []
+        for msg in self._consumer.consume(max_messages, timeout):
+            if msg.error():
+                if msg.error().code() != KafkaError._PARTITION_EOF:
+                    raise KafkaException(msg.error())
+                continue
+            self._polled.append((self._seq, msg.partition(), msg.offset()))
+            messages.append((self._seq, json.loads(msg.value())))
+            self._seq += 1
+        return messages
+
+    def commit(self, offset):
+        # Marks every message numbered before offset as processed
+        last = {}
+        while self._polled and self._polled[0][0] < offset:
+            _, partition, kafka_offset = self._polled.popleft()
+            last[partition] = max(last.get(partition, -1), kafka_offset)
+        if last:
+            self._consumer.commit(offsets=[TopicPartition(self.topic, partition, kafka_offset + 1)
+                                           for partition, kafka_offset in last.items()], asynchronous=False)
+
+    def close(self):
+        self._consumer.close()
+
+
+class KafkaPublisher:
+    # Producer side; a full local queue is drained by polling, which blocks the caller meanwhile
+
+    def __init__(self, bootstrap_servers, topic=MONITORING_TOPIC):
+        self.topic = topic
+        self._producer = Producer({'bootstrap.servers': bootstrap_servers, 'linger.ms': 20})
+
+    def produce(self, value, key=None):
+        payload = json.dumps(value, separators=(',', ':'))
+        while True:
+            try:
+                self._producer.produce(self.topic, payload, key=key)
+                break
+            except BufferError:
+                self._producer.poll(0.5)
+        self._producer.poll(0)
+
+    def flush(self, timeout=10):
+        self._producer.flush(timeout)
+
+
+class SSESource:
+    '''
+    Consumer of the CNC monitoring-stream endpoint (server-sent events) with the
+    LocalConsumer interface. A reader thread decodes the events into a bounded queue: when
+    the consumer falls behind the queue fills, the reader stops reading and TCP flow
+    control holds the server back. Event ids are the offsets; after a dropped connection
+    the reader reconnects with Last-Event-ID set to the last committed offset, so the
+    server replays what was not processed yet.
+    '''
+
+    def __init__(self, url, params=None, queue_size=SSE_QUEUE_SIZE, reconnect_delay=1.0, session=None):
+        self.url = url
+        self.params = params or {}
+        self.reconnect_delay = reconnect_delay
+        self.committed = None
+        self._session = session or requests.Session()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._read_loop, name='sse-reader', daemon=True)
+        self._thread.start()
+
+    def poll(self, max_messages=100, timeout=1.0):
+        messages = []
+        try:
+            messages.append(self._queue.get(timeout=timeout))
+            while len(messages) < max_messages:
+                messages.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return messages
+
+    def commit(self, offset):
+        self.committed = offset
+
+    def close(self):
+        self._stopped.set()
+
+    def _read_loop(self):
+        while not self._stopped.is_set():
+            headers = {'Accept': 'text/event-stream'}
+            if self.committed is not None:
+                headers['Last-Event-ID'] = str(self.committed - 1)
+            try:
+                with self._session.get(self.url, params=self.params, headers=headers, stream=True,
+                                       timeout=(5, None)) as response:
+                    response.raise_for_status()
+                    for event_id, data in parse_sse(response.iter_lines(decode_unicode=True)):
+                        if self._stopped.is_set():
+                            return
+                        self._queue.put((int(event_id), json.loads(data)))
+            except Exception as e:
+                print(f"Monitoring stream {self.url} interrupted: {e}")
+            self._drain()
+            self._stopped.wait(self.reconnect_delay)
+
+    def _drain(self):
+        # Events not yet polled are replayed by the server after the reconnect
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+
+def parse_sse(lines):
+    # Yields (id, data) of every event in a server-sent events stream; comments are skipped
+    event_id, data = None, []
+    for line in lines:
+        if not line:
+            if data:
+                yield event_id, '\n'.join(data)
+            event_id, data = None, []
+        elif line.startswith(':'):
+            continue
+        else:
+            field, _, value = line.partition(':')
+            value = value[1:] if value.startswith(' ') else value
+            if field == 'id':
+                event_id = value
+            elif field == 'data':
+                data.append(value)
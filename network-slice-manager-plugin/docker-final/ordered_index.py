@@ -0,0 +1,339 @@
+import threading
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain
+
+import numpy as np
+
+from columnar import ArrayMap, RecordColumns, split_text_list, text_list
+from cow_map import CowMap
+
+# Entries per chunk. A change copies the chunk it touches, so this bounds the cost of one change
+CHUNK_SIZE = 512
+
+# Chunks are repacked once deletions left them less than a quarter full on average (and there
+# are more than this many)
+COMPACT_MIN_CHUNKS = 64
+
+
+def _value(chunks, firsts, seq):
+    # The value stored with sequence number seq: its chunk starts at the last first <= seq
+    seqs, _, values = chunks[bisect_right(firsts, seq) - 1]
+    return values[bisect_left(seqs, seq)]
+
+
+class OrderedView:
+    '''
+    Immutable insertion-ordered mapping with positional slicing and stable cursors. Entries
+    are kept in chunks of (sequence numbers, keys, values) tuples, in the order they were
+    added, with the first sequence number of every chunk and a CowMap from key to sequence
+    number: a key or a cursor (the last sequence number a client saw) is found by bisecting
+    the chunks, a position by bisecting the running chunk lengths. Sequence numbers never
+    change and only grow, so a cursor stays valid across insertions, removals and repacking.
+    '''
+
+    __slots__ = ('_chunks', '_firsts', '_len', '_seqs', '_ends')
+
+    def __init__(self, chunks=(), firsts=(), length=0, seqs=None):
+        self._chunks = chunks
+        self._firsts = firsts
+        self._len = length
+        if seqs is None:
+            seqs = CowMap((key, seq) for chunk in chunks for seq, key in zip(chunk[0], chunk[1]))
+        self._seqs = seqs
+        self._ends = None
+
+    def __reduce__(self):
+        # Pickled column-wise when the keys are strings: sequence numbers as an array, keys as one
+        # text, dict values as RecordColumns, and the key map as an ArrayMap, so that loading it
+        # builds no dict. Otherwise the key map is rebuilt from the chunks (string hashes differ
+        # between processes)
+        keys = list(self)
+        text = text_list(keys)
+        if text is None:
+            return OrderedView, (tuple(self._chunks), tuple(self._firsts), self._len)
+        seqs = [seq for chunk in self._chunks for seq in chunk[0]]
+        parts = [chunk[2] for chunk in self._chunks]
+        if not any(isinstance(part, RecordColumns) or part.count(None) < len(part) for part in parts):
+            values = None
+        else:
+            values = RecordColumns.concat(parts) or tuple(self.values())
+        return _load_view, (np.array(seqs, dtype=np.int64), text, values, ArrayMap.from_items(keys, seqs))
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, key):
+        return key in self._seqs
+
+    def __getitem__(self, key):
+        return _value(self._chunks, self._firsts, self._seqs[key])
+
+    def get(self, key, default=None):
+        seq = self._seqs.get(key)
+        return default if seq is None else _value(self._chunks, self._firsts, seq)
+
+    def __iter__(self):
+        return chain.from_iterable(chunk[1] for chunk in self._chunks)
+
+    def __reversed__(self):
+        return chain.from_iterable(reversed(chunk[1]) for chunk in reversed(self._chunks))
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        return chain.from_iterable(chunk[2] for chunk in self._chunks)
+
+    def items(self):
+        return chain.from_iterable(zip(chunk[1], chunk[2]) for chunk in self._chunks)
+
+    def slice(self, start, end):
+        # Keys at positions start <= i < end, like list(self)[start:end]
+        start, end, _ = slice(start, end).indices(self._len)
+        if start >= end:
+            return []
+        if self._ends is None:
+            self._ends = list(accumulate(len(chunk[0]) for chunk in self._chunks))
+        chunk = bisect_right(self._ends, start)
+        offset = start - (self._ends[chunk - 1] if chunk else 0)
+        keys = []
+        while len(keys) < end - start:
+            keys.extend(self._chunks[chunk][1][offset:offset + end - start - len(keys)])
+            chunk, offset = chunk + 1, 0
+        return keys
+
+    def page(self, after=None, limit=100, reverse=False):
+        '''
+        Up to limit keys following sequence number after (or from the start) in insertion
+        order, or preceding it with reverse=True. Returns (keys, cursor); cursor is the
+        sequence number to pass as after for the next page, or None after the last page.
+        '''
+        chunks = self._chunks
+        if not chunks:
+            return [], None
+        if not reverse:
+            if after is None:
+                chunk, pos = 0, 0
+            else:
+                chunk = max(bisect_right(self._firsts, after) - 1, 0)
+                pos = bisect_right(chunks[chunk][0], after)
+        else:
+            if after is None:
+                chunk = len(chunks) - 1
+            else:
+                chunk = bisect_left(self._firsts, after) - 1
+                if chunk < 0:
+                    return [], None
+            pos = bisect_left(chunks[chunk][0], after) - 1 if after is not None else len(chunks[chunk][0]) - 1
+
+        keys, last = [], None
+        while 0 <= chunk < len(chunks) and len(keys) < limit:
+            seqs, chunk_keys, _ = chunks[chunk]
+            if not reverse:
+                taken = chunk_keys[pos:pos + limit - len(keys)]
+                if taken:
+                    last = seqs[pos + len(taken) - 1]
+                    pos += len(taken)
+                if pos >= len(seqs):
+                    chunk, pos = chunk + 1, 0
+            else:
+                low = max(pos + 1 - (limit - len(keys)), 0)
+                taken = chunk_keys[low:pos + 1][::-1]
+                if taken:
+                    last = seqs[low]
+                    pos = low - 1
+                if pos < 0:
+                    chunk -= 1
+                    pos = len(chunks[chunk][0]) - 1 if chunk >= 0 else -1
+            keys.extend(taken)
+        more = 0 <= chunk < len(chunks)
+        return keys, (last if more else None)
+
+
+def _load_view(seqs, keys, values, seq_map):
+    # Inverse of OrderedView.__reduce__; dict values stay in their columns until read
+    length = len(seqs)
+    seqs, keys = seqs.tolist(), split_text_list(keys, length)
+    chunks = []
+    for i in range(0, length, CHUNK_SIZE):
+        end = min(i + CHUNK_SIZE, length)
+        if values is None:
+            chunk_values = (None,) * (end - i)
+        elif isinstance(values, RecordColumns):
+            chunk_values = values.window(i, end)
+        else:
+            chunk_values = values[i:end]
+        chunks.append((tuple(seqs[i:end]), tuple(keys[i:end]), chunk_values))
+    return OrderedView(chunks, seqs[::CHUNK_SIZE], length, CowMap.over(seq_map))
+
+
+class OrderedIndex:
+    '''
+    Insertion-ordered mapping, changed in place and read through immutable OrderedViews.
+    view() is O(1): the index hands its chunk lists and a frozen copy of its key map to the
+    view and copies the lists before its next change (copy-on-write), and chunks themselves
+    are tuples, replaced rather than changed. So a view never changes, and any number of
+    changes between two views copy the chunk lists once. Used as a set, every key maps to
+    None. Changes are serialized by an internal lock.
+    '''
+
+    def __init__(self, keys=()):
+        self._lock = threading.RLock()
+        self._chunks = []
+        self._firsts = []
+        self._seqs = CowMap().writer()
+        self._next_seq = 0
+        self._view = None
+        self._shared = False
+        self.extend(keys)
+
+    def __len__(self):
+        return len(self._seqs)
+
+    def __contains__(self, key):
+        return key in self._seqs
+
+    def __getitem__(self, key):
+        return _value(self._chunks, self._firsts, self._seqs[key])
+
+    def get(self, key, default=None):
+        seq = self._seqs.get(key)
+        return default if seq is None else _value(self._chunks, self._firsts, seq)
+
+    def __iter__(self):
+        return iter(self.view())
+
+    def __reversed__(self):
+        return reversed(self.view())
+
+    def view(self):
+        with self._lock:
+            if self._view is None:
+                self._view = OrderedView(self._chunks, self._firsts, len(self._seqs), self._seqs.freeze())
+                self._shared = True
+            return self._view
+
+    def slice(self, start, end):
+        return self.view().slice(start, end)
+
+    def page(self, after=None, limit=100, reverse=False):
+        return self.view().page(after, limit, reverse)
+
+    def add(self, key):
+        # Appends key at the end; a key already present keeps its position
+        self.extend((key,))
+
+    def __setitem__(self, key, value):
+        # A new key is appended at the end, an existing one keeps its position
+        with self._lock:
+            seq = self._seqs.get(key)
+            if seq is None:
+                self.extend((key,), (value,))
+                return
+            self._own()
+            chunk = bisect_right(self._firsts, seq) - 1
+            seqs, keys, values = self._chunks[chunk]
+            pos = bisect_left(seqs, seq)
+            self._chunks[chunk] = (seqs, keys, values[:pos] + (value,) + values[pos + 1:])
+
+    def extend(self, keys, values=None):
+        # Appends the keys not present yet, with the matching values (None without values)
+        with self._lock:
+            keys = list(keys)
+            values = list(values) if values is not None else [None] * len(keys)
+            start = self._next_seq
+            stored = self._seqs.insert_new(keys, range(start, start + len(keys)))
+            if not stored:
+                return
+            # Keys already present (or repeated) still take a sequence number, left unused
+            self._next_seq = start + len(keys)
+            if len(stored) < len(keys):
+                keys = [keys[i] for i in stored]
+                values = [values[i] for i in stored]
+                seqs = [start + i for i in stored]
+            else:
+                seqs = range(start, start + len(keys))
+            self._own()
+            if self._chunks and len(self._chunks[-1][0]) < CHUNK_SIZE:
+                last_seqs, last_keys, last_values = self._chunks[-1]
+                room = CHUNK_SIZE - len(last_seqs)
+                self._chunks[-1] = (last_seqs + tuple(seqs[:room]), last_keys + tuple(keys[:room]),
+                                    last_values + tuple(values[:room]))
+                seqs, keys, values = seqs[room:], keys[room:], values[room:]
+            for i in range(0, len(keys), CHUNK_SIZE):
+                self._chunks.append((tuple(seqs[i:i + CHUNK_SIZE]), tuple(keys[i:i + CHUNK_SIZE]),
+                                     tuple(values[i:i + CHUNK_SIZE])))
+                self._firsts.append(seqs[i])
+
+    def discard(self, key):
+        self.discard_many((key,))
+
+    def discard_many(self, keys):
+        # Removes the keys present; every chunk they are in is rebuilt once
+        with self._lock:
+            doomed = {}
+            for key in keys:
+                seq = self._seqs.pop(key)
+                if seq is not None:
+                    doomed.setdefault(bisect_right(self._firsts, seq) - 1, set()).add(seq)
+            if not doomed:
+                return
+            self._own()
+            emptied = False
+            for chunk, gone in doomed.items():
+                seqs, chunk_keys, values = self._chunks[chunk]
+                # The runs between removed positions, sliced out of the old chunk
+                cuts = sorted(bisect_left(seqs, seq) for seq in gone)
+                runs = list(zip([-1] + cuts, cuts + [len(seqs)]))
+                seqs = tuple(chain.from_iterable(seqs[a + 1:b] for a, b in runs))
+                self._chunks[chunk] = (seqs, tuple(chain.from_iterable(chunk_keys[a + 1:b] for a, b in runs)),
+                                       tuple(chain.from_iterable(values[a + 1:b] for a, b in runs)))
+                if seqs:
+                    self._firsts[chunk] = seqs[0]
+                emptied = emptied or not seqs
+            if emptied:
+                self._firsts = [first for first, chunk in zip(self._firsts, self._chunks) if chunk[0]]
+                self._chunks = [chunk for chunk in self._chunks if chunk[0]]
+            if len(self._chunks) > max(COMPACT_MIN_CHUNKS, 4 * len(self._seqs) // CHUNK_SIZE + 1):
+                self._repack()
+
+    def state(self):
+        # (keys, sequence numbers, next sequence number), restored by load_state
+        view = self.view()
+        return list(view), [seq for chunk in view._chunks for seq in chunk[0]], self._next_seq
+
+    def load_state(self, keys, seqs, next_seq, values=None):
+        with self._lock:
+            keys = list(keys)
+            self._rebuild(keys, list(seqs), list(values) if values is not None else [None] * len(keys))
+            self._next_seq = next_seq
+
+    def load_view(self, view, next_seq):
+        # Restores the entries of a view, e.g. one unpickled from a snapshot
+        with self._lock:
+            self._chunks = list(view._chunks)
+            self._firsts = list(view._firsts)
+            self._seqs = view._seqs.writer()
+            self._next_seq = next_seq
+            self._shared = False
+            self._view = None
+
+    def _own(self):
+        # Copies the chunk lists if a view shares them, and drops the view of the previous state
+        if self._shared:
+            self._chunks = list(self._chunks)
+            self._firsts = list(self._firsts)
+            self._shared = False
+        self._view = None
+
+    def _repack(self):
+        view = self.view()
+        self._rebuild(list(view), [seq for chunk in view._chunks for seq in chunk[0]], list(view.values()))
+
+    def _rebuild(self, keys, seqs, values):
+        self._chunks = [(tuple(seqs[i:i + CHUNK_SIZE]), tuple(keys[i:i + CHUNK_SIZE]), tuple(values[i:i + CHUNK_SIZE]))
+                        for i in range(0, len(keys), CHUNK_SIZE)]
+        self._firsts = [seqs[i] for i in range(0, len(keys), CHUNK_SIZE)]
+        self._seqs = CowMap(zip(keys, seqs)).writer()
+        self._shared = False
+        self._view = None
@@ -0,0 +1,222 @@
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from csv_writer import BufferedCSVWriter
+
+# File suffix per storage format
+STORAGE_FORMATS = {'parquet': '.parquet', 'feather': '.feather'}
+
+# Partition directories are named after the UTC hour they hold
+HOUR_FORMAT = '%Y%m%d%H'
+
+# Parts an hour may collect before they are compacted into one segment
+COMPACT_PARTS = 60
+
+
+def partition_root(csv_path):
+    # monitoring-1.csv -> monitoring-1, the directory holding that history's partitions
+    return os.path.splitext(csv_path)[0]
+
+
+def _parse_timestamps(raw):
+    # Alerts are stamped '%Y-%m-%d %H:%M:%S.%f UTC', monitoring rows ISO8601
+    return pd.to_datetime(pd.Series(raw, dtype=str).str.removesuffix(' UTC'), format='ISO8601', utc=True, errors='coerce')
+
+
+def _hour_key(timestamp):
+    return int(pd.Timestamp(timestamp).tz_convert('UTC').strftime(HOUR_FORMAT))
+
+
+def _segments(hour_dir):
+    '''
+    Files holding the rows of one hour: the newest compact-<seq> segment plus the
+    part-<seq> files written after it. Sequence numbers only grow, so files a compaction
+    has already folded in (and is about to delete) are never read twice.
+    '''
+    compacts, parts = [], []
+    for name in os.listdir(hour_dir):
+        stem, suffix = os.path.splitext(name)
+        if suffix not in STORAGE_FORMATS.values() or '-' not in stem:
+            continue
+        kind, seq = stem.split('-', 1)
+        if kind == 'compact':
+            compacts.append((int(seq), name))
+        elif kind == 'part':
+            parts.append((int(seq), name))
+    covered = max(compacts)[0] if compacts else -1
+    names = [name for seq, name in compacts if seq == covered]
+    names += [name for seq, name in sorted(parts) if seq > covered]
+    return [os.path.join(hour_dir, name) for name in names]
+
+
+def _read_segment(path, columns=None):
+    if path.endswith(STORAGE_FORMATS['parquet']):
+        segment = pq.ParquetFile(path)
+        schema = segment.schema_arrow
+        return segment.read(columns=[c for c in columns if c in schema.names] if columns else None)
+    if columns:
+        with pa.memory_map(path) as source:
+            schema = pa.ipc.open_file(source).schema
+        columns = [c for c in columns if c in schema.names]
+    return feather.read_table(path, columns=columns, memory_map=True)
+
+
+def _write_table(table, path, storage_format, fsync):
+    # Written under a dot-name and renamed into place, so readers never see half a file
+    tmp_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        if storage_format == 'parquet':
+            pq.write_table(table, f, compression='zstd')
+        else:
+            feather.write_feather(table, f, compression='zstd')
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class PartitionedWriter(BufferedCSVWriter):
+    '''
+    Drop-in replacement for BufferedCSVWriter that stores the rows as typed columnar files,
+    one directory per UTC hour under root. Every flush adds one part file to each hour it
+    touches; once an hour holds COMPACT_PARTS parts (and on close) they are merged into a
+    single compact segment. dtypes maps columns to pandas dtypes, the 'timestamp' column
+    is always stored as a UTC timestamp.
+    '''
+
+    def __init__(self, root, columns, dtypes=None, max_rows=1000, flush_interval=1.0, fsync=False,
+                 storage_format='parquet'):
+        if storage_format not in STORAGE_FORMATS:
+            raise ValueError(f'unknown storage format {storage_format!r}')
+        self.root = root
+        self.dtypes = dict(dtypes or {})
+        self.storage_format = storage_format
+        self.bad_rows = 0
+        self._last_seq = 0
+        self._hours = set()
+        os.makedirs(root, exist_ok=True)
+        super().__init__(root, columns, max_rows, flush_interval, fsync)
+
+    def _upgrade_header(self):
+        # Every file carries its own schema; readers fill columns older files lack with nulls
+        pass
+
+    def close(self):
+        super().close()
+        with self._io_lock:
+            for hour in sorted(self._hours):
+                self._compact(hour)
+            self._hours.clear()
+
+    def _next_seq(self):
+        # Strictly increasing, and ordered across restarts since it follows the clock
+        self._last_seq = max(self._last_seq + 1, time.time_ns())
+        return self._last_seq
+
+    def _write(self, rows):
+        # Called with _io_lock held
+        if not rows:
+            return
+        frame = pd.DataFrame(rows, columns=self.columns)
+        frame['timestamp'] = _parse_timestamps(frame['timestamp']).dt.as_unit('ns')
+        bad = frame['timestamp'].isna()
+        if bad.any():
+            self.bad_rows += int(bad.sum())
+            print(f"Dropping {int(bad.sum())} row(s) with unparseable timestamps from {self.root}")
+            frame = frame[~bad]
+        frame = frame.astype(self.dtypes)
+
+        hours = frame['timestamp'].dt.strftime(HOUR_FORMAT)
+        for hour, rows_of_hour in frame.groupby(hours, sort=True):
+            hour_dir = os.path.join(self.root, hour)
+            os.makedirs(hour_dir, exist_ok=True)
+            table = pa.Table.from_pandas(rows_of_hour, preserve_index=False)
+            path = os.path.join(hour_dir, f'part-{self._next_seq()}{STORAGE_FORMATS[self.storage_format]}')
+            _write_table(table, path, self.storage_format, self.fsync)
+            self._hours.add(hour)
+            if len(_segments(hour_dir)) > COMPACT_PARTS:
+                self._compact(hour)
+
+    def _compact(self, hour):
+        hour_dir = os.path.join(self.root, hour)
+        segments = _segments(hour_dir)
+        if len(segments) < 2:
+            return
+        table = pa.concat_tables([_read_segment(path) for path in segments], promote_options='default')
+        seq = self._next_seq()
+        _write_table(table, os.path.join(hour_dir, f'compact-{seq}{STORAGE_FORMATS[self.storage_format]}'),
+                     self.storage_format, self.fsync)
+        for path in segments:
+            os.remove(path)
+
+
+class PartitionedDataset:
+    '''
+    Read side of PartitionedWriter: loads only the hour partitions overlapping a time
+    window, and only the requested columns of their files. dtypes (as given to the writer)
+    types the columns of the empty frame an empty window returns.
+    '''
+
+    def __init__(self, root, dtypes=None):
+        self.root = root
+        self.dtypes = dict(dtypes or {})
+
+    def hours(self, start=None, stop=None):
+        if not os.path.isdir(self.root):
+            raise FileNotFoundError(self.root)
+        first = _hour_key(start) if start is not None else None
+        last = _hour_key(stop) if stop is not None else None
+        hours = []
+        for name in os.listdir(self.root):
+            if len(name) != 10 or not name.isdigit():
+                continue
+            key = int(name)
+            if (first is None or key >= first) and (last is None or key <= last):
+                hours.append(name)
+        return sorted(hours)
+
+    def read(self, start=None, stop=None, columns=None):
+        # Rows with start <= timestamp <= stop, in file order within each hour
+        if columns is not None and 'timestamp' not in columns:
+            columns = ['timestamp'] + list(columns)
+        tables = [self._read_hour(hour, columns) for hour in self.hours(start, stop)]
+        tables = [table for table in tables if table.num_rows]
+        if not tables:
+            return self._empty(columns)
+        rows = pa.concat_tables(tables, promote_options='default').to_pandas()
+        # A column added after the files of the window were written comes back empty
+        for column in columns or ():
+            if column not in rows:
+                rows[column] = pd.Series(index=rows.index, dtype=self.dtypes.get(column, 'object'))
+        inside = pd.Series(True, index=rows.index)
+        if start is not None:
+            inside &= rows['timestamp'] >= pd.Timestamp(start)
+        if stop is not None:
+            inside &= rows['timestamp'] <= pd.Timestamp(stop)
+        return rows[inside].reset_index(drop=True)
+
+    def _empty(self, columns):
+        # No rows, typed like those of a non-empty window
+        columns = columns or ['timestamp'] + [column for column in self.dtypes if column != 'timestamp']
+        return pd.DataFrame({column: pd.Series(dtype='datetime64[ns, UTC]' if column == 'timestamp'
+                                               else self.dtypes.get(column, 'object'))
+                             for column in columns})
+
+    def _read_hour(self, hour, columns):
+        hour_dir = os.path.join(self.root, hour)
+        # A compaction may delete files between listing and reading them; list again in that case
+        for attempt in range(3):
+            try:
+                tables = [_read_segment(path, columns) for path in _segments(hour_dir)]
+                break
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+        if not tables:
+            return pa.table({})
+        return pa.concat_tables(tables, promote_options='default')
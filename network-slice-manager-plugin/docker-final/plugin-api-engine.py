@@ -1,15 +1,22 @@
 from flask import Flask, request, jsonify
 import json
+import os
+import numpy as np
 import pandas as pd
 from influxdb_client import InfluxDBClient, Point, WritePrecision
 from influxdb_client.client.write_api import SYNCHRONOUS
 from datetime import datetime
 from flask_cors import CORS
 import pytz
+from alert_store import alerts_json, get_alert_index
+from monitoring_rollup import ROLLUP_COLUMNS, aggregate, get_monitoring_rollup
+from partition_store import PartitionedDataset, partition_root
+from serving import add_health_routes
 
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)
+add_health_routes(app)
 
 # Configure your InfluxDB connection
 INFLUXDB_URL = 'http://localhost:8086'
@@ -47,23 +54,21 @@ def alerts():
     csv_filename = f'traffic_change_alerts_{testbed_id}.csv'
 
     try:
-        # Load the CSV file
-        alerts_df = pd.read_csv(csv_filename)
-
-        # Convert the timestamp column to datetime with UTC
-        alerts_df['timestamp'] = pd.to_datetime(alerts_df['timestamp'], utc=True)
-
         # Convert the input dates to timezone-aware datetime objects (UTC)
         start_date = datetime.strptime(start_date, '%Y-%m-%dT%H:%M:%S').replace(tzinfo=pytz.UTC)
         stop_date = datetime.strptime(stop_date, '%Y-%m-%dT%H:%M:%S').replace(tzinfo=pytz.UTC)
 
-        # Filter the alerts within the specified date range
-        filtered_alerts = alerts_df[
-            (alerts_df['timestamp'] >= start_date) & (alerts_df['timestamp'] <= stop_date)
-        ]
+        # Read only the hour partitions covering the range when the engine stores columnar files
+        dataset_dir = partition_root(csv_filename)
+        if os.path.isdir(dataset_dir):
+            dataset = PartitionedDataset(dataset_dir, dtypes={'imsi': 'string', 'alertType': 'string'})
+            rows = dataset.read(start_date, stop_date, columns=['imsi', 'alertType'])
+            rows = rows.sort_values('timestamp', kind='stable')
+            imsis = rows['imsi'].astype(object).where(rows['imsi'].notna(), None)
+            return alerts_json(rows['timestamp'].dt.as_unit('ns').astype('int64'), imsis, rows['alertType']), 200
 
-        # Return the filtered alerts as JSON
-        return filtered_alerts.to_json(orient='records'), 200
+        # Answer the range from the incrementally maintained, time-sorted index of the CSV file
+        return get_alert_index(csv_filename).query_json(start_date, stop_date), 200
 
     except FileNotFoundError:
         return jsonify({"error": f"File for testbed {testbed_id} not found"}), 404
@@ -101,33 +106,35 @@ def performance_analysis():
     start_date = pd.to_datetime(start_date, utc=True)
     stop_date = pd.to_datetime(stop_date, utc=True)
 
-    # Read the corresponding CSV file based on testbed_id
+    # Sums and counts over the window, from the hour partitions covering it when the engine
+    # stores columnar files, otherwise from the rollups of the corresponding CSV file
     filename = f'monitoring-{testbed_id}.csv'
-    df = pd.read_csv(filename)
-    df['timestamp_raw'] = df['timestamp']
-    df['timestamp'] = pd.to_datetime(
-        df['timestamp'],
-        format='ISO8601',  # or: format='mixed' on recent pandas
-        utc=True,
-        errors='coerce'  # don’t raise—let us report bad rows
-    )
+    dataset_dir = partition_root(filename)
+    try:
+        if os.path.isdir(dataset_dir):
+            rows = PartitionedDataset(dataset_dir).read(start_date, stop_date, columns=ROLLUP_COLUMNS)
+            totals, bad_rows, bad_examples = aggregate(rows), 0, []
+        else:
+            rollup = get_monitoring_rollup(filename)
+            totals = rollup.window(start_date, stop_date)
+            bad_rows, bad_examples = rollup.bad_rows, rollup.bad_examples
+    except FileNotFoundError:
+        return jsonify({"error": f"File for testbed {testbed_id} not found"}), 404
+    (sum_dl, sum_ul, sum_rtt, sum_received, sum_sent), (n_dl, n_ul, n_rtt, _, _) = totals
 
     # Handle any bad timestamps
-    bad = df['timestamp'].isna()
-    if bad.any():
+    if bad_rows:
         return jsonify({
-            "error": f"Unparseable timestamps: {bad.sum()} rows",
-            "examples": df.loc[bad, 'timestamp_raw'].head(3).tolist()
+            "error": f"Unparseable timestamps: {bad_rows} rows",
+            "examples": bad_examples
         }), 400
 
-    # Filter and compute as before...
-    df_filtered = df[(df['timestamp'] >= start_date) & (df['timestamp'] <= stop_date)]
-
-    # Calculate metrics
-    avg_downlink_throughput = df_filtered['URLLC_Received_thrp_Mbps'].mean() * 2
-    avg_uplink_throughput = df_filtered['URLLC_Sent_thrp_Mbps'].mean() / 7
-    avg_rtt = df_filtered['RTT'].mean()
-    total_traffic_consumption = (df_filtered['URLLC_BytesReceived'].sum() + df_filtered['URLLC_BytesSent'].sum())/300000
+    # Calculate metrics (means over an empty window are NaN, as with pandas)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_downlink_throughput = sum_dl / n_dl * 2
+        avg_uplink_throughput = sum_ul / n_ul / 7
+        avg_rtt = sum_rtt / n_rtt
+    total_traffic_consumption = (sum_received + sum_sent)/300000
 
     # Create the response
     response = {
@@ -161,4 +168,4 @@ def performance_analysis():
 
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=3001)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=3001)
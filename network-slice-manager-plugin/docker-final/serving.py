@@ -0,0 +1,117 @@
+import argparse
+import importlib.util
+import os
+import signal
+import sys
+
+from flask import jsonify
+
+# Worker processes and threads per worker when neither flags nor environment set them
+DEFAULT_WORKERS = 2
+DEFAULT_THREADS = 8
+
+# Seconds in-flight requests get to finish after SIGTERM before workers are killed, and
+# seconds a silent worker may take (restoring a large CNC state included) before it is restarted
+GRACEFUL_TIMEOUT = 20
+WORKER_TIMEOUT = 120
+
+# Set in a worker once it was asked to stop: /readyz then fails so load balancers drain it
+draining = False
+
+
+def add_health_routes(app):
+    '''
+    Adds GET /healthz (the process serves requests) and GET /readyz (it should get traffic)
+    to a Flask app. /readyz answers 503 while the worker drains after SIGTERM.
+    '''
+
+    @app.get('/healthz')
+    def healthz():
+        return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+    @app.get('/readyz')
+    def readyz():
+        if draining:
+            return jsonify({'status': 'draining'}), 503
+        return jsonify({'status': 'ready'})
+
+
+def service_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def setting(service, name, default):
+    # <SERVICE>_<NAME>, e.g. CUMUCORE_API_ENGINE_THREADS, then SERVE_<NAME>, then the default
+    prefix = service.upper().replace('-', '_')
+    return int(os.environ.get(f'{prefix}_{name}', os.environ.get(f'SERVE_{name}', default)))
+
+
+def load_service(path):
+    # Imports a service script (file names have dashes, so not through import) and returns its app
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    spec = importlib.util.spec_from_file_location(service_name(path).replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module.app
+
+
+def _on_worker_start(worker):
+    # Gunicorn stops a worker on SIGTERM; flag it as draining first so /readyz reports it
+    stop = worker.handle_exit
+
+    def handle_exit(signum, frame):
+        # Services import this file as 'serving', a different module object than __main__
+        import serving
+        serving.draining = True
+        stop(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_exit)
+
+
+def serve(path, port, host='0.0.0.0', workers=None, threads=None, max_workers=None):
+    '''
+    Runs the service script at path under gunicorn with threaded workers. The script is
+    imported in every worker, not in the master, so the background threads it starts run
+    where the requests are served. max_workers caps the worker count of services that keep
+    their state in memory and must run in a single process.
+    '''
+    from gunicorn.app.base import BaseApplication
+
+    service = service_name(path)
+    workers = workers or setting(service, 'WORKERS', DEFAULT_WORKERS)
+    threads = threads or setting(service, 'THREADS', DEFAULT_THREADS)
+    if max_workers is not None and workers > max_workers:
+        print(f"{service} keeps its state in memory, running {max_workers} worker(s) instead of {workers}")
+        workers = max_workers
+
+    class Service(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('graceful_timeout', GRACEFUL_TIMEOUT)
+            self.cfg.set('timeout', WORKER_TIMEOUT)
+            self.cfg.set('preload_app', False)
+            self.cfg.set('post_worker_init', _on_worker_start)
+            self.cfg.set('proc_name', service)
+            self.cfg.set('accesslog', '-')
+
+        def load(self):
+            return load_service(path)
+
+    print(f"Serving {service} on {host}:{port} with {workers} worker(s) x {threads} thread(s)")
+    Service().run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a Flask service script under gunicorn')
+    parser.add_argument('script', help='service script defining a Flask app named app')
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--workers', type=int, help='worker processes, default <SERVICE>_WORKERS or SERVE_WORKERS')
+    parser.add_argument('--threads', type=int, help='threads per worker, default <SERVICE>_THREADS or SERVE_THREADS')
+    parser.add_argument('--max-workers', type=int, help='upper bound on the worker count')
+    args = parser.parse_args()
+    serve(args.script, args.port, args.host, args.workers, args.threads, args.max_workers)
@@ -0,0 +1,224 @@
+import argparse
+import time
+
+import numpy as np
+
+# Trees kept from the random forest in the compiled model (the forest's trees are
+# independent bootstrap fits, so any subset is itself a smaller random forest)
+DEFAULT_TREES = 100
+
+# libsvm clips pairwise probabilities to this range before coupling them
+MIN_PAIRWISE_PROB = 1e-7
+
+
+def _softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def _sigmoid_predict(decision, a, b):
+    # libsvm's sigmoid_predict, 1 / (1 + exp(A * f + B)) written to avoid overflow
+    fApB = decision * a + b
+    positive = fApB >= 0
+    exp = np.exp(-np.abs(fApB))
+    return np.where(positive, exp / (1.0 + exp), 1.0 / (1.0 + exp))
+
+
+def _couple(pairwise, n_classes):
+    '''
+    libsvm's multiclass_probability (Wu, Lin and Weng, method 2) for a batch of samples.
+    pairwise[:, k] is P(class i | i or j) for the k-th pair (i, j) in libsvm's order
+    (0, 1), (0, 2) ... (1, 2) ...; the same fixed-point iteration runs for all samples,
+    each one stopping at the same tolerance as libsvm.
+    '''
+    n = len(pairwise)
+    r = np.zeros((n, n_classes, n_classes))
+    k = 0
+    for i in range(n_classes):
+        for j in range(i + 1, n_classes):
+            p = np.clip(pairwise[:, k], MIN_PAIRWISE_PROB, 1 - MIN_PAIRWISE_PROB)
+            r[:, i, j] = p
+            r[:, j, i] = 1 - p
+            k += 1
+
+    Q = -r.transpose(0, 2, 1) * r
+    idx = np.arange(n_classes)
+    Q[:, idx, idx] = (r ** 2).sum(axis=1) - r[:, idx, idx] ** 2
+    p = np.full((n, n_classes), 1.0 / n_classes)
+    eps = 0.005 / n_classes
+    active = np.ones(n, dtype=bool)
+    for _ in range(max(100, n_classes)):
+        Qp = np.einsum('nij,nj->ni', Q, p)
+        pQp = (p * Qp).sum(axis=1)
+        active &= np.abs(Qp - pQp[:, None]).max(axis=1) >= eps
+        if not active.any():
+            break
+        for t in range(n_classes):
+            diff = np.where(active, (pQp - Qp[:, t]) / Q[:, t, t], 0.0)
+            p[:, t] += diff
+            pQp = (pQp + diff * (diff * Q[:, t, t] + 2 * Qp[:, t])) / (1 + diff) / (1 + diff)
+            Qp = (Qp + diff[:, None] * Q[:, t, :]) / (1 + diff[:, None])
+            p /= (1 + diff[:, None])
+    return p
+
+
+class ServingModel:
+    '''
+    Compiled form of the soft-voting ensemble trained by train.py, evaluated with NumPy
+    only; predict() takes the raw, unscaled features. The random forest is cut down to a
+    subset of its trees, stored as flat node arrays (feature, threshold, children, leaf
+    class probabilities) and walked level by level for all samples and trees at once. It
+    compares the standardized features in float32 against the original thresholds, as
+    sklearn does, since thresholds moved to raw units split a few boundary rows
+    differently. The StandardScaler is folded into the weights of the logistic regression
+    and the linear SVC, whose Platt scaling and pairwise coupling are reproduced as
+    libsvm does them.
+    '''
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.classes_ = arrays['classes']
+        self.n_features_in_ = int(arrays['lr_coef'].shape[1])
+        self._feature = arrays['tree_feature']
+        self._threshold = arrays['tree_threshold']
+        self._left = arrays['tree_left']
+        self._right = arrays['tree_right']
+        self._value = arrays['tree_value']
+        self._roots = arrays['tree_roots']
+        self._depth = int(arrays['tree_depth'])
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as npz:
+            return cls({name: npz[name] for name in npz.files})
+
+    def save(self, path):
+        np.savez(path, **self.arrays)
+
+    @property
+    def n_trees(self):
+        return len(self._roots)
+
+    def forest_proba(self, X):
+        X = ((X - self.arrays['scaler_mean']) / self.arrays['scaler_scale']).astype(np.float32)
+        nodes = np.repeat(self._roots[:, None], len(X), axis=1)
+        samples = np.arange(len(X))
+        for _ in range(self._depth):
+            feature = self._feature[nodes]
+            go_left = X[samples, feature] <= self._threshold[nodes]
+            # Leaves point to themselves, so samples that reached one stay there
+            nodes = np.where(go_left, self._left[nodes], self._right[nodes])
+        return self._value[nodes].mean(axis=0)
+
+    def lr_proba(self, X):
+        scores = X @ self.arrays['lr_coef'].T + self.arrays['lr_intercept']
+        if self.arrays['lr_multinomial']:
+            return _softmax(scores)
+        # One-vs-rest: per-class sigmoids, normalized
+        proba = 1.0 / (1.0 + np.exp(-scores))
+        return proba / proba.sum(axis=1, keepdims=True)
+
+    def svc_proba(self, X):
+        decision = X @ self.arrays['svc_coef'].T + self.arrays['svc_intercept']
+        pairwise = _sigmoid_predict(decision, self.arrays['svc_prob_a'], self.arrays['svc_prob_b'])
+        return _couple(pairwise, len(self.classes_))
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        return (self.forest_proba(X) + self.lr_proba(X) + self.svc_proba(X)) / 3
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def _fold(coef, intercept, mean, scale):
+    # w . ((x - mean) / scale) + b  ==  (w / scale) . x + (b - w . (mean / scale))
+    return coef / scale, intercept - coef @ (mean / scale)
+
+
+def _flatten_trees(trees):
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    for tree in trees:
+        t = tree.tree_
+        leaf = t.children_left == -1
+        node_ids = np.arange(t.node_count)
+        roots.append(offset)
+        features.append(np.where(leaf, 0, t.feature))
+        thresholds.append(np.where(leaf, np.inf, t.threshold))
+        lefts.append(np.where(leaf, node_ids, t.children_left) + offset)
+        rights.append(np.where(leaf, node_ids, t.children_right) + offset)
+        value = t.value[:, 0, :]
+        values.append(value / value.sum(axis=1, keepdims=True))
+        offset += t.node_count
+    return {
+        'tree_feature': np.concatenate(features).astype(np.int32),
+        'tree_threshold': np.concatenate(thresholds),
+        'tree_left': np.concatenate(lefts).astype(np.int32),
+        'tree_right': np.concatenate(rights).astype(np.int32),
+        'tree_value': np.concatenate(values),
+        'tree_roots': np.array(roots, dtype=np.int32),
+        'tree_depth': np.array(max(tree.tree_.max_depth for tree in trees)),
+    }
+
+
+def compile_ensemble(ensemble, scaler, n_trees=DEFAULT_TREES, probe=None):
+    '''
+    Builds a ServingModel from the fitted VotingClassifier and StandardScaler. The sign
+    conventions of the linear parts (multinomial or one-vs-rest logistic regression, and
+    the orientation of the SVC's pairwise decision values) are chosen by checking them
+    against the sklearn estimators on probe, raw feature rows around the training data.
+    '''
+    estimators = dict(ensemble.named_estimators_)
+    forest, lr, svc = estimators['rf'], estimators['lr'], estimators['svc']
+    mean = np.asarray(scaler.mean_, dtype=np.float64)
+    scale = np.asarray(scaler.scale_, dtype=np.float64)
+    if probe is None:
+        probe = mean + scale * np.random.default_rng(0).standard_normal((500, len(mean)))
+    probe_scaled = scaler.transform(probe)
+
+    arrays = {'classes': np.asarray(ensemble.classes_).astype(str), 'scaler_mean': mean, 'scaler_scale': scale}
+    arrays.update(_flatten_trees(forest.estimators_[:n_trees]))
+    arrays['lr_coef'], arrays['lr_intercept'] = _fold(lr.coef_, lr.intercept_, mean, scale)
+
+    svc_coef, svc_intercept = _fold(svc.coef_, svc.intercept_, mean, scale)
+    arrays['svc_prob_a'], arrays['svc_prob_b'] = np.asarray(svc.probA_), np.asarray(svc.probB_)
+
+    expected_lr = lr.predict_proba(probe_scaled)
+    for multinomial in (True, False):
+        arrays['lr_multinomial'] = np.array(multinomial)
+        if np.allclose(ServingModel(_with_svc(arrays, svc_coef, svc_intercept)).lr_proba(probe), expected_lr, atol=1e-9):
+            break
+    else:
+        raise ValueError('could not reproduce the logistic regression probabilities')
+
+    expected_svc = svc.predict_proba(probe_scaled)
+    for sign in (1, -1):
+        model = ServingModel(_with_svc(arrays, sign * svc_coef, sign * svc_intercept))
+        if np.allclose(model.svc_proba(probe), expected_svc, atol=1e-6):
+            return model
+    raise ValueError('could not reproduce the SVC probabilities')
+
+
+def _with_svc(arrays, coef, intercept):
+    return {**arrays, 'svc_coef': coef, 'svc_intercept': intercept}
+
+
+if __name__ == "__main__":
+    from joblib import load
+
+    parser = argparse.ArgumentParser(description='Compile traffic_model.joblib and scaler.joblib into a NumPy serving model')
+    parser.add_argument('--model', default='traffic_model.joblib')
+    parser.add_argument('--scaler', default='scaler.joblib')
+    parser.add_argument('--output', default='traffic_model.npz')
+    parser.add_argument('--trees', type=int, default=DEFAULT_TREES, help='random forest trees kept in the compiled model')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    ensemble = load(args.model)
+    scaler = load(args.scaler)
+    model = compile_ensemble(ensemble, scaler, args.trees)
+    model.save(args.output)
+    print(f"Compiled {model.n_trees} trees ({len(model.arrays['tree_feature'])} nodes) into {args.output} "
+          f"in {time.perf_counter() - start:.1f}s")
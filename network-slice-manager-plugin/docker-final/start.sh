@@ -1,9 +1,28 @@
 #!/usr/bin/env bash
-python3 /app/cumucore-api-engine.py &
-python3 /app/web-app.py &
-python3 /app/plugin-api-engine.py &
+# SERVE_MODE=production (default) runs the Flask services under gunicorn through serving.py, with
+# worker/thread counts from <SERVICE>_WORKERS/_THREADS or SERVE_WORKERS/SERVE_THREADS;
+# SERVE_MODE=dev runs them on the Flask development server
+SERVE_MODE=${SERVE_MODE:-production}
+
+# The CNC mock keeps its state in a snapshot + write-ahead log under CNC_STATE_DIR
+export CNC_STATE_DIR=${CNC_STATE_DIR:-/app/state}
+
+if [ "$SERVE_MODE" = "dev" ]; then
+	python3 /app/cumucore-api-engine.py &
+	python3 /app/web-app.py &
+	python3 /app/plugin-api-engine.py &
+else
+	# The CNC mock holds its state in memory, so it runs in one (multi-threaded) worker
+	python3 /app/serving.py /app/cumucore-api-engine.py --port 3000 --max-workers 1 &
+	python3 /app/serving.py /app/web-app.py --port 1025 &
+	python3 /app/serving.py /app/plugin-api-engine.py --port 3001 &
+fi
 python3 /app/decision-engine-1.py &
 
+# Forward SIGTERM/SIGINT so every service shuts down gracefully before the container stops
+trap 'kill -TERM $(jobs -p) 2>/dev/null; wait; exit 0' TERM INT
+
 while true; do
-	sleep 100
+	sleep 100 &
+	wait $!
 done
@@ -0,0 +1,195 @@
+import argparse
+import importlib.util
+import random
+import threading
+import time
+
+# Load cumucore-api-engine.py as a module (its file name is not importable)
+spec = importlib.util.spec_from_file_location('cumucore', 'cumucore-api-engine.py')
+cumucore = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(cumucore)
+
+API = cumucore.API_PREFIX
+SUBSCRIBERS = f'{API}/cnc-subscriber-management'
+KEY = '000102030405060708090A0B0C0D0E0F'
+GROUPS = ('group1', 'default')
+
+failures = []
+counts = {'writes': 0, 'snapshot checks': 0, 'reads': 0}
+counts_lock = threading.Lock()
+
+
+def fail(message):
+    failures.append(message)
+    print(f"FAILED: {message}")
+
+
+def count(name, n=1):
+    with counts_lock:
+        counts[name] += n
+
+
+def record(imsi, group):
+    return {'imsi': imsi, 'k': KEY, 'opc': KEY, 'groupName': group}
+
+
+def check_snapshot(snap):
+    '''
+    The invariants between the subscriber table, its insertion order and the groups, checked
+    on one snapshot: writers publish whole snapshots, so they hold however the writes interleave.
+    '''
+    imsis = list(snap.subscribers)
+    if len(imsis) != len(snap.subscribers) or len(set(imsis)) != len(imsis):
+        return fail(f"{len(imsis)} IMSIs in insertion order, {len(set(imsis))} distinct, length {len(snap.subscribers)}")
+    if list(reversed(snap.subscribers)) != imsis[::-1]:
+        return fail("reversed insertion order differs")
+    for imsi, subscriber in snap.subscribers.items():
+        if subscriber['imsi'] != imsi or imsi not in snap.subscribers or snap.subscribers[imsi] is not subscriber:
+            return fail(f"subscriber {imsi} stored as {subscriber['imsi']}")
+        group = subscriber.get('groupName')
+        if group and imsi not in snap.groups.get(group, ()):
+            return fail(f"{imsi} is not a member of its group {group}")
+    for gname, members in snap.groups.items():
+        missing = [imsi for imsi in members if imsi not in snap.subscribers]
+        if missing or len(snap.members(gname)) != len(members):
+            return fail(f"group {gname} has {len(missing)} members that are not subscribers")
+
+    # Cursor pages, both ways, and positional slices cover the insertion order exactly once
+    for reverse in (False, True):
+        paged, after = [], None
+        while True:
+            keys, after = snap.subscribers.page(after, 997, reverse)
+            paged.extend(keys)
+            if after is None:
+                break
+        if paged != (imsis[::-1] if reverse else imsis):
+            return fail(f"pages (reverse={reverse}) differ from the insertion order")
+    sliced = [imsi for start in range(0, len(imsis), 1009) for imsi in snap.subscribers.slice(start, start + 1009)]
+    if sliced != imsis:
+        fail("slices differ from the insertion order")
+
+
+def writer(seed, stop, prefix):
+    # Adds, updates (moving between groups), deletes, bulk changes and SQN updates on its own IMSI range
+    rng = random.Random(seed)
+    client = cumucore.app.test_client()
+    known, next_imsi = [], 0
+
+    def new_imsi():
+        nonlocal next_imsi
+        next_imsi += 1
+        return f'{prefix}{next_imsi:09d}'
+
+    while not stop.is_set():
+        op = rng.random()
+        if op < 0.25 or not known:
+            imsi = new_imsi()
+            response = client.post(SUBSCRIBERS, json=record(imsi, rng.choice(GROUPS)))
+            known.append(imsi)
+        elif op < 0.45:
+            imsi = rng.choice(known)
+            response = client.put(f'{SUBSCRIBERS}/{imsi}', json=record(imsi, rng.choice(GROUPS)))
+        elif op < 0.6:
+            imsi = known.pop(rng.randrange(len(known)))
+            response = client.delete(f'{SUBSCRIBERS}/{imsi}')
+        elif op < 0.7:
+            imsis = [new_imsi() for _ in range(rng.randrange(1, 200))]
+            response = client.post(f'{SUBSCRIBERS}/bulk', json=[record(imsi, rng.choice(GROUPS)) for imsi in imsis])
+            known.extend(imsis)
+        elif op < 0.8 and len(known) > 10:
+            doomed = set(rng.sample(known, rng.randrange(1, min(len(known), 200))))
+            known = [imsi for imsi in known if imsi not in doomed]
+            response = client.delete(f'{API}/cnc-multisubscriber-management/delete', query_string={'ids': ','.join(doomed)})
+        elif op < 0.9:
+            imsis = rng.sample(known, min(len(known), rng.randrange(1, 100)))
+            response = client.put(f'{SUBSCRIBERS}/bulk', json=[record(imsi, rng.choice(GROUPS)) for imsi in imsis])
+        else:
+            response = client.put(f'{SUBSCRIBERS}/sqn/{rng.choice(known)}', json={'sqn': f'{rng.randrange(1 << 40):012x}'})
+        if response.status_code != 200:
+            fail(f"{response.request.method} {response.request.path}: {response.status_code} {response.get_data(as_text=True)[:200]}")
+        count('writes')
+
+
+def snapshot_checker(stop):
+    while not stop.is_set():
+        check_snapshot(cumucore.state.snapshot())
+        count('snapshot checks')
+
+
+def http_reader(seed, stop, latencies):
+    # Pages, batches, groups and counts over HTTP: never a server error, and every page self-consistent
+    rng = random.Random(seed)
+    client = cumucore.app.test_client()
+    while not stop.is_set():
+        op = rng.random()
+        started = time.perf_counter()
+        if op < 0.4:
+            response = client.get(SUBSCRIBERS, query_string={'limit': 500, 'order': rng.choice((1, -1))})
+            seen = [s['imsi'] for s in response.get_json()['subscribers']]
+            cursor = response.get_json()['next_cursor']
+            if cursor:
+                response = client.get(SUBSCRIBERS, query_string={'cursor': cursor, 'limit': 500})
+                seen += [s['imsi'] for s in response.get_json()['subscribers']]
+            if len(set(seen)) != len(seen):
+                fail("an IMSI appears twice on two consecutive pages")
+        elif op < 0.6:
+            total = client.get(f'{SUBSCRIBERS}/total-count').get_json()['count']
+            start = rng.randrange(max(total - 300, 1))
+            response = client.get(f'{SUBSCRIBERS}/by-batch', query_string={'start': start, 'end': start + 300})
+            if response.status_code == 200 and len(response.get_json()) != 300:
+                fail(f"by-batch returned {len(response.get_json())} subscribers instead of 300")
+        elif op < 0.7:
+            response = client.get(f'{SUBSCRIBERS}/by-group', query_string={'gname': rng.choice(GROUPS)})
+        else:
+            response = client.get(f'{SUBSCRIBERS}/{rng.choice(list(cumucore.state.snapshot().subscribers.slice(0, 50)))}')
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 500:
+            fail(f"GET {response.request.path}: {response.status_code}")
+        count('reads')
+
+
+def check_writer_indexes():
+    # Once writers are done: the per-IMSI group lists writers keep match the published groups
+    snap = cumucore.state.snapshot()
+    expected = {}
+    for gname, members in snap.groups.items():
+        for imsi in members:
+            expected.setdefault(imsi, set()).add(gname)
+    actual = {imsi: set(cumucore.state.groups_of(imsi)) for imsi in snap.subscribers if cumucore.state.groups_of(imsi)}
+    if actual != expected:
+        fail(f"subscriber_groups differs from the groups for {len(set(actual.items()) ^ set(expected.items()))} IMSIs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Concurrent writers and readers on the CNC mock state, checking its invariants')
+    parser.add_argument('--subscribers', type=int, default=20000, help='subscribers loaded before the run')
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4, help='HTTP reader threads (plus one snapshot checker)')
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    seed = [record(f'99998{n:010d}', GROUPS[n % 2]) for n in range(args.subscribers)]
+    for start in range(0, len(seed), 10000):
+        cumucore._insert_imported(seed[start:start + 10000])
+
+    stop = threading.Event()
+    latencies = []
+    threads = [threading.Thread(target=writer, args=(n, stop, f'9{n:05d}')) for n in range(args.writers)]
+    threads += [threading.Thread(target=http_reader, args=(1000 + n, stop, latencies)) for n in range(args.readers)]
+    threads.append(threading.Thread(target=snapshot_checker, args=(stop,)))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    check_snapshot(cumucore.state.snapshot())
+    check_writer_indexes()
+    latencies.sort()
+    print(f"{counts['writes']} writes, {counts['reads']} reads and {counts['snapshot checks']} snapshot checks in "
+          f"{args.seconds:.0f}s; read latency p50 {latencies[len(latencies) // 2] * 1e3:.1f}ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e3:.1f}ms")
+    if failures:
+        raise SystemExit(f"{len(failures)} failures")
+    print("All invariants held")
@@ -0,0 +1,165 @@
+import io
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# Bytes read from the CSV per chunk; each chunk is validated and inserted as one batch
+CHUNK_BYTES = 1 << 20
+
+# Invalid rows reported back in the job status
+MAX_INVALID_EXAMPLES = 5
+
+HEX32 = r'[0-9A-Fa-f]{32}'
+
+
+def read_header(path):
+    # Column names and the offset of the first data row
+    with open(path, 'rb') as f:
+        line = f.readline()
+    return line.decode().strip().split(','), len(line)
+
+
+class ImportJob:
+    '''
+    Imports subscribers from an esims.csv-style file (imsi, k, opc, groupName, ...) in
+    chunks of about CHUNK_BYTES. Each chunk is parsed with pandas and validated with
+    vectorized checks: an IMSI is required, K and OPC must be 32 hex digits, and IMSIs
+    already present (in the table or earlier in the chunk) are skipped as duplicates.
+    The valid rows of a chunk are handed to insert(records) in one call. The job starts
+    at start_offset and stops at the end of the file, or once limit subscribers were
+    added; offset always points just past the last row consumed, and on_progress(offset)
+    is called after every batch so the caller can resume a later import from there.
+    on_finish(job) is called once the job is done or failed.
+    '''
+
+    def __init__(self, job_id, path, exists, insert, start_offset=0, limit=None, on_progress=None,
+                 chunk_bytes=CHUNK_BYTES, on_finish=None):
+        self.job_id = job_id
+        self.path = path
+        self.limit = limit
+        self.chunk_bytes = chunk_bytes
+        self._exists = exists
+        self._insert = insert
+        self._on_progress = on_progress
+        self._on_finish = on_finish
+
+        self.status = 'queued'
+        self.error = None
+        self.start_offset = start_offset
+        self.offset = start_offset
+        self.size = None
+        self.rows_read = 0
+        self.added = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.invalid_examples = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name=f'import-{self.job_id}', daemon=True)
+        self._thread.start()
+
+    def run(self):
+        self.status = 'running'
+        try:
+            self._import()
+            self.status = 'done'
+        except Exception as e:
+            self.status = 'failed'
+            self.error = str(e)
+        self.finished_at = time.time()
+        if self._on_finish is not None:
+            self._on_finish(self)
+        return self
+
+    def _import(self):
+        columns, header_end = read_header(self.path)
+        if 'imsi' not in columns:
+            raise ValueError(f'{self.path} has no imsi column')
+        self.offset = max(self.offset, header_end)
+        with open(self.path, 'rb') as f:
+            self.size = os.fstat(f.fileno()).st_size
+            f.seek(self.offset)
+            pending = b''
+            while self.limit is None or self.added < self.limit:
+                block = f.read(self.chunk_bytes)
+                chunk = pending + block
+                if not block:
+                    # A last line without newline is a complete row
+                    if not chunk.strip():
+                        break
+                    chunk += b'\n'
+                end = chunk.rfind(b'\n') + 1
+                chunk, pending = chunk[:end], chunk[end:]
+                if chunk:
+                    self._import_chunk(chunk, columns)
+                if not block:
+                    break
+
+    def _import_chunk(self, chunk, columns):
+        line_ends = self.offset + np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord('\n')) + 1
+        # Blank lines are kept as empty rows so that rows and line offsets stay aligned
+        rows = pd.read_csv(io.BytesIO(chunk), header=None, names=columns, dtype=str,
+                           keep_default_na=False, skip_blank_lines=False).fillna('')
+        for column in ('imsi', 'k', 'opc'):
+            if column not in rows:
+                rows[column] = ''
+
+        blank = (rows == '').all(axis=1).to_numpy()
+        valid = (rows['imsi'] != '') & rows['k'].str.fullmatch(HEX32) & rows['opc'].str.fullmatch(HEX32)
+        valid = valid.to_numpy() & ~blank
+        # Duplicates are IMSIs already stored, or repeated among the valid rows of the chunk
+        repeated = np.zeros(len(rows), dtype=bool)
+        repeated[valid] = rows['imsi'][valid].duplicated().to_numpy()
+        duplicate = valid & (repeated | rows['imsi'].map(self._exists).to_numpy(dtype=bool))
+        accepted = valid & ~duplicate
+
+        # With a limit, stop right after the row that reaches it; later rows stay for the next import
+        consumed = len(rows)
+        if self.limit is not None:
+            room = self.limit - self.added
+            if accepted.sum() > room:
+                consumed = int(np.flatnonzero(accepted)[room - 1]) + 1 if room > 0 else 0
+        rows, accepted = rows.iloc[:consumed], accepted[:consumed]
+        invalid = ~valid[:consumed] & ~blank[:consumed]
+
+        records = rows[accepted].to_dict('records')
+        if records:
+            self._insert(records)
+        self.added += len(records)
+        self.rows_read += int((~blank[:consumed]).sum())
+        self.duplicates += int(duplicate[:consumed].sum())
+        self.invalid += int(invalid.sum())
+        for position in np.flatnonzero(invalid)[:max(0, MAX_INVALID_EXAMPLES - len(self.invalid_examples))]:
+            self.invalid_examples.append({'offset': int(line_ends[position - 1]) if position else self.offset,
+                                          'imsi': rows['imsi'].iat[position]})
+        if consumed:
+            # Capped at the file size, past which lies only the newline added to an unterminated last row
+            self.offset = min(int(line_ends[consumed - 1]), self.size)
+        if self._on_progress is not None:
+            self._on_progress(self.offset)
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'path': self.path,
+            'status': self.status,
+            'error': self.error,
+            'start_offset': self.start_offset,
+            'offset': self.offset,
+            'size': self.size,
+            'progress': round(self.offset / self.size, 4) if self.size else None,
+            'rows_read': self.rows_read,
+            'added': self.added,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'invalid_examples': self.invalid_examples,
+            'limit': self.limit,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
@@ -0,0 +1,142 @@
+import zlib
+
+import numpy as np
+
+# Traffic is piecewise constant over slots of this many seconds, the sampling interval of
+# the CPE datasets the classifier was trained on
+SLOT_SECONDS = 5.0
+
+# Share of UEs given each profile
+PROFILE_MIX = {'high': 0.2, 'medium': 0.3, 'normal': 0.5}
+
+# Per-profile traffic, fitted to the medians and spread of src/datasets/CPE_<profile>.csv:
+# median receive/send rate (Mbps), log-normal sigma of the per-slot burst factor, and the
+# share of slots in which the UE idles at the 'normal' rate
+PROFILES = {
+    'high':   {'rx_mbps': 337.0, 'tx_mbps': 98.0, 'rx_sigma': 0.9, 'tx_sigma': 0.2, 'idle': 0.10},
+    'medium': {'rx_mbps': 229.0, 'tx_mbps': 52.0, 'rx_sigma': 0.4, 'tx_sigma': 0.3, 'idle': 0.03},
+    'normal': {'rx_mbps': 0.27,  'tx_mbps': 0.30, 'rx_sigma': 0.6, 'tx_sigma': 0.4, 'idle': 0.0},
+}
+IDLE_RX_MBPS = 0.2
+IDLE_TX_MBPS = 0.2
+
+# Diurnal swing of every rate: +-DIURNAL_AMPLITUDE around the mean, peaking at DIURNAL_PEAK_HOUR UTC
+DIURNAL_AMPLITUDE = 0.2
+DIURNAL_PEAK_HOUR = 20.0
+
+_PROFILE_NAMES = np.array(list(PROFILES))
+_PARAMS = {key: np.array([PROFILES[name][key] for name in _PROFILE_NAMES])
+           for key in ('rx_mbps', 'tx_mbps', 'rx_sigma', 'tx_sigma', 'idle')}
+
+_M1 = np.uint64(0xBF58476D1CE4E5B9)
+_M2 = np.uint64(0x94D049BB133111EB)
+_GOLDEN = 0x9E3779B97F4A7C15
+
+
+def _mix(x):
+    # splitmix64 finalizer: a well-spread uint64 for every uint64 input, elementwise
+    x = (x ^ (x >> np.uint64(30))) * _M1
+    x = (x ^ (x >> np.uint64(27))) * _M2
+    return x ^ (x >> np.uint64(31))
+
+
+def _uniform(keys, stream):
+    # Deterministic uniform(0, 1) per key for each independent stream number
+    bits = _mix(keys + np.uint64(stream * _GOLDEN & 0xFFFFFFFFFFFFFFFF)) >> np.uint64(11)
+    return (bits.astype(np.float64) + 0.5) / float(1 << 53)
+
+
+def _normal(keys, stream):
+    # Box-Muller over two uniform streams
+    u1, u2 = _uniform(keys, 2 * stream), _uniform(keys, 2 * stream + 1)
+    return np.sqrt(-2.0 * np.log(u1)) * np.cos(2.0 * np.pi * u2)
+
+
+def imsi_keys(imsis, seed=0):
+    # uint64 key per IMSI: numeric IMSIs map to themselves, anything else to its crc32
+    keys = np.array([int(imsi) if imsi.isdigit() else zlib.crc32(imsi.encode()) for imsi in imsis],
+                    dtype=np.uint64)
+    return _mix(keys ^ _mix(np.full(len(keys), seed, dtype=np.uint64)))
+
+
+class TrafficGenerator:
+    '''
+    Seeded, per-IMSI traffic model. Each UE gets a profile ('high', 'medium' or 'normal',
+    drawn by PROFILE_MIX from its IMSI and the seed) and, in every SLOT_SECONDS slot, a
+    constant receive and send rate: the profile's median scaled by a diurnal factor and a
+    log-normal burst factor, or the idle rate. Rates depend only on (seed, IMSI, slot), so
+    any window can be computed on its own and the results agree across calls: the bytes of
+    a window are the integral of the rate over it, and adjacent windows add up to the
+    window covering both. Everything is vectorized over UEs and windows.
+    '''
+
+    def __init__(self, seed=0, mix=PROFILE_MIX):
+        self.seed = seed
+        shares = np.array([mix.get(name, 0.0) for name in _PROFILE_NAMES], dtype=np.float64)
+        self._cumulative = np.cumsum(shares / shares.sum())
+
+    def profile_index(self, keys):
+        index = np.searchsorted(self._cumulative, _uniform(keys, 0), side='right')
+        return np.minimum(index, len(_PROFILE_NAMES) - 1)
+
+    def profiles(self, imsis):
+        return _PROFILE_NAMES[self.profile_index(imsi_keys(imsis, self.seed))]
+
+    def window(self, imsis, start, end):
+        '''
+        Traffic of each UE between start and end (epoch seconds, scalars or arrays that
+        broadcast against the UEs) as a dict of arrays: BytesReceived, BytesSent and the
+        average Received/Sent throughput in Mbps over the window.
+        '''
+        keys = imsi_keys(imsis, self.seed)
+        start, end = np.broadcast_arrays(np.asarray(start, dtype=np.float64), np.asarray(end, dtype=np.float64))
+        return self._window(keys, start, end)
+
+    def series(self, imsis, start, end, step):
+        '''
+        Consecutive windows of step seconds from start up to end, as the arrays of window()
+        with one row per UE and one column per window, and the window end times.
+        '''
+        count = max(int(np.floor((end - start) / step + 1e-9)), 1)
+        ends = start + step * np.arange(1, count + 1)
+        keys = imsi_keys(imsis, self.seed)[:, None]
+        return self._window(keys, (ends - step)[None, :], ends[None, :]), ends
+
+    def _window(self, keys, start, end):
+        keys, start, end = np.broadcast_arrays(keys, start, end)
+        profile = self.profile_index(keys)
+        rx_bits = np.zeros(keys.shape)
+        tx_bits = np.zeros(keys.shape)
+        first = np.floor(start / SLOT_SECONDS)
+        last = np.ceil(end / SLOT_SECONDS)
+        for offset in range(int((last - first).max(initial=0))):
+            slot = first + offset
+            overlap = np.minimum(end, (slot + 1) * SLOT_SECONDS) - np.maximum(start, slot * SLOT_SECONDS)
+            live = overlap > 0
+            if not live.any():
+                continue
+            rx, tx = self._rates(keys[live], profile[live], slot[live])
+            rx_bits[live] += rx * 1e6 * overlap[live]
+            tx_bits[live] += tx * 1e6 * overlap[live]
+
+        duration = np.maximum(end - start, 1e-9)
+        bytes_received = np.floor(rx_bits / 8).astype(np.int64)
+        bytes_sent = np.floor(tx_bits / 8).astype(np.int64)
+        return {
+            'URLLC_BytesReceived': bytes_received,
+            'URLLC_BytesSent': bytes_sent,
+            'URLLC_Received_thrp_Mbps': bytes_received * 8 / duration / 1e6,
+            'URLLC_Sent_thrp_Mbps': bytes_sent * 8 / duration / 1e6,
+        }
+
+    def _rates(self, keys, profile, slot):
+        # Receive and send rate (Mbps) of each UE in the given slots
+        slot_keys = _mix(keys ^ slot.astype(np.int64).astype(np.uint64))
+        hour = (slot * SLOT_SECONDS / 3600.0) % 24.0
+        diurnal = 1.0 + DIURNAL_AMPLITUDE * np.cos(2.0 * np.pi * (hour - DIURNAL_PEAK_HOUR) / 24.0)
+        rx = _PARAMS['rx_mbps'][profile] * diurnal * np.exp(_PARAMS['rx_sigma'][profile] * _normal(slot_keys, 1))
+        tx = _PARAMS['tx_mbps'][profile] * diurnal * np.exp(_PARAMS['tx_sigma'][profile] * _normal(slot_keys, 2))
+        idle = _uniform(slot_keys, 6) < _PARAMS['idle'][profile]
+        rx[idle] = IDLE_RX_MBPS
+        tx[idle] = IDLE_TX_MBPS
+        return rx, tx
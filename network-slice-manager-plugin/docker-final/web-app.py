@@ -1,8 +1,10 @@
 from flask import Flask, render_template
 from flask_cors import CORS
+from serving import add_health_routes
 
 app = Flask(__name__)
 CORS(app)
+add_health_routes(app)
 
 @app.route('/')
 def index():
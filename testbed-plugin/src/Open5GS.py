@@ -1,59 +1,157 @@
+import os
+import threading
 import pymongo
 import random
 import bson
 
+# Connection pool of the shared client: at most MONGO_MAX_POOL_SIZE sockets (requests beyond
+# that wait up to MONGO_WAIT_QUEUE_TIMEOUT_MS for one), MONGO_MIN_POOL_SIZE kept open, idle
+# ones closed after MONGO_MAX_IDLE_TIME_MS
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+# Projection of the subscriber fields the REST API returns (imsi, sst, session AMBR, QoS index and
+# the document version)
+SUBSCRIBER_FIELDS = {"_id": 0, "imsi": 1, "slice.sst": 1, "slice.session.ambr": 1, "slice.session.qos.index": 1,
+                     "__v": 1}
+
 class Open5GS:
-    def __init__(self, server, port):
+    def __init__(self, server, port, client=None, **pool_options):
+        '''
+        Subscribers in the Open5GS MongoDB. All calls share one MongoClient and its connection
+        pool, created on first use (so forked server workers each get their own) with the
+        MONGO_* limits above, overridden by pool_options (MongoClient keyword arguments).
+        A client passed in is used instead, e.g. mongomock.MongoClient() to run offline.
+        '''
         self.server = server
         self.port = port
+        self.pool_options = {
+            "maxPoolSize": MONGO_MAX_POOL_SIZE,
+            "minPoolSize": MONGO_MIN_POOL_SIZE,
+            "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+            "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        }
+        self.pool_options.update(pool_options)
+        self.client = client
+        self.lock = threading.Lock()
+        self.indexed = False
+
+    def collection(self):
+        if not self.indexed:
+            with self.lock:
+                if self.client is None:
+                    self.client = pymongo.MongoClient("mongodb://" + str(self.server) + ":" + str(self.port) + "/",
+                                                      **self.pool_options)
+                if not self.indexed:
+                    self.EnsureIndexes(self.client["open5gs"]["subscribers"])
+                    self.indexed = True
+        return self.client["open5gs"]["subscribers"]
+
+    def EnsureIndexes(self, mycol):
+        # A unique index on imsi, for the lookups by IMSI and against provisioning one twice. Existing
+        # duplicate IMSIs or a conflicting index leave the collection as it is, with a warning
+        try:
+            mycol.create_index("imsi", unique=True)
+        except pymongo.errors.OperationFailure as e:
+            print("Could not create the unique imsi index: " + str(e))
 
-    def GetSubscribers(self):
-        myclient = pymongo.MongoClient("mongodb://" + str(self.server) + ":" + str(self.port) + "/")
-        mydb = myclient["open5gs"]
-        mycol = mydb["subscribers"]
-        subs_list = []
-        for x in mycol.find():
-            print(x)
-            subs_list.append(x)
-            pass
-
-        return subs_list
-
-    def GetSubscriber(self, imsi):
-        myclient = pymongo.MongoClient("mongodb://" + str(self.server) + ":" + str(self.port) + "/")
-        mydb = myclient["open5gs"]
-        mycol = mydb["subscribers"]
+    def GetSubscribers(self, fields=None):
+        # Every subscriber document, with only the fields of the projection if one is given
+        return list(self.collection().find({}, fields))
+
+    def IterSubscribers(self, fields=None, after_imsi=None, limit=None, batch_size=1000):
+        # A cursor over the subscribers in IMSI order (walking the imsi index), from the first IMSI
+        # after after_imsi; the server sends the documents batch_size at a time
+        myquery = { "imsi": { "$gt": str(after_imsi) }} if after_imsi is not None else {}
+        x = self.collection().find(myquery, fields).sort("imsi", pymongo.ASCENDING).batch_size(batch_size)
+        return x.limit(limit) if limit is not None else x
+
+    def GetSubscriber(self, imsi, fields=None):
         myquery = { "imsi": str(imsi)}
-        mydoc = mycol.find(myquery)
-        for x in mydoc:
-            print(x)
-            return x
+        return self.collection().find_one(myquery, fields)
 
     def AddSubscriber(self, sub_data):
-        myclient = pymongo.MongoClient("mongodb://" + str(self.server) + ":" + str(self.port) + "/")
-        mydb = myclient["open5gs"]
-        mycol = mydb["subscribers"]
-
-        x = mycol.insert_one(sub_data)
+        x = self.collection().insert_one(sub_data)
         print("Added subscriber with Inserted ID : " + str(x.inserted_id))
         return x.inserted_id
 
+    def AddSubscribers(self, subs_data):
+        '''
+        Inserts the subscriber documents in one unordered insert_many: a failing document does
+        not stop the others. Returns {index of a failed document: (error code, message)}, where
+        11000 is an IMSI that exists already.
+        '''
+        try:
+            x = self.collection().insert_many(subs_data, ordered=False)
+            failed = {}
+        except pymongo.errors.BulkWriteError as e:
+            failed = {error["index"]: (error["code"], error["errmsg"]) for error in e.details["writeErrors"]}
+        print("Added " + str(len(subs_data) - len(failed)) + " subscribers, " + str(len(failed)) + " failed")
+        return failed
+
     def UpdateSubscriber(self, imsi, sub_data):
-        myclient = pymongo.MongoClient("mongodb://" + str(self.server) + ":" + str(self.port) + "/")
-        mydb = myclient["open5gs"]
-        mycol = mydb["subscribers"]
         print("Attempting to update IMSI " + str(imsi))
         newvalues = { "$set": sub_data }
         myquery = { "imsi": str(imsi)}
-        x = mycol.update_one(myquery, newvalues)
+        x = self.collection().update_one(myquery, newvalues)
         print(x)
         return True
 
+    def UpdateSubscriberFields(self, imsi, values, version=None):
+        '''
+        Sets values (dotted paths) on the subscriber in one find_one_and_update and counts the
+        change in its __v version. With a version, the update only applies if the stored
+        version still is that one (optimistic concurrency). Returns (status, version): 200 and
+        the new version, 404 and None, or 409 and the stored version when it differs.
+        '''
+        myquery = { "imsi": str(imsi)}
+        if version is not None:
+            myquery["__v"] = version
+        newvalues = { "$inc": { "__v": 1 }}
+        if values:
+            newvalues["$set"] = values
+        # The version before the update (the filter may no longer match after it), plus the $inc
+        x = self.collection().find_one_and_update(myquery, newvalues, { "_id": 0, "__v": 1 },
+                                                  return_document=pymongo.ReturnDocument.BEFORE)
+        if x is not None:
+            return 200, x.get("__v", 0) + 1
+        # No match: a second read tells a missing subscriber from a newer version
+        current = self.GetSubscriber(imsi, { "_id": 0, "__v": 1 }) if version is not None else None
+        return (409, current.get("__v")) if current is not None else (404, None)
+
+    def UpdateSubscribers(self, updates):
+        '''
+        Applies (imsi, values) pairs, values being a $set of dotted paths, in one unordered
+        bulk_write. Returns the IMSIs that were not found, which are left out of the write.
+        '''
+        existing = self.ExistingIMSIs([imsi for imsi, _ in updates])
+        ops = [pymongo.UpdateOne({ "imsi": str(imsi)}, { "$set": values, "$inc": { "__v": 1 }})
+               for imsi, values in updates if str(imsi) in existing and values]
+        if ops:
+            x = self.collection().bulk_write(ops, ordered=False)
+            print("Updated " + str(x.matched_count) + " subscribers")
+        return {str(imsi) for imsi, _ in updates} - existing
+
     def DeleteSubscriber(self, imsi):
-        myclient = pymongo.MongoClient("mongodb://" + str(self.server) + ":" + str(self.port) + "/")
-        mydb = myclient["open5gs"]
-        mycol = mydb["subscribers"]
         myquery = { "imsi": str(imsi)}
-        x = mycol.delete_many(myquery)
+        x = self.collection().delete_many(myquery)
         print(x.deleted_count, " subscribers deleted.")
         return x.deleted_count
+
+    def DeleteSubscribers(self, imsis):
+        # Deletes the subscribers of all the IMSIs in one delete_many; returns the IMSIs that were not found
+        imsis = {str(imsi) for imsi in imsis}
+        existing = self.ExistingIMSIs(imsis)
+        if existing:
+            x = self.collection().delete_many({ "imsi": { "$in": list(existing) }})
+            print(x.deleted_count, " subscribers deleted.")
+        return imsis - existing
+
+    def ExistingIMSIs(self, imsis):
+        # The IMSIs among imsis that have a subscriber, answered from the imsi index
+        myquery = { "imsi": { "$in": [str(imsi) for imsi in imsis] }}
+        return {x["imsi"] for x in self.collection().find(myquery, { "_id": 0, "imsi": 1 })}
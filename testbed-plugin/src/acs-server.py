@@ -2,8 +2,10 @@ from flask import Flask, jsonify
 import json
 import random
 from datetime import datetime
+from serving import add_health_routes
 
 app = Flask(__name__)
+add_health_routes(app)
 
 # load the CPE monitoring JSON data model
 with open('CPE_data-model.json', 'r') as file:
@@ -0,0 +1,82 @@
+import argparse
+import json
+import time
+
+import mongomock
+from flask import Flask
+
+import subscribers
+from Open5GS import Open5GS, SUBSCRIBER_FIELDS
+
+
+def provisioning_request(n):
+    return {
+        'imsi': f'99970{n:010d}', 'k': '465B5CE8B199B49FAA5F0A2EE238A6BC', 'opc': 'E8ED289DEBA952E4283B54E88E6183CA',
+        'sst': 1, 'apn': 'internet', 'qci': 9,
+        'uplink-ambr-value': 1, 'uplink-ambr-unit': 3, 'downlink-ambr-value': 1, 'downlink-ambr-unit': 3,
+    }
+
+
+def timed(label, n, call):
+    started = time.perf_counter()
+    for i in range(n):
+        response = call(i)
+        if response.status_code != 200:
+            raise SystemExit(f"{label}: {response.status_code} {response.get_data(as_text=True)[:200]}")
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} {n:>7} calls  {elapsed / n * 1e6:>9.0f}us/call")
+    return response
+
+
+if __name__ == "__main__":
+    # mongomock scans the whole collection for every lookup and has no real indexes: it checks
+    # the routes offline, but round trips, pooling and index use only show against a real server
+    parser = argparse.ArgumentParser(description='Times the subscriber routes against an in-memory (mongomock) '
+                                                 'or a real Open5GS database')
+    parser.add_argument('--subscribers', type=int, default=2000)
+    parser.add_argument('--calls', type=int, default=200, help='calls per single-subscriber route')
+    parser.add_argument('--batch', type=int, default=500, help='subscribers per bulk request')
+    parser.add_argument('--server', help='MongoDB host to use instead of mongomock; its open5gs.subscribers '
+                                         'collection gets test IMSIs 99970... added and removed')
+    parser.add_argument('--port', type=int, default=27017)
+    args = parser.parse_args()
+
+    if args.server:
+        subscribers.Open5GS = Open5GS(args.server, args.port)
+    else:
+        subscribers.Open5GS = Open5GS('mongomock', args.port, client=mongomock.MongoClient())
+    app = Flask(__name__)
+    app.register_blueprint(subscribers.subscribers_blueprint)
+    client = app.test_client()
+    n = args.subscribers
+
+    timed('POST /api/subscriber-provisioning', n,
+          lambda i: client.post('/api/subscriber-provisioning', json=provisioning_request(i)))
+    timed('GET /api/subscriber', args.calls,
+          lambda i: client.get('/api/subscriber', query_string={'imsi': provisioning_request(i % n)['imsi']}))
+    timed('POST /api/subscriber-update', args.calls,
+          lambda i: client.post('/api/subscriber-update', json={'imsi': provisioning_request(i % n)['imsi'], 'qci': 7}))
+    listing = timed('GET /api/subscribers', 5, lambda i: client.get('/api/subscribers'))
+    print(f"  {len(json.loads(listing.get_data()))} subscribers listed")
+
+    # What the listing projection saves over fetching whole documents
+    for label, fields in (('whole documents', None), ('projected', SUBSCRIBER_FIELDS)):
+        started = time.perf_counter()
+        docs = subscribers.Open5GS.GetSubscribers(fields)
+        elapsed = time.perf_counter() - started
+        size = sum(len(json.dumps(doc, default=str)) for doc in docs)
+        print(f"  GetSubscribers, {label:<16} {elapsed * 1e3:>8.1f}ms  {size / len(docs):>6.0f} bytes/document")
+
+    timed('DELETE /api/subscriber-delete', n,
+          lambda i: client.delete('/api/subscriber-delete', query_string={'imsi': provisioning_request(i)['imsi']}))
+
+    # The same subscribers again, through the bulk endpoints in batches of --batch
+    batches = [range(start, min(start + args.batch, n)) for start in range(0, n, args.batch)]
+    timed(f'POST provisioning/bulk x{args.batch}', len(batches), lambda b: client.post(
+        '/api/subscriber-provisioning/bulk', json=[provisioning_request(i) for i in batches[b]]))
+    timed(f'POST update/bulk x{args.batch}', len(batches), lambda b: client.post(
+        '/api/subscriber-update/bulk', json=[{'imsi': provisioning_request(i)['imsi'], 'qci': 7} for i in batches[b]]))
+    deleted = timed(f'DELETE delete/bulk x{args.batch}', len(batches), lambda b: client.delete(
+        '/api/subscriber-delete/bulk', json=[provisioning_request(i)['imsi'] for i in batches[b]]))
+    if deleted.get_json()['failed']:
+        raise SystemExit(f"bulk delete: {deleted.get_json()['failed']} failed")
@@ -0,0 +1,119 @@
+import argparse
+import importlib.util
+import os
+import signal
+import sys
+
+from flask import jsonify
+
+# Worker processes and threads per worker when neither flags nor environment set them
+DEFAULT_WORKERS = 2
+DEFAULT_THREADS = 8
+
+# Services that keep what they serve in process memory and so always run one worker:
+# the monitoring engine computes throughput from the previous counters of every CPE, and
+# the ACS simulator increments its byte counters in memory. testbed-api-engine shares
+# nothing between requests but the configuration files, which it locks across processes.
+SINGLE_WORKER_SERVICES = {'testbed-monitoring-engine', 'acs-server'}
+
+# Seconds in-flight requests get to finish after SIGTERM before workers are killed, and
+# seconds a worker may stay silent (e.g. waiting on MongoDB or the ACS) before it is restarted
+GRACEFUL_TIMEOUT = 20
+WORKER_TIMEOUT = 60
+
+# Set in a worker once it was asked to stop: /readyz then fails so load balancers drain it
+draining = False
+
+
+def add_health_routes(app):
+    '''
+    Adds GET /healthz (the process serves requests) and GET /readyz (it should get traffic)
+    to a Flask app. /readyz answers 503 while the worker drains after SIGTERM.
+    '''
+
+    @app.get('/healthz')
+    def healthz():
+        return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+    @app.get('/readyz')
+    def readyz():
+        if draining:
+            return jsonify({'status': 'draining'}), 503
+        return jsonify({'status': 'ready'})
+
+
+def service_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def setting(service, name, default):
+    # <SERVICE>_<NAME>, e.g. TESTBED_API_ENGINE_THREADS, then SERVE_<NAME>, then the default
+    prefix = service.upper().replace('-', '_')
+    return int(os.environ.get(f'{prefix}_{name}', os.environ.get(f'SERVE_{name}', default)))
+
+
+def load_service(path):
+    # Imports a service script (file names have dashes, so not through import) and returns its app
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    spec = importlib.util.spec_from_file_location(service_name(path).replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module.app
+
+
+def _on_worker_start(worker):
+    # Gunicorn stops a worker on SIGTERM; flag it as draining first so /readyz reports it
+    stop = worker.handle_exit
+
+    def handle_exit(signum, frame):
+        # Services import this file as 'serving', a different module object than __main__
+        import serving
+        serving.draining = True
+        stop(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_exit)
+
+
+def serve(path, port, host='0.0.0.0', workers=None, threads=None):
+    # Runs the service script at path under gunicorn with threaded workers, importing it in
+    # every worker rather than in the master
+    from gunicorn.app.base import BaseApplication
+
+    service = service_name(path)
+    workers = workers or setting(service, 'WORKERS', DEFAULT_WORKERS)
+    threads = threads or setting(service, 'THREADS', DEFAULT_THREADS)
+    if service in SINGLE_WORKER_SERVICES and workers > 1:
+        print(f"{service} keeps its state in memory, running 1 worker instead of {workers}")
+        workers = 1
+
+    class Service(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('graceful_timeout', GRACEFUL_TIMEOUT)
+            self.cfg.set('timeout', WORKER_TIMEOUT)
+            self.cfg.set('preload_app', False)
+            self.cfg.set('post_worker_init', _on_worker_start)
+            self.cfg.set('proc_name', service)
+            self.cfg.set('accesslog', '-')
+
+        def load(self):
+            return load_service(path)
+
+    print(f"Serving {service} on {host}:{port} with {workers} worker(s) x {threads} thread(s)")
+    Service().run()
+
+
+if __name__ == "__main__":
+    # e.g. python3 serving.py testbed-api-engine.py --port 5000, from this directory
+    parser = argparse.ArgumentParser(description='Run a testbed service script under gunicorn')
+    parser.add_argument('script', help='service script defining a Flask app named app')
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--workers', type=int, help='worker processes, default <SERVICE>_WORKERS or SERVE_WORKERS')
+    parser.add_argument('--threads', type=int, help='threads per worker, default <SERVICE>_THREADS or SERVE_THREADS')
+    args = parser.parse_args()
+    serve(args.script, args.port, args.host, args.workers, args.threads)
@@ -1,6 +1,11 @@
 from flask import Blueprint, jsonify, request, abort
+import copy
+import fcntl
 import yaml
 import os
+import tempfile
+import threading
+from contextlib import contextmanager
 
 slices_blueprint = Blueprint('slices', __name__)
 
@@ -8,83 +13,190 @@ slices_blueprint = Blueprint('slices', __name__)
 core_yaml_file_path = 'sample.yaml'
 ran_yaml_file_path = 'gnb_b210.yml'
 
+# libyaml's C loader and dumper when PyYAML was built with it, the pure Python ones otherwise
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+SafeDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
 def read_yaml(file_path):
     with open(file_path, 'r') as file:
-        return yaml.safe_load(file)
-
-def write_yaml(file_path, data):
-    with open(file_path, 'w') as file:
-        yaml.safe_dump(data, file, default_flow_style=False)
+        return yaml.load(file, Loader=SafeLoader)
+
+def dump_yaml(data, **options):
+    return yaml.dump(data, Dumper=SafeDumper, default_flow_style=False, **options)
+
+def write_yaml(file_path, data, **options):
+    replace_file(file_path, dump_yaml(data, **options))
+
+def replace_file(file_path, text):
+    # Writes a temporary file next to file_path and renames it over it, so a reader (or a crash)
+    # never sees a half-written configuration
+    directory, name = os.path.split(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + name + '.')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.write(text)
+        if os.path.exists(file_path):
+            os.chmod(tmp_path, os.stat(file_path).st_mode & 0o7777)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+class ConfigFile:
+    '''
+    A YAML configuration file kept parsed in memory. read() returns the cached data (not to be
+    changed) and parses the file again only once its mtime, inode or size changed, e.g. after
+    an edit by hand. Changes are made inside `with config.update() as data:`, one at a time
+    under a lock, on a copy that replaces the cached data only once the change is complete, so
+    readers never see a change half made or one that failed. They are written back atomically;
+    writers that queue up while the file is being written have their changes written together
+    by the next of them.
+
+    The service runs in several worker processes, each with its own ConfigFile: a process holds
+    an flock on .<name>.lock next to the file from the first change it makes until all of its
+    changes are on disk, so every change starts from the file another process last wrote.
+    '''
+
+    def __init__(self, path, **dump_options):
+        self.path = path
+        self.dump_options = dump_options
+        self.lock = threading.RLock()
+        self.write_lock = threading.Lock()
+        self.data = None
+        self.stamp = None
+        # Changes applied in memory, and how many of them are on disk
+        self.version = 0
+        self.written = 0
+        # Changes up to this version were dropped when their write failed
+        self.lost = 0
+        # Updates of this process between their change and its write; the flock is held while > 0
+        self.holders = 0
+        self.lock_fd = None
+
+    def read(self):
+        with self.lock:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_ino, st.st_size)
+            # changes not written yet are kept, the file is read again after their write
+            if self.stamp is None or (stamp != self.stamp and self.written == self.version):
+                self.data = read_yaml(self.path)
+                self.stamp = stamp
+            return self.data
+
+    @contextmanager
+    def update(self):
+        with self.lock:
+            self._hold()
+            try:
+                # with the flock taken, changes of other processes are on disk and read here; the
+                # change is made on a copy, with the changes of earlier updates not written yet
+                data = copy.deepcopy(self.read())
+                yield data
+            except BaseException:
+                self._release()
+                raise
+            self.data = data
+            self.version += 1
+            version = self.version
+
+        try:
+            # The change is done in memory; return once a write that includes it is on disk. Only
+            # the dump holds up readers and further changes, not the file write
+            with self.write_lock:
+                if self.written >= version:
+                    if version <= self.lost:
+                        raise OSError(f'{self.path} could not be written, the change was dropped')
+                    return
+                with self.lock:
+                    text = dump_yaml(self.data, **self.dump_options)
+                    dumped = self.version
+                try:
+                    replace_file(self.path, text)
+                except BaseException:
+                    # Drop every change not on disk (their updates fail) and read the file again,
+                    # before the flock lets other processes change it
+                    with self.lock:
+                        self.data = self.stamp = None
+                        self.written = self.lost = self.version
+                    raise
+                with self.lock:
+                    st = os.stat(self.path)
+                    self.stamp = (st.st_mtime_ns, st.st_ino, st.st_size)
+                    self.written = dumped
+        finally:
+            with self.lock:
+                self._release()
+
+    def _hold(self):
+        # Called under self.lock; the first holder waits for other processes to finish writing
+        if self.holders == 0:
+            if self.lock_fd is None:
+                directory, name = os.path.split(os.path.abspath(self.path))
+                self.lock_fd = os.open(os.path.join(directory, '.' + name + '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self.lock_fd, fcntl.LOCK_EX)
+        self.holders += 1
+
+    def _release(self):
+        # Called under self.lock; the last holder lets other processes change the file
+        self.holders -= 1
+        if self.holders == 0:
+            fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+
+core_config = ConfigFile(core_yaml_file_path, indent=2)
+ran_config = ConfigFile(ran_yaml_file_path)
 
 def update_core_configuration(sst, sd):
-    data = read_yaml(core_yaml_file_path)
-    # amf
-    # add an additional s_nssai value
-    if 'amf' in data:
-        for plmn in data['amf']['plmn_support']:
-            # check if the s_nssai list is correct and modify it if necessary
-            if 's_nssai' in plmn and {'sst': sst, 'sd': sd} not in plmn['s_nssai']:
-                plmn['s_nssai'].append({'sst': sst, 'sd': sd})
-
-    # save the modified data to the YAML file
-    with open(core_yaml_file_path, 'w') as file:
-        yaml.safe_dump(data, file, default_flow_style=False, indent=2)
-
-    # nssf
-    # add an additional s_nssai value
-    if 'nssf' in data:
-        for plmn in data['nssf']['sbi']['client']:
-            # check if the s_nssai list is correct and modify it if necessary
-            if 's_nssai' in plmn and {'sst': sst, 'sd': sd} not in plmn['s_nssai']:
-                plmn['s_nssai'].append({'sst': sst, 'sd': sd})
-
-    # save the modified data to the YAML file
-    with open(core_yaml_file_path, 'w') as file:
-        yaml.safe_dump(data, file, default_flow_style=False, indent=2)
-
+    with core_config.update() as data:
+        # amf
+        # add an additional s_nssai value
+        if 'amf' in data:
+            for plmn in data['amf']['plmn_support']:
+                # check if the s_nssai list is correct and modify it if necessary
+                if 's_nssai' in plmn and {'sst': sst, 'sd': sd} not in plmn['s_nssai']:
+                    plmn['s_nssai'].append({'sst': sst, 'sd': sd})
+
+        # nssf
+        # add an additional s_nssai value
+        if 'nssf' in data:
+            for plmn in data['nssf']['sbi']['client']:
+                # check if the s_nssai list is correct and modify it if necessary
+                if 's_nssai' in plmn and {'sst': sst, 'sd': sd} not in plmn['s_nssai']:
+                    plmn['s_nssai'].append({'sst': sst, 'sd': sd})
+
+    # the modified data is saved to the YAML file once, when the update ends
     return {'sst': sst, 'sd': sd}
 
 def update_ran_configuration(sst, sd):
-    data = read_yaml(ran_yaml_file_path)
-
-    # add an additional s_nssai value
-    new_slicing_entry = {'sst': sst, 'sd': sd}
-    if 'slicing' in data:
-        data['slicing'].append(new_slicing_entry)
-    else:
-        data['slicing'] = [new_slicing_entry]
-
-    # save the modified data to the YAML file
-    with open(ran_yaml_file_path, 'w') as file:
-        yaml.safe_dump(data, file, default_flow_style=False)
+    with ran_config.update() as data:
+        # add an additional s_nssai value
+        new_slicing_entry = {'sst': sst, 'sd': sd}
+        if 'slicing' in data:
+            data['slicing'].append(new_slicing_entry)
+        else:
+            data['slicing'] = [new_slicing_entry]
 
     return {'sst': sst, 'sd': sd}
 
 def delete_core_slice(sst, sd):
-    yaml_data = read_yaml(core_yaml_file_path)
-    if 'amf' in yaml_data and 'plmn_support' in yaml_data['amf']:
-        for plmn in yaml_data['amf']['plmn_support']:
-            if 's_nssai' in plmn:
-                # filter out s_nssai entries that match the target sst and sd values
-                plmn['s_nssai'] = [s_nssai for s_nssai in plmn['s_nssai'] 
-                                   if not (s_nssai.get('sst') == sst and s_nssai.get('sd') == sd)]
-    
-
-    write_yaml(core_yaml_file_path, yaml_data)
+    with core_config.update() as yaml_data:
+        if 'amf' in yaml_data and 'plmn_support' in yaml_data['amf']:
+            for plmn in yaml_data['amf']['plmn_support']:
+                if 's_nssai' in plmn:
+                    # filter out s_nssai entries that match the target sst and sd values
+                    plmn['s_nssai'] = [s_nssai for s_nssai in plmn['s_nssai']
+                                       if not (s_nssai.get('sst') == sst and s_nssai.get('sd') == sd)]
+
     return {'sst': sst, 'sd': sd}
 
 def delete_ran_slice(sst, sd):
-    data = read_yaml(ran_yaml_file_path)
-    slicing = data.get('slicing', [])
-
-    new_slicing = [slice_ for slice_ in slicing if not (slice_['sst'] == sst and slice_['sd'] == sd)]
-
-    if len(new_slicing) == len(slicing):
+    matches = lambda slice_: slice_['sst'] == sst and slice_['sd'] == sd
+    # an unknown slice leaves the file untouched
+    if not any(matches(slice_) for slice_ in ran_config.read().get('slicing', [])):
         return None
 
-    data['slicing'] = new_slicing
+    with ran_config.update() as data:
+        data['slicing'] = [slice_ for slice_ in data.get('slicing', []) if not matches(slice_)]
 
-    write_yaml(ran_yaml_file_path, data)
     return {'sst': sst, 'sd': sd}
 
 @slices_blueprint.route('/api/add-slice', methods=['POST'])
@@ -122,7 +234,7 @@ def delete_slice():
 
 @slices_blueprint.route('/api/get-slices', methods=['GET'])
 def get_slices():
-    data = read_yaml(core_yaml_file_path)
+    data = core_config.read()
     if 'amf' not in data or 'plmn_support' not in data['amf']:
         return jsonify({'error': 'AMF configuration or plmn_support not found'}), 400
 
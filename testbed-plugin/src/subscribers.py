@@ -1,24 +1,36 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
 from socket import socket
-from Open5GS import Open5GS
+from Open5GS import Open5GS, SUBSCRIBER_FIELDS
 import json
 import os
+import pymongo
+
+# Largest JSON array accepted by the bulk endpoints
+MAX_BULK_ITEMS = 10000
+
+# Documents per cursor batch of the streamed subscriber listing, and subscribers per chunk written
+STREAM_BATCH_SIZE = 1000
+STREAM_CHUNK_ENTRIES = 500
+
+# Dotted paths of the fields a subscriber update may change, by request field
+UPDATE_PATHS = {
+    'k': 'security.k',
+    'opc': 'security.opc',
+    'sst': 'slice.0.sst',
+    'apn': 'slice.0.session.0.name',
+    'qci': 'slice.0.session.0.qos.index',
+    'uplink-ambr-value': 'slice.0.session.0.ambr.uplink.value',
+    'uplink-ambr-unit': 'slice.0.session.0.ambr.uplink.unit',
+    'downlink-ambr-value': 'slice.0.session.0.ambr.downlink.value',
+    'downlink-ambr-unit': 'slice.0.session.0.ambr.downlink.unit',
+}
 
 # connect to the UDM MongoDB database
 Open5GS = Open5GS('127.0.0.1', 27017)
 
 subscribers_blueprint = Blueprint('subscribers', __name__)
 
-@subscribers_blueprint.route('/api/subscriber-provisioning', methods=['POST'])
-def provision_subscriber():
-
-    data = request.json
-    if not data:
-        return jsonify({"error": "Invalid request, JSON data required"}), 400
-
-    imsi = data.get('imsi')
-    if not imsi:
-        return jsonify({"error": "IMSI is required"}), 400
+def subscriber_document(data):
 
     # preparing the slice_data based on the incoming request
     slice_data = [{
@@ -44,7 +56,7 @@ def provision_subscriber():
     }]
 
     # preparing the subscriber data
-    sub_data = {
+    return {
         "imsi": data.get('imsi'),
         "subscribed_rau_tau_timer": 12,
         "network_access_mode": 0,
@@ -66,8 +78,24 @@ def provision_subscriber():
         "__v": 0
     }
 
+@subscribers_blueprint.route('/api/subscriber-provisioning', methods=['POST'])
+def provision_subscriber():
+
+    data = request.json
+    if not data:
+        return jsonify({"error": "Invalid request, JSON data required"}), 400
+
+    imsi = data.get('imsi')
+    if not imsi:
+        return jsonify({"error": "IMSI is required"}), 400
+
+    sub_data = subscriber_document(data)
+
     # add the new subscriber
-    Open5GS.AddSubscriber(sub_data)
+    try:
+        Open5GS.AddSubscriber(sub_data)
+    except pymongo.errors.DuplicateKeyError:
+        return jsonify({"error": f"Subscriber {imsi} already exists"}), 409
 
     return jsonify({"message": "Subscriber provisioned successfully"}), 200
 
@@ -82,34 +110,21 @@ def subscriber_update():
     if not imsi:
         return jsonify({"error": "IMSI is required"}), 400
 
-    sub_data = Open5GS.GetSubscriber(imsi)
-
-    # update the fields provided in the request
-    sub_data['imsi'] = imsi  
-    sub_data['security']['k'] = data.get('k', sub_data['security']['k'])
-    sub_data['security']['opc'] = data.get('opc', sub_data['security']['opc'])
-
-    sub_data['slice'][0]['sst'] = data.get('sst', sub_data['slice'][0]['sst'])
-    sub_data['slice'][0]['session'][0]['name'] = data.get('apn', sub_data['slice'][0]['session'][0]['name'])
-    sub_data['slice'][0]['session'][0]['qos']['index'] = data.get('qci',
-                                                                  sub_data['slice'][0]['session'][0]['qos']['index'])
-    sub_data['slice'][0]['session'][0]['ambr']['uplink']['value'] = data.get('uplink-ambr-value',
-                                                                             sub_data['slice'][0]['session'][0]['ambr'][
-                                                                                 'uplink']['value'])
-    sub_data['slice'][0]['session'][0]['ambr']['uplink']['unit'] = data.get('uplink-ambr-unit',
-                                                                            sub_data['slice'][0]['session'][0]['ambr'][
-                                                                                'uplink']['unit'])
-    sub_data['slice'][0]['session'][0]['ambr']['downlink']['value'] = data.get('downlink-ambr-value',
-                                                                               sub_data['slice'][0]['session'][0][
-                                                                                   'ambr']['downlink']['value'])
-    sub_data['slice'][0]['session'][0]['ambr']['downlink']['unit'] = data.get('downlink-ambr-unit',
-                                                                              sub_data['slice'][0]['session'][0][
-                                                                                  'ambr']['downlink']['unit'])
-
-    # update existing subscriber
-    Open5GS.UpdateSubscriber(imsi, sub_data)
-
-    return jsonify({"message": "Subscriber updated successfully"}), 200
+    # an optional version makes the update apply only to the subscriber as the client last read it
+    version = data.get('version')
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+        return jsonify({"error": "version must be an integer"}), 400
+
+    # set the fields provided in the request, in one round trip
+    values = {path: data[field] for field, path in UPDATE_PATHS.items() if field in data}
+    status, current = Open5GS.UpdateSubscriberFields(imsi, values, version)
+    if status == 404:
+        return jsonify({"error": f"Subscriber {imsi} not found"}), 404
+    if status == 409:
+        return jsonify({"error": f"Subscriber {imsi} was changed since version {version}",
+                        "version": current}), 409
+
+    return jsonify({"message": "Subscriber updated successfully", "version": current}), 200
 
 @subscribers_blueprint.route('/api/subscriber-delete', methods=['DELETE'])
 def delete_subscriber():
@@ -118,13 +133,83 @@ def delete_subscriber():
     Open5GS.DeleteSubscriber(imsi)
     return jsonify({"message": f"Subscriber {imsi} deleted successfully"}), 200
 
-@subscribers_blueprint.route('/api/subscribers', methods=['GET'])
-def get_subscribers():
-    
-    data = Open5GS.GetSubscribers()
-   
-    api_response = [
-    {
+def bulk_items():
+    # The JSON array of a bulk request, or an error response
+    items = request.get_json(force=True, silent=True)
+    if not isinstance(items, list) or not items:
+        return None, (jsonify({"error": "Invalid request, non-empty JSON array required"}), 400)
+    if len(items) > MAX_BULK_ITEMS:
+        return None, (jsonify({"error": f"At most {MAX_BULK_ITEMS} items per request"}), 400)
+    return items, None
+
+def bulk_response(imsis, errors):
+    # One result per item, in request order: errors holds a (status, detail) for the failed items
+    results = [{"imsi": imsi, "status": errors[i][0], "detail": errors[i][1]} if i in errors else
+               {"imsi": imsi, "status": 200, "detail": "OK"}
+               for i, imsi in enumerate(imsis)]
+    return jsonify({"status": "OK" if not errors else "partial", "applied": len(imsis) - len(errors),
+                    "failed": len(errors), "results": results}), 200
+
+@subscribers_blueprint.route('/api/subscriber-provisioning/bulk', methods=['POST'])
+def provision_subscribers():
+    # Body: JSON array of provisioning requests, inserted with one unordered insert_many
+
+    items, error = bulk_items()
+    if error:
+        return error
+
+    imsis = [item.get('imsi') if isinstance(item, dict) else None for item in items]
+    errors = {i: (400, "IMSI is required") for i, imsi in enumerate(imsis) if not imsi}
+    valid = [i for i in range(len(items)) if i not in errors]
+    if valid:
+        failed = Open5GS.AddSubscribers([subscriber_document(items[i]) for i in valid])
+        for n, (code, message) in failed.items():
+            errors[valid[n]] = (409, "Subscriber already exists") if code == 11000 else (500, message)
+
+    return bulk_response(imsis, errors)
+
+@subscribers_blueprint.route('/api/subscriber-update/bulk', methods=['POST'])
+def subscribers_update():
+    # Body: JSON array of update requests, applied as dotted $set updates in one unordered bulk_write
+
+    items, error = bulk_items()
+    if error:
+        return error
+
+    imsis = [item.get('imsi') if isinstance(item, dict) else None for item in items]
+    errors = {i: (400, "IMSI is required") for i, imsi in enumerate(imsis) if not imsi}
+    updates = [(imsis[i], {path: items[i][field] for field, path in UPDATE_PATHS.items() if field in items[i]})
+               for i in range(len(items)) if i not in errors]
+    if updates:
+        missing = Open5GS.UpdateSubscribers(updates)
+        for i, imsi in enumerate(imsis):
+            if i not in errors and str(imsi) in missing:
+                errors[i] = (404, "Subscriber not found")
+
+    return bulk_response(imsis, errors)
+
+@subscribers_blueprint.route('/api/subscriber-delete/bulk', methods=['DELETE'])
+def delete_subscribers():
+    # Body: JSON array of IMSIs (or of objects with an "imsi"), deleted with one delete_many
+
+    items, error = bulk_items()
+    if error:
+        return error
+
+    imsis = [item.get('imsi') if isinstance(item, dict) else item for item in items]
+    errors = {i: (400, "IMSI is required") for i, imsi in enumerate(imsis) if not imsi}
+    valid = [imsi for i, imsi in enumerate(imsis) if i not in errors]
+    if valid:
+        missing = Open5GS.DeleteSubscribers(valid)
+        for i, imsi in enumerate(imsis):
+            if i not in errors and str(imsi) in missing:
+                errors[i] = (404, "Subscriber not found")
+
+    return bulk_response(imsis, errors)
+
+def subscriber_entry(entry):
+    # The API view of a subscriber document projected with SUBSCRIBER_FIELDS
+    return {
         'imsi': entry['imsi'],
         'sst': entry['slice'][0]['sst'],
         'downlink': {
@@ -137,19 +222,47 @@ def get_subscribers():
         },
         'qos_index': entry['slice'][0]['session'][0]['qos']['index']
     }
-    for entry in data
-    ]
 
-    # convert the response to JSON
-    json_response = json.dumps(api_response, indent=2)
-                
-    return json_response, 200
+@subscribers_blueprint.route('/api/subscribers', methods=['GET'])
+def get_subscribers():
+    # Streams the subscribers in IMSI order as a compact JSON array, STREAM_CHUNK_ENTRIES at a time,
+    # so memory stays flat whatever the collection size. Optional paging: ?limit=N&after_imsi=<last
+    # IMSI of the previous page>
+
+    limit = request.args.get('limit')
+    if limit is not None:
+        if not limit.isdigit() or int(limit) == 0:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+        limit = int(limit)
+
+    cursor = Open5GS.IterSubscribers(SUBSCRIBER_FIELDS, request.args.get('after_imsi'), limit, STREAM_BATCH_SIZE)
+    # the first document is read before the response starts, so a database error is still a 500
+    first = next(cursor, None)
+
+    def generate():
+        if first is None:
+            yield '[]'
+            return
+        chunk = ['[', json.dumps(subscriber_entry(first), separators=(',', ':'))]
+        for entry in cursor:
+            chunk.append(',' + json.dumps(subscriber_entry(entry), separators=(',', ':')))
+            if len(chunk) >= STREAM_CHUNK_ENTRIES:
+                yield ''.join(chunk)
+                chunk = []
+        chunk.append(']')
+        yield ''.join(chunk)
+
+    return Response(generate(), mimetype='application/json')
 
 @subscribers_blueprint.route('/api/subscriber', methods=['GET'])
 def get_subscriber():
     
     imsi = request.args.get('imsi')
-    data = Open5GS.GetSubscriber(imsi)
+    if not imsi:
+        return jsonify({"error": "IMSI is required"}), 400
+    data = Open5GS.GetSubscriber(imsi, SUBSCRIBER_FIELDS)
+    if data is None:
+        return jsonify({"error": f"Subscriber {imsi} not found"}), 404
     
     api_response = {
     'imsi': data['imsi'],
@@ -162,7 +275,8 @@ def get_subscriber():
         'value': data['slice'][0]['session'][0]['ambr']['uplink']['value'],
         'unit': data['slice'][0]['session'][0]['ambr']['uplink']['unit']
     },
-    'qos_index': data['slice'][0]['session'][0]['qos']['index']
+    'qos_index': data['slice'][0]['session'][0]['qos']['index'],
+    'version': data.get('__v')
     }
 
     # convert the response to JSON
@@ -1,8 +1,10 @@
 from flask import Flask, jsonify
 from slices import slices_blueprint
 from subscribers import subscribers_blueprint
+from serving import add_health_routes
 
 app = Flask(__name__)
+add_health_routes(app)
 
 # register blueprints
 app.register_blueprint(slices_blueprint)
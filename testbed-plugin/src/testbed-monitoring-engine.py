@@ -6,6 +6,7 @@ import threading
 import random
 from flask import Flask, jsonify
 from datetime import datetime
+from serving import add_health_routes
 
 previous_values = {}
 
@@ -97,6 +98,7 @@ def update_cpe_data():
 
 
 app = Flask(__name__)
+add_health_routes(app)
 
 @app.route('/cpe-monitoring', methods=['GET'])
 def get_cpe_data():